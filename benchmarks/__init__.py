@@ -0,0 +1 @@
+"""Pubwatch benchmarks."""
@@ -0,0 +1,83 @@
+"""Micro-benchmark fact statement decoding.
+
+Compares the generic recursive `unwrap_cbor` with the single-pass
+decoder in `decode_helper`.
+
+```sh
+python -m benchmarks.decode --datums 5000
+```
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import cbor2
+
+from src.pubwatch import decode_helper
+
+PAIRS: list = ["ADA-USD", "ADA-EUR", "ADA-iUSD", "FACT-ADA", "SNEK-ADA", "iBTC-ADA"]
+
+
+def generate_datums(number: int, seed: int = 0) -> list[str]:
+    """Return hex-encoded fact statement datum."""
+    rng = random.Random(seed)
+    datums = []
+    for idx in range(number):
+        feed = f"CER/{rng.choice(PAIRS)}/3".encode()
+        value = cbor2.CBORTag(121, [rng.randint(1, 10**12), rng.randint(1, 10**6)])
+        datum = cbor2.CBORTag(
+            121,
+            [
+                cbor2.CBORTag(121, [feed, 1723186803981 + idx, value]),
+                rng.randbytes(28),
+            ],
+        )
+        datums.append(cbor2.dumps(datum).hex())
+    return datums
+
+
+async def unwrap_cbor_all(datums: list[str]) -> list:
+    """Decode datum using the generic unwrapper."""
+    res = []
+    for datum in datums:
+        unwrapped = await decode_helper.unwrap_cbor(
+            await decode_helper.process_cbor(datum), []
+        )
+        res.append(unwrapped[0])
+    return res
+
+
+def bench(datums: list[str], repeat: int) -> dict:
+    """Return the best time taken by each decoder."""
+    unwrap_times = []
+    decode_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        unwrapped = asyncio.run(unwrap_cbor_all(datums))
+        unwrap_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        decoded = decode_helper.decode_fact_statements(datums)
+        decode_times.append(time.perf_counter() - start)
+    assert decoded == unwrapped
+    return {"unwrap_cbor": min(unwrap_times), "decode_helper": min(decode_times)}
+
+
+def main():
+    """Primary entry point of this benchmark."""
+    parser = argparse.ArgumentParser(prog="benchmarks.decode")
+    parser.add_argument("--datums", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    res = bench(generate_datums(args.datums), args.repeat)
+    for name, seconds in res.items():
+        print(
+            f"{name:>14}: {seconds * 1000:8.2f}ms "
+            f"({seconds / args.datums * 1e6:.2f}us/datum)"
+        )
+    print(f"{'speed-up':>14}: {res['unwrap_cbor'] / res['decode_helper']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""End-to-end benchmark of a pubwatch run.
+
+Runs `pubwatch()` against local stand-ins for Kupo and the validator
+for a grid of scenarios and records the time taken by the whole run
+and by each of its stages. Results are written as JSON so that
+regressions can be tracked between commits.
+
+```sh
+python -m benchmarks.e2e --utxos 50 200 1000 --latency 0 0.01 --output e2e.json
+```
+"""
+
+# pylint: disable=R0913,R0914
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from typing import Callable, Final
+
+from src.pubwatch import kupo_helper, pubwatch, run_helper, timing_helper
+
+from . import stand_ins
+
+# Globals of pubwatch pointed at the stand-ins during a scenario.
+STAND_IN_GLOBALS: Final[list] = [
+    "KUPO_URL",
+    "FSP_POLICY",
+    "VALIDITY_TOKEN",
+    "VALIDATOR_URI",
+]
+
+
+async def run_scenario(
+    config: stand_ins.KupoConfig,
+    concurrency: int,
+    datum_cache: bool,
+    incremental: bool,
+    repeat: int,
+    timer_factory: Callable = timing_helper.StageTimer,
+    pending_ledger: bool = False,
+) -> dict:
+    """Run pubwatch `repeat` times against fresh stand-ins and return
+    the timings of every run. The first run starts with empty caches.
+    Each run is timed by a new timer from `timer_factory`.
+
+    The pending ledger is disabled by default so that every run
+    requests feeds from the validator.
+    """
+    kupo = await stand_ins.start_kupo(config)
+    validator = stand_ins.FakeValidator(latency=config.latency)
+    validator_uri = await validator.start()
+    previous_globals = {name: getattr(pubwatch, name) for name in STAND_IN_GLOBALS}
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        previous_tempdir = tempfile.tempdir
+        tempfile.tempdir = workdir
+        feeds_file = stand_ins.write_feeds_file(
+            os.path.join(workdir, "cer-feeds.json"),
+            stand_ins.feed_pairs(config.feeds),
+        )
+        try:
+            pubwatch.KUPO_URL = stand_ins.kupo_url(kupo)
+            pubwatch.FSP_POLICY = stand_ins.FSP_POLICY
+            pubwatch.VALIDITY_TOKEN = stand_ins.VALIDITY_TOKEN
+            pubwatch.VALIDATOR_URI = validator_uri
+            for _ in range(repeat):
+                kupo.app[stand_ins.REQUESTS].clear()
+                with timing_helper.timing(timer_factory()) as timer:
+                    await pubwatch.pubwatch(
+                        run_helper.RunConfig(
+                            feeds_file=feeds_file,
+                            local=True,
+                            nopublish=False,
+                            hour_boundary=True,
+                            concurrency=concurrency,
+                            datum_cache=datum_cache,
+                            incremental=incremental,
+                            pending_ledger=pending_ledger,
+                        )
+                    )
+                runs.append(
+                    {
+                        "stages": timer.stages,
+                        "kupo_requests": dict(kupo.app[stand_ins.REQUESTS]),
+                    }
+                )
+        finally:
+            tempfile.tempdir = previous_tempdir
+            for name, value in previous_globals.items():
+                setattr(pubwatch, name, value)
+            await kupo.close()
+            await validator.close()
+    return {
+        "params": {
+            "utxos": config.utxos,
+            "feeds": config.feeds,
+            "payload_size": config.payload_size,
+            "latency": config.latency,
+            "resolve_hashes": config.resolve_hashes,
+            "concurrency": concurrency,
+            "datum_cache": datum_cache,
+            "incremental": incremental,
+        },
+        "runs": runs,
+        "validator_requests": len(validator.requests),
+    }
+
+
+def get_revision() -> str:
+    """Return the git revision being benchmarked, if known."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize(result: dict) -> str:
+    """Return a one line summary of a scenario."""
+    params = result["params"]
+    runs = " / ".join(f"{run['stages']['run'] * 1000:.1f}ms" for run in result["runs"])
+    return (
+        f"utxos={params['utxos']} latency={params['latency']} "
+        f"payload={params['payload_size']} resolve={params['resolve_hashes']} "
+        f"cache={params['datum_cache']} incremental={params['incremental']}: {runs}"
+    )
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """Run every scenario in the grid."""
+    results = []
+    for utxos, latency, payload_size, resolve_hashes in itertools.product(
+        args.utxos, args.latency, args.payload_size, args.resolve_hashes
+    ):
+        config = stand_ins.KupoConfig(
+            utxos=utxos,
+            feeds=args.feeds,
+            payload_size=payload_size,
+            latency=latency,
+            resolve_hashes=resolve_hashes,
+        )
+        result = await run_scenario(
+            config,
+            concurrency=args.concurrency,
+            datum_cache=not args.no_datum_cache,
+            incremental=args.incremental,
+            repeat=args.repeat,
+        )
+        print(summarize(result))
+        results.append(result)
+    return {
+        "revision": get_revision(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": results,
+    }
+
+
+def main():
+    """Primary entry point of this benchmark."""
+    parser = argparse.ArgumentParser(prog="benchmarks.e2e")
+    parser.add_argument("--utxos", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--feeds", type=int, default=20)
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0, 0.01])
+    parser.add_argument("--payload-size", type=int, nargs="+", default=[0])
+    parser.add_argument(
+        "--resolve-hashes",
+        type=lambda value: value.lower() in ("true", "1"),
+        nargs="+",
+        default=[False, True],
+    )
+    parser.add_argument("--concurrency", type=int, default=kupo_helper.KUPO_CONCURRENCY)
+    parser.add_argument("--no-datum-cache", action="store_true")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--output", default="e2e-benchmark.json")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    results = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as output:
+        output.write(json.dumps(results, indent=2))
+    print(f"results written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
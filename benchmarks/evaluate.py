@@ -0,0 +1,87 @@
+"""Scaling benchmark for staleness evaluation.
+
+Compares the per-feed `compare_hourly_intervals` and
+`compare_direct_intervals` with the vectorized evaluation in
+`evaluate_helper` for increasing numbers of feeds.
+
+```sh
+python -m benchmarks.evaluate
+```
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from src.pubwatch import evaluate_helper, pubwatch
+
+WINDOWS: list = [657, 3480, 3600, 7200, 86400]
+
+
+def generate_feeds(number: int, now: int, seed: int = 0) -> tuple[dict, dict]:
+    """Return latest timestamps and intervals for a number of feeds."""
+    rng = random.Random(seed)
+    latest = {}
+    intervals = {}
+    for idx in range(number):
+        feed = f"CER/FEED{idx}-ADA"
+        latest[feed] = now - rng.randint(0, 2 * 86400)
+        intervals[feed] = rng.choice(WINDOWS)
+    return latest, intervals
+
+
+def best_of(func, repeat: int) -> float:
+    """Return the fastest of several timed calls."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench(number: int, repeat: int, hour_boundary: bool) -> dict:
+    """Time both evaluations for a number of feeds."""
+    now = int(time.time())
+    latest, intervals = generate_feeds(number, now)
+    scalar = (
+        pubwatch.compare_hourly_intervals
+        if hour_boundary
+        else pubwatch.compare_direct_intervals
+    )
+    expected = asyncio.run(scalar(latest, now, intervals))
+    required, _ = evaluate_helper.evaluate(
+        latest, now, intervals, hour_boundary, pubwatch.INTERVAL_THRESHOLD
+    )
+    assert required == expected
+    return {
+        "scalar": best_of(lambda: asyncio.run(scalar(latest, now, intervals)), repeat),
+        "vectorized": best_of(
+            lambda: evaluate_helper.evaluate(
+                latest, now, intervals, hour_boundary, pubwatch.INTERVAL_THRESHOLD
+            ),
+            repeat,
+        ),
+    }
+
+
+def main():
+    """Primary entry point of this benchmark."""
+    parser = argparse.ArgumentParser(prog="benchmarks.evaluate")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    pubwatch.logger.disabled = True
+    print(f"{'mode':>7} {'feeds':>7} {'scalar':>11} {'vectorized':>11} {'speed-up':>9}")
+    for hour_boundary in (True, False):
+        for number in (10, 100, 1000, 10000, 100000):
+            res = bench(number, args.repeat, hour_boundary)
+            print(
+                f"{'hourly' if hour_boundary else 'direct':>7} {number:>7} "
+                f"{res['scalar'] * 1000:>9.2f}ms {res['vectorized'] * 1000:>9.2f}ms "
+                f"{res['scalar'] / res['vectorized']:>8.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Local stand-ins for Kupo and the Orcfax validator.
+
+The fake Kupo serves `/health`, `/matches` and `/datums` for a
+configurable number of unspent and spent fact statement UTxOs and
+datum payload size.
+The fake validator accepts requests on `validate_on_demand/` and
+acknowledges them. Both can inject latency into every response. The
+fake reference price source serves a fixed set of prices.
+"""
+
+# pylint: disable=E0401
+
+import asyncio
+import dataclasses
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+
+import cbor2
+import websockets
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+FSP_POLICY: str = "0690081bc113f74e04640ea78a87d88abbd2f18831c44c4064524230"
+VALIDITY_TOKEN: str = "000de140"
+FS_POLICY: str = "900d528f3c1864a1376db1afc065c9b293a2235f39b00a67455a6724"
+
+PAIRS: list = ["ADA-USD", "ADA-EUR", "ADA-IUSD", "FACT-ADA", "SNEK-ADA", "IBTC-ADA"]
+
+REQUESTS = web.AppKey("requests", Counter)
+
+# Paths and queries of the `/matches` requests received, in order.
+QUERIES = web.AppKey("queries", list)
+
+# Fork of the chain served, changing it rolls back every block.
+CHAIN = web.AppKey("chain", dict)
+
+
+@dataclasses.dataclass
+class KupoConfig:
+    """Configuration of the fake Kupo."""
+
+    utxos: int = 200
+    spent: int = 0
+    feeds: int = 20
+    payload_size: int = 0
+    latency: float = 0.0
+    resolve_hashes: bool = True
+    seed: int = 0
+
+
+def write_feeds_file(path: str, pairs: list[str], interval: int = 3600) -> str:
+    """Write a cer-feeds style feeds file for the given pairs."""
+    feeds = {
+        "meta": {"description": "benchmark feeds", "version": "0.0.0"},
+        "feeds": [
+            {
+                "pair": pair,
+                "label": pair,
+                "interval": interval,
+                "deviation": 1,
+                "source": "cex",
+                "calculation": "median",
+                "status": "showcase",
+                "type": "CER",
+            }
+            for pair in pairs
+        ],
+    }
+    with open(path, "w", encoding="utf-8") as feeds_file:
+        feeds_file.write(json.dumps(feeds))
+    return path
+
+
+def feed_pairs(number: int) -> list[str]:
+    """Return a number of distinct pairs."""
+    pairs = list(PAIRS)
+    idx = 0
+    while len(pairs) < number:
+        pairs.append(f"FEED{idx}-ADA")
+        idx += 1
+    return pairs[:number]
+
+
+def fact_statement_datum(
+    feed: str, timestamp: int, value: list, payload_size: int = 0
+) -> str:
+    """Return hex-encoded CBOR in the shape of a fact statement datum,
+    padded with an identifier of `payload_size` bytes.
+    """
+    datum = cbor2.CBORTag(
+        121,
+        [
+            cbor2.CBORTag(121, [feed.encode(), timestamp, cbor2.CBORTag(121, value)]),
+            b"\x00" * payload_size,
+        ],
+    )
+    return cbor2.dumps(datum).hex()
+
+
+def generate_utxos(config: KupoConfig, now: int) -> list[dict]:
+    """Return fact statement UTxOs as Kupo matches with their datum,
+    most recent first. Publications are spread over the last few hours
+    so that some feeds are out of date. Spent UTxOs were created and
+    spent over an hour ago.
+    """
+    rng = random.Random(config.seed)
+    pairs = feed_pairs(config.feeds)
+    utxos = []
+    for idx in range(config.utxos + config.spent):
+        pair = pairs[idx % len(pairs)]
+        spent = idx >= config.utxos
+        if spent:
+            timestamp = (now - rng.randint(2 * 3600, 3 * 3600)) * 1000
+        else:
+            timestamp = (now - rng.randint(0, 3 * 3600)) * 1000
+        datum = fact_statement_datum(
+            f"CER/{pair}/3",
+            timestamp,
+            [rng.randint(1, 10**9), rng.randint(1, 10**6)],
+            config.payload_size,
+        )
+        utxos.append(
+            {
+                "transaction_id": hashlib.sha256(idx.to_bytes(8, "big")).hexdigest(),
+                "output_index": 0,
+                "datum_hash": hashlib.blake2b(
+                    bytes.fromhex(datum), digest_size=32
+                ).hexdigest(),
+                "datum": datum,
+                "created_at": {"slot_no": timestamp // 1000, "header_hash": ""},
+                "spent_at": (
+                    {"slot_no": timestamp // 1000 + 600, "header_hash": ""}
+                    if spent
+                    else None
+                ),
+            }
+        )
+    utxos.sort(key=lambda utxo: utxo["created_at"]["slot_no"], reverse=True)
+    return utxos
+
+
+def make_kupo_app(config: KupoConfig, now: int = None) -> web.Application:
+    """Create a fake Kupo app. Requests are counted per endpoint in
+    `app[REQUESTS]`, along with the matches returned, and the queries
+    of `/matches` requests are kept in `app[QUERIES]`. Every slot has a
+    block whose header hash depends on `app[CHAIN]["fork"]`.
+    """
+    now = now if now else int(time.time())
+    utxos = generate_utxos(config, now)
+    fsp_datum = cbor2.dumps(bytes.fromhex(FS_POLICY)).hex()
+    fsp_hash = hashlib.blake2b(bytes.fromhex(fsp_datum), digest_size=32).hexdigest()
+    datums = {utxo["datum_hash"]: utxo["datum"] for utxo in utxos}
+    datums[fsp_hash] = fsp_datum
+    checkpoint = {"slot": now}
+
+    def as_match(utxo: dict, resolve: bool) -> dict:
+        match = {key: value for key, value in utxo.items() if key != "datum"}
+        if resolve:
+            match["datum"] = utxo["datum"]
+        return match
+
+    async def health(request):
+        request.app[REQUESTS]["health"] += 1
+        await asyncio.sleep(config.latency)
+        checkpoint["slot"] += 1
+        return web.json_response(
+            {}, headers={"X-Most-Recent-Checkpoint": str(checkpoint["slot"])}
+        )
+
+    def is_match(utxo: dict, query) -> bool:
+        if "unspent" in query and utxo["spent_at"]:
+            return False
+        if "spent_after" in query:
+            spent_at = utxo["spent_at"]
+            return bool(spent_at) and spent_at["slot_no"] > int(query["spent_after"])
+        return utxo["created_at"]["slot_no"] > int(query.get("created_after", 0))
+
+    async def matches(request):
+        request.app[REQUESTS]["matches"] += 1
+        request.app[QUERIES].append(request.path_qs)
+        await asyncio.sleep(config.latency)
+        resolve = "resolve_hashes" in request.query
+        if resolve and not config.resolve_hashes:
+            raise web.HTTPBadRequest()
+        if request.match_info["pattern"] == "*":
+            return web.json_response(
+                [
+                    {
+                        "transaction_id": "f" * 64,
+                        "output_index": 0,
+                        "datum_hash": fsp_hash,
+                        "datum": fsp_datum if resolve else None,
+                    }
+                ]
+            )
+        # Write matches as they are serialized, like Kupo, rather than
+        # building the whole response in memory.
+        resp = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await resp.prepare(request)
+        sep = "["
+        for utxo in utxos:
+            if is_match(utxo, request.query):
+                request.app[REQUESTS]["matched"] += 1
+                await resp.write(f"{sep}{json.dumps(as_match(utxo, resolve))}".encode())
+                sep = ","
+        await resp.write(b"[]" if sep == "[" else b"]")
+        await resp.write_eof()
+        return resp
+
+    async def checkpoints(request):
+        request.app[REQUESTS]["checkpoints"] += 1
+        slot = int(request.match_info["slot"])
+        header = f"{request.app[CHAIN]['fork']}:{slot}".encode()
+        return web.json_response(
+            {
+                "slot_no": slot,
+                "header_hash": hashlib.blake2b(header, digest_size=32).hexdigest(),
+            }
+        )
+
+    async def datum(request):
+        request.app[REQUESTS]["datums"] += 1
+        await asyncio.sleep(config.latency)
+        return web.json_response({"datum": datums[request.match_info["hash"]]})
+
+    app = web.Application()
+    app[REQUESTS] = Counter()
+    app[QUERIES] = []
+    app[CHAIN] = {"fork": 0}
+    app.router.add_get("/health", health)
+    app.router.add_get("/checkpoints/{slot}", checkpoints)
+    app.router.add_get("/matches/{pattern}", matches)
+    app.router.add_get("/datums/{hash}", datum)
+    return app
+
+
+async def start_kupo(config: KupoConfig, now: int = None) -> TestServer:
+    """Start a fake Kupo server. Its URL is `str(server.make_url(""))`."""
+    server = TestServer(make_kupo_app(config, now), access_log=None)
+    await server.start_server()
+    return server
+
+
+def kupo_url(server: TestServer) -> str:
+    """Return the base URL of a fake Kupo server."""
+    return str(server.make_url("")).rstrip("/")
+
+
+async def start_reference(prices: dict) -> TestServer:
+    """Start a fake reference price source serving `prices` on
+    `/prices`. Requests are counted in `app[REQUESTS]`.
+    """
+
+    async def get_prices(request):
+        request.app[REQUESTS]["prices"] += 1
+        return web.json_response(prices)
+
+    app = web.Application()
+    app[REQUESTS] = Counter()
+    app[QUERIES] = []
+    app.router.add_get("/prices", get_prices)
+    server = TestServer(app, access_log=None)
+    await server.start_server()
+    return server
+
+
+class FakeValidator:
+    """Fake validator websocket acknowledging every request."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = []
+        self.connections = 0
+        self._server = None
+
+    async def _handler(self, websocket, *_):
+        self.connections += 1
+        async for msg in websocket:
+            await asyncio.sleep(self.latency)
+            self.requests.append(json.loads(msg))
+            await websocket.send(json.dumps({"ack": "ok"}))
+
+    async def start(self) -> str:
+        """Start the validator and return its base URI."""
+        self._server = await websockets.serve(self._handler, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"ws://127.0.0.1:{port}/"
+
+    async def close(self):
+        """Stop the validator."""
+        self._server.close()
+        await self._server.wait_closed()
@@ -0,0 +1,75 @@
+"""Benchmark the time taken to import pubwatch.
+
+pubwatch is run from cron so the cost of importing it is paid on every
+run. Importing the module is measured with `python -X importtime` in a
+fresh interpreter, excluding packages that are imported regardless,
+e.g. by the interpreter's own startup.
+
+```sh
+python -m benchmarks.startup --repeat 5 --budget 0.25
+```
+"""
+
+import argparse
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+MODULE: str = "src.pubwatch.pubwatch"
+
+# Packages imported before pubwatch's own imports are counted.
+REQUIRED: tuple = ("asyncio",)
+
+ROOT: pathlib.Path = pathlib.Path(__file__).parent.parent
+
+
+def import_times(cwd: str, module: str = MODULE) -> dict:
+    """Import a module in a fresh interpreter and return the cumulative
+    import time of each top-level import in microseconds.
+    """
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+        text=True,
+    )
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, package = line.split("|")
+        times.setdefault(package.strip(), 0)
+        times[package.strip()] = max(times[package.strip()], int(cumulative))
+    return times
+
+
+def own_import_time(times: dict, module: str = MODULE) -> float:
+    """Return the time taken to import a module, less the packages it
+    requires anyway, in seconds.
+    """
+    return (times[module] - sum(times.get(pkg, 0) for pkg in REQUIRED)) / 1e6
+
+
+def main():
+    """Primary entry point of this benchmark."""
+    parser = argparse.ArgumentParser(prog="benchmarks.startup")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=None)
+    args = parser.parse_args()
+    seconds = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(args.repeat):
+            seconds.append(own_import_time(import_times(cwd)))
+    best = min(seconds)
+    print(f"import {MODULE}: {best * 1000:.1f}ms (best of {args.repeat})")
+    if args.budget is not None and best > args.budget:
+        print(f"over budget: {args.budget * 1000:.1f}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Helpers for archiving the feed data observed on-chain.
+
+Every observation seen by a run is appended to a local SQLite archive
+so that questions about a feed's history, e.g. how many gaps it had in
+the last week, can be answered without querying Kupo. Observations
+newer than those already archived are buffered as they are seen and
+written in a single transaction at the end of a run. The archive uses
+write-ahead logging so that it can be queried while a run is writing
+to it.
+"""
+
+# pylint: disable=R0913,R0914
+
+import dataclasses
+import logging
+import os
+import sqlite3
+from typing import Final, Iterable, Optional
+
+from . import state_helper
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE: Final[str] = "pubwatch_archive.sqlite"
+
+
+@dataclasses.dataclass(frozen=True)
+class FeedStats:
+    """Publication statistics of a feed over a window. Times are in
+    seconds.
+    """
+
+    feed_id: str
+    observations: int
+    gaps: list
+    gap_seconds: int
+    max_age: int
+    staleness: float
+
+
+class ObservationArchive:
+    """Archive of on-chain observations keyed by feed ID and time."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS observations (
+                feed_id TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                num INTEGER NOT NULL,
+                den INTEGER NOT NULL,
+                PRIMARY KEY (feed_id, timestamp)
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS observations_timestamp ON observations (timestamp)"
+        )
+        self._conn.commit()
+        self._latest = dict(
+            self._conn.execute(
+                "SELECT feed_id, MAX(timestamp) FROM observations GROUP BY feed_id"
+            ).fetchall()
+        )
+        self._pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, on_chain_feed_data: Iterable) -> None:
+        """Buffer observations newer than those already archived."""
+        latest = self._latest
+        for item in on_chain_feed_data:
+            observation = state_helper.as_observation(item)
+            archived = latest.get(observation.feed_id)
+            if archived is not None and observation.timestamp <= archived:
+                continue
+            self._pending[(observation.feed_id, observation.timestamp)] = (
+                observation.num,
+                observation.den,
+            )
+
+    def flush(self) -> int:
+        """Write buffered observations in a single transaction and
+        return how many were written.
+        """
+        if not self._pending:
+            return 0
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO observations VALUES (?, ?, ?, ?)",
+                [
+                    (feed_id, timestamp, num, den)
+                    for (feed_id, timestamp), (num, den) in self._pending.items()
+                ],
+            )
+        for feed_id, timestamp in self._pending:
+            archived = self._latest.get(feed_id)
+            if archived is None or timestamp > archived:
+                self._latest[feed_id] = timestamp
+        written = len(self._pending)
+        self._pending = {}
+        logger.info("archived observations: %s", written)
+        return written
+
+    def feeds(self) -> list:
+        """Return the IDs of archived feeds."""
+        return sorted(self._latest)
+
+    def timestamps(self, feed_id: str, start: int, end: int) -> list:
+        """Return the on-chain times of a feed within a window, and the
+        last before it, in seconds.
+        """
+        previous = self._conn.execute(
+            """SELECT MAX(timestamp) FROM observations
+            WHERE feed_id = ? AND timestamp < ?""",
+            (feed_id, start * 1000),
+        ).fetchone()[0]
+        rows = self._conn.execute(
+            """SELECT timestamp FROM observations
+            WHERE feed_id = ? AND timestamp >= ? AND timestamp <= ?
+            ORDER BY timestamp""",
+            (feed_id, start * 1000, end * 1000),
+        ).fetchall()
+        timestamps = [row[0] // 1000 for row in rows]
+        if previous is not None:
+            timestamps.insert(0, previous // 1000)
+        return timestamps
+
+    def history(self, end: Optional[int] = None) -> dict:
+        """Return the sorted on-chain times of every feed up to `end`
+        in seconds.
+        """
+        history = {}
+        for feed_id, timestamp in self._conn.execute(
+            """SELECT feed_id, timestamp FROM observations
+            WHERE timestamp <= ? ORDER BY feed_id, timestamp""",
+            (end * 1000 if end is not None else 2**62,),
+        ):
+            history.setdefault(feed_id, []).append(timestamp // 1000)
+        return history
+
+    def stats(
+        self, feed_id: str, start: int, end: int, interval: int, threshold: int = 0
+    ) -> FeedStats:
+        """Return the publication statistics of a feed between `start`
+        and `end`.
+
+        A gap is any period within the window longer than `interval`
+        plus `threshold` without a new observation. Staleness is the
+        proportion of the window a feed was older than its interval.
+        """
+        timestamps = self.timestamps(feed_id, start, end)
+        observations = len([ts for ts in timestamps if ts >= start])
+        gaps = []
+        gap_seconds = 0
+        max_age = 0
+        stale = 0
+        bounds = (timestamps if timestamps else [start]) + [end]
+        for previous, current in zip(bounds, bounds[1:]):
+            age = current - previous
+            max_age = max(max_age, age)
+            if age > interval:
+                stale += min(age - interval, current - max(start, previous))
+            if age > interval + threshold:
+                gap_start = max(start, previous + interval + threshold)
+                if gap_start < current:
+                    gaps.append((gap_start, current))
+                    gap_seconds += current - gap_start
+        window = max(1, end - start)
+        return FeedStats(
+            feed_id=feed_id,
+            observations=observations,
+            gaps=gaps,
+            gap_seconds=gap_seconds,
+            max_age=max_age,
+            staleness=min(1.0, max(0, stale) / window),
+        )
+
+    def all_stats(
+        self, start: int, end: int, intervals: dict, threshold: int = 0
+    ) -> dict:
+        """Return the statistics of every feed with an interval between
+        `start` and `end` by feed ID.
+        """
+        return {
+            feed_id: self.stats(feed_id, start, end, interval, threshold)
+            for feed_id, interval in sorted(intervals.items())
+        }
+
+    def close(self) -> None:
+        """Close the archive, discarding anything not flushed."""
+        self._conn.close()
+
+
+def default_archive_path(directory: str, filename: str = ARCHIVE_FILE) -> str:
+    """Return the location of an archive in the given directory."""
+    return os.path.join(directory, filename)
+
+
+def open_archive(
+    directory: Optional[str], filename: str = ARCHIVE_FILE
+) -> Optional[ObservationArchive]:
+    """Return the archive in `directory`, or `None` if archiving is
+    disabled.
+    """
+    if not directory:
+        return None
+    return ObservationArchive(default_archive_path(directory, filename))
@@ -0,0 +1,212 @@
+"""Helpers for caching decoded datum between runs.
+
+A datum hash always resolves to the same datum so decoded datum can be
+cached indefinitely by hash. The cache is a SQLite database on disk
+fronted by an in-memory LRU.
+
+The fact statement policy resolved from a Fact Statement Pointer is
+cached separately against the pointer's UTxO and datum hash so that it
+only needs resolving again when the pointer moves.
+"""
+
+# pylint: disable=R0902
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Final, Optional
+
+logger = logging.getLogger(__name__)
+
+DATUM_CACHE_FILE: Final[str] = "pubwatch_datum_cache.sqlite"
+POLICY_CACHE_FILE: Final[str] = "pubwatch_policy_cache.json"
+
+# Defaults for cache eviction.
+MEMORY_MAX_ENTRIES: Final[int] = 1024
+DISK_MAX_ENTRIES: Final[int] = 10000
+DISK_MAX_AGE: Final[int] = 7 * 24 * 60 * 60
+
+
+def default_cache_path() -> str:
+    """Return the default location of the datum cache."""
+    return os.path.join(tempfile.gettempdir(), DATUM_CACHE_FILE)
+
+
+def default_policy_cache_path() -> str:
+    """Return the default location of the policy cache."""
+    return os.path.join(tempfile.gettempdir(), POLICY_CACHE_FILE)
+
+
+class DatumCache:
+    """Content-addressed cache of decoded datum keyed by datum hash."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        memory_max_entries: int = MEMORY_MAX_ENTRIES,
+        disk_max_entries: int = DISK_MAX_ENTRIES,
+        disk_max_age: int = DISK_MAX_AGE,
+    ):
+        self.path = path if path else default_cache_path()
+        self.memory_max_entries = memory_max_entries
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_age = disk_max_age
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS datum (
+                datum_hash TEXT PRIMARY KEY,
+                datum TEXT NOT NULL,
+                created INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            )"""
+        )
+        self._used = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _remember(self, datum_hash: str, datum):
+        """Add an item to the in-memory LRU evicting the least recently
+        used item if we're full.
+        """
+        self._memory[datum_hash] = datum
+        self._memory.move_to_end(datum_hash)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, datum_hash: str):
+        """Return a cached datum or None if it isn't in the cache."""
+        try:
+            datum = self._memory[datum_hash]
+            self._memory.move_to_end(datum_hash)
+            self._used.add(datum_hash)
+            self.hits += 1
+            return datum
+        except KeyError:
+            pass
+        row = self._conn.execute(
+            "SELECT datum FROM datum WHERE datum_hash = ?", (datum_hash,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        datum = json.loads(row[0])
+        self._remember(datum_hash, datum)
+        self._used.add(datum_hash)
+        self.hits += 1
+        return datum
+
+    def put(self, datum_hash: str, datum) -> None:
+        """Add a decoded datum to the cache."""
+        now = int(time.time())
+        self._remember(datum_hash, datum)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO datum VALUES (?, ?, ?, ?)",
+            (datum_hash, json.dumps(datum), now, now),
+        )
+
+    def evict(self) -> int:
+        """Evict entries unused for longer than the maximum age and the
+        least recently used entries beyond the maximum size. Returns
+        the number of entries evicted.
+        """
+        now = int(time.time())
+        cur = self._conn.execute(
+            "DELETE FROM datum WHERE last_used < ?", (now - self.disk_max_age,)
+        )
+        evicted = cur.rowcount
+        cur = self._conn.execute(
+            """DELETE FROM datum WHERE datum_hash NOT IN (
+                SELECT datum_hash FROM datum
+                ORDER BY last_used DESC, rowid DESC LIMIT ?
+            )""",
+            (self.disk_max_entries,),
+        )
+        return evicted + cur.rowcount
+
+    def flush(self) -> None:
+        """Record usage of the entries used this run, evict, and commit
+        to disk.
+        """
+        now = int(time.time())
+        self._conn.executemany(
+            "UPDATE datum SET last_used = ? WHERE datum_hash = ?",
+            [(now, datum_hash) for datum_hash in self._used],
+        )
+        self._used = set()
+        evicted = self.evict()
+        self._conn.commit()
+        logger.info(
+            "datum cache hits: %s, misses: %s, evicted: %s",
+            self.hits,
+            self.misses,
+            evicted,
+        )
+
+    def close(self) -> None:
+        """Flush and close the cache."""
+        self.flush()
+        self._conn.close()
+
+
+class PolicyCache:
+    """Fact statement policy IDs keyed by the Fact Statement Pointer
+    they were resolved from.
+
+    An entry is only valid while the pointer's validity token remains
+    in the same UTxO with the same datum.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path else default_policy_cache_path()
+        try:
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                self._policies = json.loads(cache_file.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._policies = {}
+
+    def peek(self, fsp: str) -> Optional[str]:
+        """Return the last policy ID cached for a pointer without
+        checking whether it is still valid.
+        """
+        entry = self._policies.get(fsp)
+        return entry["policy_id"] if entry else None
+
+    def get(self, fsp: str, output_reference: str, datum_hash: str) -> Optional[str]:
+        """Return the cached policy ID of a pointer if its UTxO and
+        datum haven't changed, otherwise None.
+        """
+        entry = self._policies.get(fsp)
+        if entry is None:
+            return None
+        if entry["output_reference"] != output_reference:
+            return None
+        if entry["datum_hash"] != datum_hash:
+            return None
+        return entry["policy_id"]
+
+    def put(
+        self, fsp: str, output_reference: str, datum_hash: str, policy_id: str
+    ) -> None:
+        """Cache the policy ID resolved from a pointer, replacing the
+        file atomically.
+        """
+        self._policies[fsp] = {
+            "output_reference": output_reference,
+            "datum_hash": datum_hash,
+            "policy_id": policy_id,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            cache_file.write(json.dumps(self._policies))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,159 @@
+"""Helpers for pubwatch's command line.
+
+The arguments pubwatch is run with are converted into the options of
+a run so that a single config is passed to a run or the daemon.
+"""
+
+import argparse
+
+from . import kupo_helper, run_helper, shard_helper
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser of pubwatch's command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="pubwatch",
+        description="inspects prices on-chain and looks for anything not posted at the top of the last hour and publishes it",
+        epilog="for more information visit https://orcfax.io",
+    )
+    parser.add_argument(
+        "--local",
+        help="run code locally without ssl",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--feeds",
+        help="feed data describing feeds being monitored (CER-feeds (JSON))",
+        required=False,
+    )
+    parser.add_argument(
+        "--targets",
+        help="targets file describing several policies, networks and feeds to monitor (JSON)",
+        required=False,
+    )
+    parser.add_argument(
+        "--nopublish",
+        help="provide a way of running this script's logic without publishing",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--hour-boundary",
+        help="use an hourly boundary for publication",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="maximum number of concurrent requests to make to Kupo",
+        required=False,
+        type=int,
+        default=kupo_helper.KUPO_CONCURRENCY,
+    )
+    parser.add_argument(
+        "--no-datum-cache",
+        help="fetch all datum from Kupo without using the local datum cache",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--incremental",
+        help="maintain a local index of UTxOs and only retrieve changes since the last run",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no-pending-ledger",
+        help="request feeds even if they were requested by an earlier run and are still pending",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        help="archive the feed data observed on-chain in a database in this directory",
+        required=False,
+    )
+    parser.add_argument(
+        "--reference",
+        help="URL or file of reference prices to request feeds that have deviated from (JSON)",
+        required=False,
+    )
+    parser.add_argument(
+        "--no-deadline",
+        help="let a run take as long as Kupo and the validator take to respond",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--log-format",
+        help="format of log records",
+        required=False,
+        choices=["text", "json"],
+        default="text",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        help="split feeds with other instances holding a lease in this shared directory",
+        required=False,
+    )
+    parser.add_argument(
+        "--instance-id",
+        help="ID of this instance when splitting feeds (default: hostname)",
+        required=False,
+    )
+    parser.add_argument(
+        "--shard-lease",
+        help="seconds this instance's lease lasts between runs when splitting feeds",
+        required=False,
+        type=int,
+        default=shard_helper.SHARD_LEASE,
+    )
+    parser.add_argument(
+        "--daemon",
+        help="run continuously, checking feeds as they fall due or new blocks arrive",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        help="seconds between checks for new blocks in daemon mode",
+        required=False,
+        type=int,
+        default=run_helper.DAEMON_POLL_INTERVAL,
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        help="write Prometheus metrics to this file at the end of a run",
+        required=False,
+    )
+    parser.add_argument(
+        "--metrics-port",
+        help="serve Prometheus metrics on this port in daemon mode",
+        required=False,
+        type=int,
+    )
+    return parser
+
+
+def get_run_config(args: argparse.Namespace) -> run_helper.RunConfig:
+    """Return the options of a run given on the command line."""
+    return run_helper.RunConfig(
+        feeds_file=args.feeds,
+        local=args.local,
+        nopublish=args.nopublish,
+        hour_boundary=args.hour_boundary,
+        concurrency=args.concurrency,
+        datum_cache=not args.no_datum_cache,
+        incremental=args.incremental,
+        pending_ledger=not args.no_pending_ledger,
+        archive_dir=args.archive_dir,
+        deadline=not args.no_deadline,
+        reference=args.reference,
+        shard_dir=args.shard_dir,
+        instance_id=args.instance_id,
+        shard_lease=args.shard_lease,
+        poll_interval=args.poll_interval,
+        metrics_port=args.metrics_port,
+        metrics_textfile=args.metrics_textfile,
+    )
@@ -0,0 +1,318 @@
+"""Run pubwatch continuously.
+
+Rather than checking every feed once per run, the daemon polls Kupo
+for new blocks and checks feeds as they fall due. The feed data, the
+schedule of feed deadlines and the connections to Kupo and the
+validator are kept between polls.
+
+```sh
+pubwatch --feeds cer-feeds.json --daemon --hour-boundary
+```
+"""
+
+# pylint: disable=R0902,C0415
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Final
+
+from . import (
+    archive_helper,
+    deviation_helper,
+    kupo_helper,
+    latency_helper,
+    ledger_helper,
+    metrics_helper,
+    pubwatch,
+    replica_helper,
+    run_helper,
+    scheduler_helper,
+    shard_helper,
+    state_helper,
+    target_helper,
+    timing_helper,
+    validator_helper,
+)
+
+logger = logging.getLogger(__name__)
+
+# Address the metrics endpoint is served on in daemon mode.
+METRICS_HOST: Final[str] = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+
+class Daemon:
+    """Feed data, pending requests and feed deadlines kept by the
+    daemon between polls of a target.
+    """
+
+    def __init__(
+        self,
+        context: run_helper.RunContext,
+        target: target_helper.Target,
+        validator: validator_helper.ValidatorClient,
+        metrics: metrics_helper.Metrics = None,
+    ):
+        config = context.config
+        self.context = context
+        self.target = target
+        self.validator = validator
+        self.metrics = metrics
+        self.intervals = pubwatch.load_intervals(target.feeds, config.hour_boundary)
+        self.checkpoint = None
+        self.feed_state = None
+        self.scheduler = scheduler_helper.FeedScheduler()
+        self.reference = deviation_helper.open_reference_source(target.reference)
+        self.ledger = None
+        if config.pending_ledger:
+            self.ledger = ledger_helper.PendingLedger(
+                pubwatch.get_ledger_path(target, context.shard)
+            )
+        self.tracker = latency_helper.LatencyTracker()
+        self.archive = archive_helper.open_archive(config.archive_dir)
+
+    def close(self) -> None:
+        """Close the ledger, latency tracker and archive."""
+        self.tracker.close()
+        if self.ledger is not None:
+            self.ledger.close()
+        if self.archive is not None:
+            self.archive.close()
+
+    def reload_feeds(self) -> bool:
+        """Reload the feeds file if it has changed, keeping the feeds
+        if it can't be read. Return whether the feeds have changed.
+        """
+        try:
+            intervals = pubwatch.load_intervals(
+                self.target.feeds, self.context.config.hour_boundary
+            )
+        except (OSError, ValueError, KeyError) as err:
+            logger.error("error reloading feeds file, keeping feeds: %s", err)
+            return False
+        if intervals is self.intervals:
+            return False
+        self.intervals = intervals
+        return True
+
+    def renew_lease(self) -> bool:
+        """Renew this instance's shard lease. Return whether the feeds
+        assigned to this instance have changed.
+        """
+        try:
+            return self.context.shard.heartbeat(int(time.time()))
+        except sqlite3.Error as err:
+            logger.error("error renewing shard lease: %s", err)
+        return False
+
+    async def refresh(self) -> bool:
+        """Retrieve the feed data again if Kupo has a new checkpoint.
+        Return whether it has.
+        """
+        import aiohttp
+
+        try:
+            checkpoint = await kupo_helper.get_checkpoint(
+                self.context.session, self.target.kupo_url
+            )
+            if checkpoint == self.checkpoint:
+                return False
+            on_chain_feed_data = await pubwatch.get_on_chain_feed_data(
+                self.context, checkpoint, self.target, self.archive
+            )
+            self.feed_state = pubwatch.get_feed_state(on_chain_feed_data)
+            if self.archive is not None:
+                with timing_helper.stage("archive"):
+                    self.archive.flush()
+            with timing_helper.stage("latency"):
+                pubwatch.track_latency(self.tracker, self.feed_state)
+            self.checkpoint = checkpoint
+            if self.context.cache is not None:
+                self.context.cache.flush()
+            return True
+        except (
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+            KeyError,
+            replica_helper.ReplicaError,
+        ) as err:
+            logger.error("error retrieving data from kupo: %s", err)
+        return False
+
+    def owned(self) -> tuple[dict, state_helper.FeedState]:
+        """Return the intervals and feed state of the feeds assigned to
+        this instance.
+        """
+        shard = self.context.shard
+        if shard is None or self.feed_state is None:
+            return self.intervals, self.feed_state
+        return shard.select(self.intervals), pubwatch.get_shard_feed_state(
+            shard, self.feed_state
+        )
+
+    async def get_deviated(self, feed_state: state_helper.FeedState) -> list:
+        """Return the pairs that have deviated from their reference
+        price, if there's a reference source.
+        """
+        if self.reference is None or feed_state is None:
+            return []
+        with timing_helper.stage("deviation"):
+            return await pubwatch.get_deviated_pairs(
+                self.context.session,
+                self.reference,
+                pubwatch.load_deviations(self.target.feeds),
+                feed_state,
+            )
+
+    def reschedule(
+        self,
+        intervals: dict,
+        feed_state: state_helper.FeedState,
+        pairs_requested: list,
+        now: int,
+    ) -> None:
+        """Schedule the next deadline of every feed, deferring those
+        requested or due by the interval threshold to give the validator
+        time to publish them.
+        """
+        self.scheduler.rebuild(
+            feed_state.latest_timestamps(),
+            intervals,
+            now,
+            self.context.config.hour_boundary,
+            pubwatch.INTERVAL_THRESHOLD,
+        )
+        feed_ids = pubwatch.get_pair_feed_ids(intervals)
+        self.scheduler.defer(
+            [feed_ids[pair] for pair in pairs_requested if pair in feed_ids],
+            now + pubwatch.INTERVAL_THRESHOLD,
+        )
+        self.scheduler.defer_due(now, pubwatch.INTERVAL_THRESHOLD)
+
+    async def poll(self) -> None:
+        """Check for new feed data and request the feeds that are
+        missing, out of date or have deviated, unless they have been
+        requested recently.
+        """
+        config = self.context.config
+        start = time.perf_counter()
+        new_data = self.reload_feeds()
+        if self.context.shard is not None and self.renew_lease():
+            new_data = True
+        if await self.refresh():
+            new_data = True
+        intervals, feed_state = self.owned()
+        deviated = await self.get_deviated(feed_state)
+        now = int(time.time())
+        deferred = {
+            feed_id.split("/", 1)[1] for feed_id in self.scheduler.deferred(now)
+        }
+        deviated = [pair for pair in deviated if pair not in deferred]
+        if feed_state is None or not (
+            new_data or self.scheduler.pop_due(now) or deviated
+        ):
+            return
+        with timing_helper.stage("comparison"):
+            pairs_to_request = [
+                pair
+                for pair in pubwatch.merge_pairs(
+                    await pubwatch.get_pairs_to_request(
+                        intervals, feed_state, config.hour_boundary
+                    ),
+                    deviated,
+                )
+                if pair not in deferred
+            ]
+        with timing_helper.stage("publish"):
+            await pubwatch.publish(
+                pairs_to_request,
+                config,
+                self.validator,
+                self.ledger,
+                intervals,
+                feed_state,
+                self.tracker,
+            )
+        self.reschedule(intervals, feed_state, pairs_to_request, now)
+        timing_helper.record("run", time.perf_counter() - start)
+        if self.metrics is not None and config.metrics_textfile:
+            self.metrics.write_textfile(config.metrics_textfile)
+
+    def next_poll(self) -> float:
+        """Return the seconds until the next poll, or until the next
+        feed falls due if that's sooner.
+        """
+        poll_interval = self.context.config.poll_interval
+        next_deadline = self.scheduler.next_deadline()
+        if next_deadline is None:
+            return poll_interval
+        return max(0, min(poll_interval, next_deadline - time.time()))
+
+
+async def pubwatch_daemon(
+    config: run_helper.RunConfig, metrics: metrics_helper.Metrics = None
+) -> None:
+    """Run pubwatch continuously.
+
+    Feeds are evaluated whenever Kupo reports a new checkpoint, the
+    feeds file changes, or the deadline of a feed is reached. Requested
+    feeds are deferred by the interval threshold to give the validator
+    time to publish them.
+
+    If metrics are provided they are served on the `metrics_port`
+    and/or written to the `metrics_textfile` of the config after every
+    evaluation.
+
+    With `reference` prices, feeds are also checked for deviation every
+    poll and requested as soon as they deviate.
+
+    With `shard_dir`, feeds are split between the instances holding a
+    lease there. The lease is renewed every poll and given up on exit
+    so that feeds are reassigned to the remaining instances.
+    """
+    if metrics is None:
+        await _pubwatch_daemon(config)
+        return
+    metrics_runner = None
+    if config.metrics_port is not None:
+        metrics_runner = await metrics_helper.start_server(
+            metrics, METRICS_HOST, config.metrics_port
+        )
+    try:
+        with timing_helper.timing(metrics):
+            await _pubwatch_daemon(config, metrics)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+async def _pubwatch_daemon(
+    config: run_helper.RunConfig, metrics: metrics_helper.Metrics = None
+) -> None:
+    """Main loop of the daemon."""
+    context = run_helper.open_context(
+        config, shard_helper.SHARD_DAEMON_POLLS * config.poll_interval
+    )
+    target = pubwatch.default_target(config.feeds_file, config.reference)
+    try:
+        async with kupo_helper.create_kupo_session(
+            concurrency=config.concurrency
+        ) as session, validator_helper.ValidatorClient(
+            pubwatch.VALIDATION_REQUEST_URI, config.local
+        ) as validator:
+            context.session = session
+            daemon = Daemon(context, target, validator, metrics)
+            try:
+                while True:
+                    await daemon.poll()
+                    await asyncio.sleep(daemon.next_poll())
+            finally:
+                daemon.close()
+    finally:
+        if context.shard is not None:
+            context.shard.leave()
+        context.close()
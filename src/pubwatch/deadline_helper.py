@@ -0,0 +1,152 @@
+"""Helpers for bounding how long a run takes.
+
+Each run has a deadline by which it must have made its decision, e.g.
+before the next hourly boundary less the interval threshold so that
+requested feeds can be published in time. The time remaining is spread
+across the stages still to run in proportion to their share so that a
+slow early stage can't use up the time of later ones.
+
+Like stage timing, the deadline is kept in the current context rather
+than threaded through every function. Stages run without a limit if no
+deadline is active.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Final, Optional
+
+# Relative share of the remaining time given to each stage, in order.
+STAGE_SHARES: Final[dict] = {
+    "slot": 1,
+    "policy": 1,
+    "matches": 6,
+    "reference": 1,
+    "publish": 2,
+}
+
+# Bounds of a run's budget in seconds.
+MAX_RUN_BUDGET: Final[int] = 600
+MIN_RUN_BUDGET: Final[int] = 60
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar(
+    "pubwatch_deadline", default=None
+)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage can't complete before the run's deadline."""
+
+
+def run_budget(now: float, hour_boundary: bool, threshold: int) -> float:
+    """Return the seconds a run starting at `now` has to complete.
+
+    With an hourly boundary the run must complete the threshold before
+    the next hour so that feeds it requests are published before the
+    boundary is next compared against.
+    """
+    budget = MAX_RUN_BUDGET
+    if hour_boundary:
+        next_hour = datetime.fromtimestamp(now).replace(
+            minute=0, second=0, microsecond=0
+        ) + timedelta(hours=1)
+        budget = min(budget, next_hour.timestamp() - threshold - now)
+    return max(MIN_RUN_BUDGET, budget)
+
+
+class Deadline:
+    """Time by which a run must complete."""
+
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Return the seconds left before the deadline."""
+        return max(0.0, self.expires - time.monotonic())
+
+    def budget(self, stage: str) -> float:
+        """Return the seconds a stage may take, i.e. its share of the
+        time remaining relative to the stages after it.
+        """
+        stages = list(STAGE_SHARES)
+        later = stages[stages.index(stage) :] if stage in STAGE_SHARES else []
+        total = sum(STAGE_SHARES[name] for name in later)
+        if not total:
+            return self.remaining()
+        return self.remaining() * STAGE_SHARES[stage] / total
+
+
+def get_deadline() -> Optional[Deadline]:
+    """Return the deadline active in the current context."""
+    return _current_deadline.get()
+
+
+@contextlib.contextmanager
+def deadline(run_deadline: Optional[Deadline]):
+    """Make a deadline active for the duration of the context. A
+    deadline of `None` disables it.
+    """
+    token = _current_deadline.set(run_deadline)
+    try:
+        yield run_deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+async def bounded(awaitable: Awaitable, stage: str):
+    """Await a stage within its budget, raising `DeadlineExceeded` if
+    it doesn't complete in time.
+    """
+    run_deadline = _current_deadline.get()
+    if run_deadline is None:
+        return await awaitable
+    budget = run_deadline.budget(stage)
+    try:
+        return await asyncio.wait_for(awaitable, budget)
+    except asyncio.TimeoutError as err:
+        raise DeadlineExceeded(
+            f"stage '{stage}' exceeded its budget of {budget:.1f}s"
+        ) from err
+
+
+_EXHAUSTED: Final = object()
+
+
+async def _next_item(items: AsyncIterator):
+    """Return the next item of an iterator or `_EXHAUSTED` if there
+    are none left.
+    """
+    async for item in items:
+        return item
+    return _EXHAUSTED
+
+
+async def until_deadline(items: AsyncIterator, stage: str) -> AsyncIterator:
+    """Yield items until the stage's budget runs out, then raise
+    `DeadlineExceeded` so that the caller knows items were left
+    unread.
+    """
+    run_deadline = _current_deadline.get()
+    expires = None
+    if run_deadline is not None:
+        expires = time.monotonic() + run_deadline.budget(stage)
+    try:
+        while True:
+            timeout = None
+            if expires is not None:
+                timeout = max(0.0, expires - time.monotonic())
+            try:
+                item = await asyncio.wait_for(_next_item(items), timeout)
+            except asyncio.TimeoutError as err:
+                raise DeadlineExceeded(
+                    f"stage '{stage}' exceeded its budget, items left unread"
+                ) from err
+            if item is _EXHAUSTED:
+                return
+            yield item
+    finally:
+        aclose = getattr(items, "aclose", None)
+        if aclose is not None:
+            await aclose()
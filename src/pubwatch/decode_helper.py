@@ -0,0 +1,168 @@
+"""Helpers for decoding fact statement datum.
+
+Fact statement datum are decoded in a single synchronous pass directly
+into compact observation records rather than generic nested lists.
+The datum has the shape:
+
+```cbor
+121([121([h'CER/ADA-USD/3', timestamp, 121([num, den])]), ...])
+```
+"""
+
+# pylint: disable=C0415
+
+from __future__ import annotations
+
+import binascii
+import logging
+import sys
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    import cbor2
+
+logger = logging.getLogger(__name__)
+
+
+class FeedObservation:
+    """A single on-chain observation of a feed.
+
+    Observations can be indexed like the unwrapped datum lists
+    `["CER/ADA-USD/3", timestamp, [num, den]]` used elsewhere in
+    pubwatch so that existing helpers continue to work.
+    """
+
+    __slots__ = (
+        "feed",
+        "feed_id",
+        "feed_type",
+        "pair",
+        "timestamp",
+        "num",
+        "den",
+    )
+
+    def __init__(self, feed: str, timestamp: int, num: int, den: int):
+        self.feed = feed
+        feed_type, pair = feed.rsplit("/", 1)[0].split("/", 1)
+        self.feed_type = sys.intern(feed_type.upper())
+        self.pair = sys.intern(pair.upper())
+        self.feed_id = sys.intern(f"{self.feed_type}/{self.pair}")
+        self.timestamp = timestamp
+        self.num = num
+        self.den = den
+
+    @classmethod
+    def from_datum(cls, datum: list):
+        """Create an observation from an unwrapped datum list."""
+        return cls(datum[0], datum[1], datum[2][0], datum[2][1])
+
+    def as_datum(self) -> list:
+        """Return the observation as an unwrapped datum list."""
+        return [self.feed, self.timestamp, [self.num, self.den]]
+
+    def __getitem__(self, idx: int):
+        return (self.feed, self.timestamp, [self.num, self.den])[idx]
+
+    def __len__(self):
+        return 3
+
+    def __eq__(self, other):
+        if isinstance(other, FeedObservation):
+            return self.as_datum() == other.as_datum()
+        if isinstance(other, list):
+            return self.as_datum() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return (
+            f"FeedObservation({self.feed!r}, {self.timestamp}, {self.num}, {self.den})"
+        )
+
+
+def unwrap(data: cbor2.CBORTag) -> list:
+    """Iteratively unwrap generic CBOR into nested lists.
+
+    Used for datum that don't have the expected fact statement shape.
+    """
+    import cbor2
+
+    unwrapped = []
+    stack = [(data, unwrapped)]
+    while stack:
+        tag, out = stack.pop()
+        if not isinstance(tag.value, list):
+            continue
+        for cbor_obj in tag.value:
+            if isinstance(cbor_obj, cbor2.CBORTag):
+                nested = []
+                out.append(nested)
+                stack.append((cbor_obj, nested))
+            elif isinstance(cbor_obj, bytes):
+                try:
+                    out.append(cbor_obj.decode())
+                except UnicodeDecodeError:
+                    out.append(binascii.hexlify(cbor_obj).decode())
+            else:
+                out.append(cbor_obj)
+    return unwrapped
+
+
+async def unwrap_cbor(data: cbor2.CBORTag, unwrapped: list) -> Union[list | dict]:
+    """Unwrap CBOR so that it renders to the API."""
+    import cbor2
+
+    if isinstance(data.value, dict):
+        return data.value
+    if not isinstance(data.value, list):
+        return unwrapped
+    for cbor_obj in data.value:
+        if isinstance(cbor_obj, cbor2.CBORTag):
+            nested = []
+            unwrapped.append(nested)
+            await unwrap_cbor(cbor_obj, nested)
+            continue
+        try:
+            unwrapped.append(cbor_obj.decode())
+        except AttributeError:
+            unwrapped.append(cbor_obj)
+        except UnicodeDecodeError:
+            unwrapped.append(binascii.hexlify(cbor_obj).decode())
+    return unwrapped
+
+
+async def process_cbor(data: str) -> dict:
+    """Process metadata CBOR and return a dict/json representation."""
+    import cbor2
+
+    dec = binascii.a2b_hex(data)
+    cbor_data = cbor2.loads(dec)
+    return cbor_data
+
+
+def _from_datum(datum: cbor2.CBORTag) -> FeedObservation:
+    """Return the observation in decoded fact statement datum."""
+    try:
+        feed, timestamp, value = datum.value[0].value
+        num, den = value.value
+        return FeedObservation(feed.decode(), timestamp, num, den)
+    except (AttributeError, TypeError, ValueError, IndexError):
+        logger.warning("unexpected fact statement shape, unwrapping: %s", datum)
+    return FeedObservation.from_datum(unwrap(datum)[0])
+
+
+def decode_fact_statement(datum_cbor: str) -> FeedObservation:
+    """Decode fact statement datum CBOR into an observation."""
+    import cbor2
+
+    return _from_datum(cbor2.loads(bytes.fromhex(datum_cbor)))
+
+
+def decode_fact_statements(datums_cbor: list[str]) -> list[FeedObservation]:
+    """Decode a batch of fact statement datum CBOR."""
+    import cbor2
+
+    return [
+        _from_datum(cbor2.loads(bytes.fromhex(datum_cbor)))
+        for datum_cbor in datums_cbor
+    ]
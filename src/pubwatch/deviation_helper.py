@@ -0,0 +1,121 @@
+"""Helpers for requesting feeds whose price has moved.
+
+The latest on-chain value of each feed, `[num, den]`, is compared with
+a reference price and feeds that have moved away from it by more than
+their `deviation`, a percentage, are requested between their scheduled
+publications. Reference prices for every feed are retrieved at once
+from a source, either a JSON file or an HTTP endpoint returning an
+object of prices keyed by pair, e.g.:
+
+```json
+{"ADA-USD": [4512, 10000], "FACT-ADA": "0.0431"}
+```
+
+Prices are compared exactly by cross-multiplying the rationals so that
+no precision is lost however large their numerators and denominators.
+"""
+
+# pylint: disable=R0903
+
+from __future__ import annotations
+
+import json
+import logging
+from fractions import Fraction
+from typing import TYPE_CHECKING, Final, Optional, Union
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Deviations are reported in basis points.
+BASIS_POINTS: Final[int] = 10000
+
+
+def parse_price(value: Union[list | str | int | float]) -> tuple[int, int]:
+    """Return a reference price as a `(num, den)` pair from a pair of
+    integers or a decimal.
+    """
+    if isinstance(value, list):
+        num, den = value
+        price = Fraction(int(num), int(den))
+    else:
+        price = Fraction(str(value))
+    return price.numerator, price.denominator
+
+
+def parse_prices(data: dict) -> dict:
+    """Return reference prices keyed by pair."""
+    if not isinstance(data, dict):
+        raise ValueError("reference prices must be an object keyed by pair")
+    return {pair.upper(): parse_price(value) for pair, value in data.items()}
+
+
+class FileReferenceSource:
+    """Reference prices read from a JSON file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def get_prices(  # pylint: disable=W0613
+        self, session: Optional[aiohttp.ClientSession]
+    ) -> dict:
+        """Return the reference prices in the file. The session is
+        unused and may be `None`.
+        """
+        with open(self.path, "r", encoding="utf-8") as prices_file:
+            return parse_prices(json.load(prices_file))
+
+
+class HttpReferenceSource:
+    """Reference prices retrieved from an HTTP endpoint."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    async def get_prices(self, session: aiohttp.ClientSession) -> dict:
+        """Return the reference prices served by the endpoint."""
+        async with session.get(self.url) as resp:
+            resp.raise_for_status()
+            return parse_prices(await resp.json(content_type=None))
+
+
+def open_reference_source(
+    location: Optional[str],
+) -> Optional[Union[FileReferenceSource | HttpReferenceSource]]:
+    """Return the reference source at a URL or path, or `None` if
+    deviation isn't checked.
+    """
+    if not location:
+        return None
+    if location.startswith(("http://", "https://")):
+        return HttpReferenceSource(location)
+    return FileReferenceSource(location)
+
+
+def get_deviated(latest: dict, reference: dict, deviations: dict) -> dict:
+    """Return the deviation in basis points of each feed that has moved
+    away from its reference price by more than its deviation, keyed by
+    pair.
+
+    `latest` is the latest on-chain observation of each feed and
+    `deviations` the percentage each may deviate by, both keyed by
+    feed ID. Feeds without an observation or reference price are
+    skipped.
+    """
+    deviated = {}
+    for feed_id, percent in deviations.items():
+        observation = latest.get(feed_id.upper())
+        if observation is None or not observation.den:
+            continue
+        price = reference.get(observation.pair)
+        if price is None or not price[0]:
+            continue
+        ref_num, ref_den = price
+        # |num/den - ref_num/ref_den| > percent/100 * |ref_num/ref_den|
+        difference = abs(observation.num * ref_den - ref_num * observation.den)
+        scale = abs(ref_num * observation.den)
+        if difference * 100 > percent * scale:
+            deviated[observation.pair] = difference * BASIS_POINTS // scale
+    return deviated
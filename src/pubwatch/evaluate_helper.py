@@ -0,0 +1,96 @@
+"""Helpers for evaluating feed staleness in bulk.
+
+The latest timestamps and windows of every monitored feed are compared
+with the current time in a single vectorized pass. The hourly boundary
+only depends on the current time and a feed's window, so it is
+calculated once per distinct window rather than once per feed.
+
+NumPy is imported when feeds are first evaluated rather than when this
+module is imported.
+"""
+
+# pylint: disable=C0415
+
+import logging
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Window used to mark feeds without an interval, i.e. the minimum
+# value of an int64.
+UNMONITORED: Final[int] = -(2**63)
+
+
+def previous_hour_timestamp(now: int, window: int) -> int:
+    """Return the hourly boundary a feed with the given window is
+    compared against, i.e. the start of the current hour less the
+    window beyond one hour.
+    """
+    now_dt = datetime.fromtimestamp(now)
+    prev_hour = now_dt.replace(second=0, microsecond=0, minute=0) - timedelta(
+        seconds=window - 3600
+    )
+    return int(prev_hour.timestamp())
+
+
+def due_hourly(
+    now: int, latest: "np.ndarray", windows: "np.ndarray", threshold: int
+) -> "np.ndarray":
+    """Return a mask of feeds whose latest publication, plus the
+    threshold, precedes their hourly boundary.
+    """
+    import numpy as np
+
+    unique_windows, inverse = np.unique(windows, return_inverse=True)
+    boundaries = np.array(
+        [previous_hour_timestamp(now, int(window)) for window in unique_windows],
+        dtype=np.int64,
+    )
+    return (latest + threshold) < boundaries[inverse]
+
+
+def due_direct(now: int, latest: "np.ndarray", windows: "np.ndarray") -> "np.ndarray":
+    """Return a mask of feeds whose age exceeds their window."""
+    import numpy as np
+
+    return windows < np.abs(now - latest)
+
+
+def evaluate(
+    latest_feed_timestamps: dict,
+    curr_time: int,
+    intervals: dict,
+    hour_boundary: bool,
+    threshold: int,
+) -> tuple[list, list]:
+    """Return the feeds that are due and the feeds that aren't being
+    monitored, both in the order of `latest_feed_timestamps`.
+    """
+    import numpy as np
+
+    feeds = list(latest_feed_timestamps)
+    if not feeds:
+        return [], []
+    latest = np.fromiter(
+        latest_feed_timestamps.values(), dtype=np.int64, count=len(feeds)
+    )
+    windows = np.fromiter(
+        (intervals.get(feed, UNMONITORED) for feed in feeds),
+        dtype=np.int64,
+        count=len(feeds),
+    )
+    monitored = windows != UNMONITORED
+    if hour_boundary:
+        due = due_hourly(curr_time, latest[monitored], windows[monitored], threshold)
+    else:
+        due = due_direct(curr_time, latest[monitored], windows[monitored])
+    mask = np.zeros(len(feeds), dtype=bool)
+    mask[monitored] = due
+    return (
+        [feeds[idx] for idx in np.flatnonzero(mask)],
+        [feeds[idx] for idx in np.flatnonzero(~monitored)],
+    )
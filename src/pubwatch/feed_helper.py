@@ -1,12 +1,23 @@
-"""Helpers for processing feed specification data."""
+"""Helpers for processing feed specification data.
 
-# pylint: disable=E0611,R0902
+Feeds files are validated in a single pass and compiled together with
+their interval maps. Compiled feeds are cached by path and reloaded
+only when the file's modification time and content hash change, so
+long-running processes pick up changes to the file automatically.
 
+Feeds are validated with pydantic, which is imported the first time a
+feeds file is validated rather than when this module is imported.
+"""
+
+# pylint: disable=E0611,R0902,R0903,C0415
+
+import functools
+import hashlib
 import json
 import logging
-
-from pydantic.dataclasses import dataclass
-from pydantic.tools import parse_obj_as
+import os
+from dataclasses import dataclass
+from typing import Final
 
 logger = logging.getLogger(__name__)
 
@@ -23,15 +34,113 @@ class FeedSpec:
     type: str = "CER"
 
 
+@functools.lru_cache(maxsize=1)
+def get_feeds_adapter():
+    """Return a validator for a whole list of feeds, built once."""
+    from pydantic import TypeAdapter
+
+    return TypeAdapter(list[FeedSpec])
+
+
+def get_intervals(feeds: list[FeedSpec], threshold: int = 0) -> dict:
+    """Return the interval of each feed, less the threshold, keyed by
+    feed ID. Feeds with a zero interval are not monitored.
+    """
+    return {
+        f"{feed.type}/{feed.pair}": feed.interval - threshold
+        for feed in feeds
+        if feed.interval != 0
+    }
+
+
+def get_deviations(feeds: list[FeedSpec]) -> dict:
+    """Return the deviation of each monitored feed, as a percentage,
+    keyed by feed ID. Feeds with a zero deviation are not checked for
+    deviation.
+    """
+    return {
+        f"{feed.type}/{feed.pair}": feed.deviation
+        for feed in feeds
+        if feed.interval != 0 and feed.deviation > 0
+    }
+
+
+class CompiledFeeds:
+    """Validated feeds and their interval and deviation maps."""
+
+    __slots__ = (
+        "feeds",
+        "version",
+        "hourly_intervals",
+        "direct_intervals",
+        "deviations",
+    )
+
+    def __init__(self, feeds: list[FeedSpec], version: str, threshold: int):
+        self.feeds = feeds
+        self.version = version
+        self.hourly_intervals = get_intervals(feeds)
+        self.direct_intervals = get_intervals(feeds, threshold)
+        self.deviations = get_deviations(feeds)
+
+    def intervals(self, hour_boundary: bool) -> dict:
+        """Return the interval map for the chosen boundary."""
+        if hour_boundary:
+            return self.hourly_intervals
+        return self.direct_intervals
+
+
+def parse_feeds(raw: bytes) -> tuple[list[FeedSpec], str]:
+    """Validate a feeds file and return its feeds and version."""
+    feed_dict = json.loads(raw)
+    feeds = get_feeds_adapter().validate_python(feed_dict["feeds"])
+    return feeds, feed_dict["meta"]["version"]
+
+
+class FeedsCache:
+    """Compiled feeds files keyed by path, modification time and
+    content hash.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def load(self, feeds_file: str, threshold: int) -> CompiledFeeds:
+        """Return the compiled feeds of a file, only reading the file if
+        its modification time has changed and only validating it if
+        its content has changed.
+        """
+        path = os.path.abspath(feeds_file)
+        stat = os.stat(path)
+        mtime = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get((path, threshold))
+        if entry is not None and entry[0] == mtime:
+            return entry[2]
+        with open(path, "rb") as json_feeds:
+            raw = json_feeds.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        if entry is not None and entry[1] == digest:
+            self._entries[(path, threshold)] = (mtime, digest, entry[2])
+            return entry[2]
+        feeds, version = parse_feeds(raw)
+        compiled = CompiledFeeds(feeds, version, threshold)
+        if entry is not None:
+            logger.info("feeds file changed, reloaded: %s", feeds_file)
+        logger.info("cer-feeds version: %s", version)
+        logger.info("number of feeds in feeds file: %s", len(feeds))
+        self._entries[(path, threshold)] = (mtime, digest, compiled)
+        return compiled
+
+
+# Feeds cache shared by the process.
+feeds_cache: Final[FeedsCache] = FeedsCache()  # pylint: disable=C0103
+
+
+def load_feeds(feeds_file: str, threshold: int) -> CompiledFeeds:
+    """Return the compiled feeds of a file from the process cache."""
+    return feeds_cache.load(feeds_file, threshold)
+
+
 async def read_feeds_file(feeds_file: str) -> list[FeedSpec]:
-    """ "Read feed data into memory for use in the script."""
-    feed_dict = None
-    with open(feeds_file, "r", encoding="utf-8") as json_feeds:
-        feed_dict = json.loads(json_feeds.read())
-    logger.info("cer-feeds version: %s", feed_dict["meta"]["version"])
-    logger.info("number of feeds in feeds file: %s", len(feed_dict["feeds"]))
-    feeds = []
-    for item in feed_dict["feeds"]:
-        feed = parse_obj_as(FeedSpec, item)
-        feeds.append(feed)
-    return feeds
+    """Read feed data into memory for use in the script."""
+    return load_feeds(feeds_file, 0).feeds
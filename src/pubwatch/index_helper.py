@@ -0,0 +1,212 @@
+"""Helpers for maintaining a local index of fact statement UTxOs.
+
+The index is updated incrementally from Kupo using the checkpoint of
+the previous run so that only UTxOs created or spent since then need
+to be retrieved. Changes within a few hundred slots of the checkpoint
+are re-applied on every run so that the index converges on the chain
+after a shallow rollback. The header hash of the checkpoint is stored
+too so that a deeper rollback, i.e. one that removes the checkpoint
+itself, can be detected and the index rebuilt.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from typing import Final, Optional
+
+logger = logging.getLogger(__name__)
+
+UTXO_INDEX_FILE: Final[str] = "pubwatch_utxo_index.sqlite"
+
+# Number of slots before the checkpoint re-applied on every run, about
+# 15 blocks at the active slot coefficient (0.05). Rollbacks deeper
+# than this remove the checkpoint and rebuild the index.
+ROLLBACK_WINDOW: Final[int] = 300
+
+
+def default_index_path() -> str:
+    """Return the default location of the UTxO index."""
+    return os.path.join(tempfile.gettempdir(), UTXO_INDEX_FILE)
+
+
+def get_output_reference(match: dict) -> str:
+    """Return a unique output reference for a Kupo match."""
+    return f"{match['output_index']}@{match['transaction_id']}"
+
+
+def get_spent_slot(match: dict) -> Optional[int]:
+    """Return the slot a Kupo match was spent in or None if it is
+    unspent.
+    """
+    if not match.get("spent_at"):
+        return None
+    return match["spent_at"]["slot_no"]
+
+
+class UtxoIndex:
+    """Persistent index of fact statement UTxOs and their datum."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path else default_index_path()
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS utxo (
+                output_reference TEXT PRIMARY KEY,
+                datum_hash TEXT NOT NULL,
+                created_slot INTEGER NOT NULL,
+                spent_slot INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS utxo_created ON utxo (created_slot);
+            CREATE INDEX IF NOT EXISTS utxo_spent ON utxo (spent_slot);
+            CREATE TABLE IF NOT EXISTS datum (
+                datum_hash TEXT PRIMARY KEY,
+                datum TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        """Return a value from the index metadata."""
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value) -> None:
+        """Set a value in the index metadata."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value))
+        )
+
+    def checkpoint(self, policy_id: str) -> int:
+        """Return the checkpoint the index is up-to-date with for the
+        given policy, or zero if the index needs to be built from
+        scratch.
+        """
+        if self._get_meta("policy_id") != policy_id:
+            return 0
+        if not self._get_meta("header_hash"):
+            # The checkpoint can't be checked for rollbacks.
+            return 0
+        return int(self._get_meta("checkpoint") or 0)
+
+    def header_hash(self, policy_id: str) -> Optional[str]:
+        """Return the header hash of the block at the checkpoint, or
+        None if the index needs to be built from scratch.
+        """
+        if not self.checkpoint(policy_id):
+            return None
+        return self._get_meta("header_hash")
+
+    def window_start(self, policy_id: str) -> int:
+        """Return the slot after which matches must be re-applied to
+        account for any shallow rollbacks since the last update.
+        """
+        return max(0, self.checkpoint(policy_id) - ROLLBACK_WINDOW)
+
+    def apply(  # pylint: disable=R0913
+        self,
+        policy_id: str,
+        window_start: int,
+        created: list[dict],
+        spent: list[dict],
+        checkpoint: int,
+        header_hash: str,
+    ) -> None:
+        """Apply Kupo matches created and spent after `window_start`
+        and record the new checkpoint, the slot of a block, and its
+        header hash.
+
+        Everything after `window_start` is dropped before the matches
+        are applied so that anything rolled back from the chain is
+        removed from the index. UTxOs spent before `window_start` can
+        no longer be rolled back and are pruned.
+        """
+        if self._get_meta("policy_id") != policy_id:
+            logger.info("building utxo index for policy: %s", policy_id)
+            self._conn.execute("DELETE FROM utxo")
+        self._conn.execute("DELETE FROM utxo WHERE created_slot > ?", (window_start,))
+        self._conn.execute(
+            "UPDATE utxo SET spent_slot = NULL WHERE spent_slot > ?", (window_start,)
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO utxo VALUES (?, ?, ?, ?)",
+            [
+                (
+                    get_output_reference(match),
+                    match["datum_hash"],
+                    match["created_at"]["slot_no"],
+                    get_spent_slot(match),
+                )
+                for match in created
+            ],
+        )
+        self._conn.executemany(
+            "UPDATE utxo SET spent_slot = ? WHERE output_reference = ?",
+            [(get_spent_slot(match), get_output_reference(match)) for match in spent],
+        )
+        self._conn.execute(
+            "DELETE FROM utxo WHERE spent_slot IS NOT NULL AND spent_slot <= ?",
+            (window_start,),
+        )
+        self._conn.execute(
+            "DELETE FROM datum WHERE datum_hash NOT IN (SELECT datum_hash FROM utxo)"
+        )
+        self._set_meta("policy_id", policy_id)
+        self._set_meta("checkpoint", checkpoint)
+        self._set_meta("header_hash", header_hash)
+        self._conn.commit()
+        logger.info(
+            "utxo index updated to checkpoint: %s (created: %s, spent: %s)",
+            checkpoint,
+            len(created),
+            len(spent),
+        )
+
+    def missing_datum(self) -> list[str]:
+        """Return the hashes of unspent UTxOs whose datum has not yet
+        been stored in the index.
+        """
+        rows = self._conn.execute(
+            """SELECT DISTINCT utxo.datum_hash FROM utxo
+            LEFT JOIN datum ON utxo.datum_hash = datum.datum_hash
+            WHERE utxo.spent_slot IS NULL AND datum.datum_hash IS NULL"""
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def add_datum(self, datum: dict) -> None:
+        """Store decoded datum keyed by datum hash."""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO datum VALUES (?, ?)",
+            [(datum_hash, json.dumps(value)) for datum_hash, value in datum.items()],
+        )
+        self._conn.commit()
+
+    def unspent_datum(self) -> list:
+        """Return the decoded datum of all unspent UTxOs, most recently
+        created first.
+        """
+        rows = self._conn.execute(
+            """SELECT datum.datum FROM utxo
+            JOIN datum ON utxo.datum_hash = datum.datum_hash
+            WHERE utxo.spent_slot IS NULL
+            ORDER BY utxo.created_slot DESC"""
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self) -> None:
+        """Close the index."""
+        self._conn.close()
@@ -0,0 +1,422 @@
+"""Helpers for querying Kupo.
+
+Matches and datum are retrieved from a Kupo instance, or replicas of
+it, over a shared keep-alive session. Datum are fetched concurrently,
+resolved inline with matches where Kupo supports it, and decoded in
+batches.
+
+aiohttp is imported when a session is first created rather than when
+this module is imported.
+"""
+
+# pylint: disable=C0415
+
+from __future__ import annotations
+
+import asyncio
+import binascii
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Final, Union
+
+from . import decode_helper, index_helper, replica_helper, stream_helper, timing_helper
+
+if TYPE_CHECKING:
+    import aiohttp
+
+    from . import cache_helper
+
+logger = logging.getLogger(__name__)
+
+# Kupo connection settings. Concurrency limits the number of requests
+# in-flight against Kupo at any one time and doubles as the size of
+# the keep-alive connection pool.
+KUPO_TIMEOUT: Final[int] = 30
+KUPO_CONCURRENCY: Final[int] = int(os.environ.get("KUPO_CONCURRENCY", 20))
+
+# Matches are read from Kupo in chunks of this many bytes and processed
+# in batches of this many matches.
+KUPO_CHUNK_SIZE: Final[int] = 64 * 1024
+MATCH_BATCH_SIZE: Final[int] = 1000
+
+# Ask Kupo to resolve datum inline with matches (requires Kupo >= 2.7).
+KUPO_RESOLVE_HASHES: Final[bool] = os.environ.get(
+    "KUPO_RESOLVE_HASHES", "true"
+).lower() in ("true", "1")
+
+
+@dataclass
+class Kupo:
+    """A Kupo instance, or replicas of it, queried over a session.
+
+    Datum are fetched with no more than `concurrency` requests in-flight
+    at once and, if a cache is provided, only fetched if they are
+    missing from it.
+    """
+
+    session: aiohttp.ClientSession
+    url: str
+    concurrency: int = KUPO_CONCURRENCY
+    cache: cache_helper.DatumCache = None
+
+
+def create_kupo_session(concurrency: int = KUPO_CONCURRENCY) -> aiohttp.ClientSession:
+    """Create a HTTP session for Kupo with a shared keep-alive
+    connection pool.
+
+    The session must be created from within a running event loop and
+    closed by the caller, e.g. `async with create_kupo_session() as
+    session:`.
+    """
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=30)
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=KUPO_TIMEOUT),
+    )
+
+
+async def kupo_get_json(
+    session: aiohttp.ClientSession, kupo_url: str, path: str, endpoint: str
+) -> Union[list | dict]:
+    """Make a GET request to a Kupo endpoint and return the JSON
+    response. Requests are spread across replicas if the Kupo URL
+    lists more than one.
+    """
+
+    async def _get(base_url: str):
+        async with session.get(f"{base_url}{path}") as resp:
+            resp.raise_for_status()
+            return await resp.json(content_type=None)
+
+    with timing_helper.stage(f"kupo_{endpoint}"):
+        return await replica_helper.get_replicas(kupo_url).request(_get, endpoint)
+
+
+async def get_matches(
+    session: aiohttp.ClientSession,
+    kupo_url: str,
+    matches_path: str,
+    resolve_hashes: bool = True,
+) -> list[dict]:
+    """Get matches from Kupo, asking for datum to be resolved inline
+    if possible.
+
+    If Kupo doesn't understand the request the matches are retrieved
+    without inline datum so that callers can fall back to the datums
+    endpoint.
+    """
+    import aiohttp
+
+    if not resolve_hashes or not KUPO_RESOLVE_HASHES:
+        return await kupo_get_json(session, kupo_url, matches_path, "matches")
+    try:
+        return await kupo_get_json(
+            session, kupo_url, f"{matches_path}&resolve_hashes", "matches"
+        )
+    except aiohttp.ClientResponseError as err:
+        if err.status != 400:
+            raise
+        logger.warning("kupo cannot resolve hashes inline, falling back: %s", err)
+    return await kupo_get_json(session, kupo_url, matches_path, "matches")
+
+
+async def stream_matches(
+    session: aiohttp.ClientSession,
+    kupo_url: str,
+    matches_path: str,
+    resolve_hashes: bool = True,
+) -> AsyncIterator[dict]:
+    """Yield matches from Kupo as they are parsed from the response
+    rather than loading the whole response, asking for datum to be
+    resolved inline if possible.
+    """
+    paths = [matches_path]
+    if resolve_hashes and KUPO_RESOLVE_HASHES:
+        paths = [f"{matches_path}&resolve_hashes", matches_path]
+    replicas = replica_helper.get_replicas(kupo_url)
+    for path in paths:
+
+        async def _open(base_url: str, path: str = path) -> aiohttp.ClientResponse:
+            resp = await session.get(f"{base_url}{path}")
+            if resp.status >= 500:
+                resp.release()
+                resp.raise_for_status()
+            return resp
+
+        with timing_helper.stage("kupo_matches"):
+            resp = await replicas.request(
+                _open, "matches", discard=lambda resp: resp.release()
+            )
+        async with resp:
+            if resp.status == 400 and path != paths[-1]:
+                logger.warning("kupo cannot resolve hashes inline, falling back")
+                continue
+            resp.raise_for_status()
+            chunks = resp.content.iter_chunked(KUPO_CHUNK_SIZE)
+            async for match in stream_helper.iter_json_array(chunks):
+                yield match
+            return
+
+
+async def get_datum_cbor(
+    session: aiohttp.ClientSession, datum_hash: str, kupo_url: str
+) -> str:
+    """Get the CBOR of a datum from Kupo."""
+    res = await kupo_get_json(session, kupo_url, f"/datums/{datum_hash}", "datums")
+    return res["datum"]
+
+
+async def get_datum(
+    session: aiohttp.ClientSession, datum_hash: str, kupo_url: str
+) -> decode_helper.FeedObservation:
+    """Get the datum from Kupo."""
+    datum_cbor = await get_datum_cbor(session, datum_hash, kupo_url)
+    return decode_helper.decode_fact_statement(datum_cbor)
+
+
+async def get_datums(
+    kupo: Kupo, datum_hashes: list, inline_datums: dict = None
+) -> list:
+    """Fetch datums from Kupo concurrently.
+
+    Repeated hashes are only fetched once, and if Kupo has a cache only
+    hashes missing from the cache are fetched. Datum CBOR already
+    resolved inline with matches is used in place of fetching it. All
+    CBOR is decoded together once retrieved. Results are returned in
+    the same order as `datum_hashes`.
+    """
+    semaphore = asyncio.Semaphore(max(1, kupo.concurrency))
+
+    async def _bounded_get_datum_cbor(datum_hash: str) -> str:
+        async with semaphore:
+            return await get_datum_cbor(kupo.session, datum_hash, kupo.url)
+
+    unique_hashes = list(dict.fromkeys(datum_hashes))
+    datums = {}
+    if kupo.cache is not None:
+        with timing_helper.stage("datum_cache"):
+            for datum_hash in unique_hashes:
+                datum = kupo.cache.get(datum_hash)
+                if datum is not None:
+                    datums[datum_hash] = decode_helper.FeedObservation.from_datum(datum)
+    missing = [datum_hash for datum_hash in unique_hashes if datum_hash not in datums]
+    inline_datums = inline_datums if inline_datums else {}
+    datums_cbor = {
+        datum_hash: inline_datums[datum_hash]
+        for datum_hash in missing
+        if inline_datums.get(datum_hash)
+    }
+    to_fetch = [datum_hash for datum_hash in missing if datum_hash not in datums_cbor]
+    if missing:
+        logger.info(
+            "datum resolved inline: %s, fetching: %s", len(datums_cbor), len(to_fetch)
+        )
+    timing_helper.count("datums_cached", len(datums))
+    timing_helper.count("datums_inline", len(datums_cbor))
+    timing_helper.count("datums_fetched", len(to_fetch))
+    with timing_helper.stage("datum_fetch"):
+        fetched = await asyncio.gather(
+            *[_bounded_get_datum_cbor(datum_hash) for datum_hash in to_fetch]
+        )
+    datums_cbor.update(zip(to_fetch, fetched))
+    with timing_helper.stage("decode"):
+        decoded = decode_helper.decode_fact_statements(list(datums_cbor.values()))
+    for datum_hash, datum in zip(datums_cbor, decoded):
+        datums[datum_hash] = datum
+        if kupo.cache is not None:
+            kupo.cache.put(datum_hash, datum.as_datum())
+    return [datums[datum_hash] for datum_hash in datum_hashes]
+
+
+def get_inline_datums(matches: list[dict]) -> dict:
+    """Return datum CBOR resolved inline with matches keyed by datum
+    hash.
+    """
+    return {
+        match["datum_hash"]: match["datum"] for match in matches if match.get("datum")
+    }
+
+
+async def get_latest_feed_data(kupo: Kupo, fs_policy_id: str, created_after: int = 0):
+    """Get the latest feed data for processing."""
+    on_chain_feed_data = []
+    async for observations in stream_latest_feed_data(
+        kupo, fs_policy_id, created_after
+    ):
+        on_chain_feed_data.extend(observations)
+    return on_chain_feed_data
+
+
+async def stream_latest_feed_data(
+    kupo: Kupo,
+    fs_policy_id: str,
+    created_after: int = 0,
+    batch_size: int = MATCH_BATCH_SIZE,
+) -> AsyncIterator[list]:
+    """Yield the latest feed data in batches. Each batch of matches is
+    fetched and decoded as soon as it has been parsed from Kupo's
+    response so that memory use is bounded by the batch size rather
+    than the number of matches.
+    """
+    matches_path = f"/matches/{fs_policy_id}.*?created_after={created_after}&unspent"
+    batches = stream_helper.batched(
+        stream_matches(kupo.session, kupo.url, matches_path), batch_size
+    )
+    start = time.perf_counter()
+    async for batch in batches:
+        timing_helper.record("matches", time.perf_counter() - start)
+        yield await get_datums(
+            kupo, [match["datum_hash"] for match in batch], get_inline_datums(batch)
+        )
+        start = time.perf_counter()
+    timing_helper.record("matches", time.perf_counter() - start)
+
+
+async def get_indexed_feed_data(
+    kupo: Kupo, index: index_helper.UtxoIndex, fs_policy_id: str, checkpoint: int
+):
+    """Update the local UTxO index with only the matches created or
+    spent since its last checkpoint and return the latest feed data
+    from the index.
+
+    The index is built from the unspent matches if it is new, the
+    policy has changed or the block at the index's checkpoint has been
+    rolled back.
+    """
+    session, kupo_url = kupo.session, kupo.url
+    window_start = index.window_start(fs_policy_id)
+    if window_start:
+        stored = await get_point(
+            session, kupo_url, index.checkpoint(fs_policy_id), strict=True
+        )
+        if not stored or stored["header_hash"] != index.header_hash(fs_policy_id):
+            logger.warning("utxo index checkpoint rolled back, rebuilding index")
+            window_start = 0
+    point = await get_point(session, kupo_url, checkpoint)
+    with timing_helper.stage("matches"):
+        if not window_start:
+            # Only the UTxOs unspent now are needed to build the index.
+            created = await get_matches(
+                session, kupo_url, f"/matches/{fs_policy_id}.*?unspent"
+            )
+            spent = []
+        else:
+            created_path = f"/matches/{fs_policy_id}.*?created_after={window_start}"
+            spent_path = f"/matches/{fs_policy_id}.*?spent_after={window_start}"
+            created, spent = await asyncio.gather(
+                get_matches(session, kupo_url, created_path),
+                get_matches(session, kupo_url, spent_path, resolve_hashes=False),
+            )
+    index.apply(
+        fs_policy_id,
+        window_start,
+        created,
+        spent,
+        point["slot_no"],
+        point["header_hash"],
+    )
+    missing = index.missing_datum()
+    datums = await get_datums(kupo, missing, get_inline_datums(created))
+    index.add_datum(
+        {datum_hash: datum.as_datum() for datum_hash, datum in zip(missing, datums)}
+    )
+    return read_indexed_feed_data(index)
+
+
+def read_indexed_feed_data(index: index_helper.UtxoIndex) -> list:
+    """Return the latest feed data in the local UTxO index as it
+    stands, without updating it.
+    """
+    return [
+        decode_helper.FeedObservation.from_datum(datum)
+        for datum in index.unspent_datum()
+    ]
+
+
+def get_fsp_key(fsp_policy_id: str, validity_token_name: str, kupo_url: str) -> str:
+    """Return the key a Fact Statement Pointer is cached under."""
+    return f"{fsp_policy_id}.{validity_token_name}@{kupo_url}"
+
+
+async def get_policy_from_fsp(
+    session: aiohttp.ClientSession,
+    fsp_policy_id: str,
+    validity_token_name: str,
+    kupo_url: str,
+    policy_cache: cache_helper.PolicyCache = None,
+):
+    """List the current policy ID from the Fact Statement Pointer.
+
+    Requires the fsp policy as input as well as the validity token
+    name.
+
+    The script will return the current fact statement policy ID.
+
+    ```sh
+    curl -s \
+        "http://<kupo_url>:<port>/datums/$(curl -s "http://<kupo_url>:<port>/matches/*?policy_id=0690081bc113f74e04640ea78a87d88abbd2f18831c44c4064524230&unspent&asset_name=000de140&order=most_recent_first" \
+            | jq -r .[].datum_hash)?unspent"     \
+                | jq -r .[] | cbor-diag
+
+    ```
+
+    * Example FSP policy: `0690081bc113f74e04640ea78a87d88abbd2f18831c44c4064524230`.
+    * Example validity token name: `000de140`.
+
+    If a policy cache is provided, the policy is only resolved again
+    if the validity token has moved to a different UTxO or datum since
+    it was cached.
+    """
+    matches_path = (
+        f"/matches/*?policy_id={fsp_policy_id}&asset_name={validity_token_name}&unspent"
+    )
+    res = await get_matches(session, kupo_url, matches_path)
+    fsp = get_fsp_key(fsp_policy_id, validity_token_name, kupo_url)
+    datum_hash = res[0]["datum_hash"]
+    if policy_cache is not None:
+        output_reference = index_helper.get_output_reference(res[0])
+        policy_id = policy_cache.get(fsp, output_reference, datum_hash)
+        if policy_id is not None:
+            timing_helper.count("policy_cached")
+            return policy_id
+    datum_cbor = res[0].get("datum")
+    if not datum_cbor:
+        datum_cbor = await get_datum_cbor(session, datum_hash, kupo_url)
+    cbor = await decode_helper.process_cbor(datum_cbor)
+    policy_id = binascii.hexlify(cbor).decode()
+    if policy_cache is not None:
+        policy_cache.put(fsp, output_reference, datum_hash, policy_id)
+    return policy_id
+
+
+async def get_checkpoint(session: aiohttp.ClientSession, kupo_url: str) -> str:
+    """Return the most recent checkpoint (slot) of the Kupo index. If
+    the Kupo URL lists several replicas, the checkpoint of each is
+    updated so that replicas behind the most recent aren't used.
+    """
+
+    async def _get_checkpoint(base_url: str) -> str:
+        async with session.get(f"{base_url}/health") as health:
+            return health.headers["X-Most-Recent-Checkpoint"]
+
+    with timing_helper.stage("kupo_health"):
+        checkpoint = await replica_helper.get_replicas(kupo_url).check_health(
+            _get_checkpoint
+        )
+    return str(checkpoint)
+
+
+async def get_point(
+    session: aiohttp.ClientSession, kupo_url: str, slot: int, strict: bool = False
+) -> Union[dict | None]:
+    """Return the point, i.e. `slot_no` and `header_hash`, of the block
+    at a slot. Unless `strict`, the nearest block before the slot is
+    returned if there's no block at it. None is returned if there's no
+    such block.
+    """
+    path = f"/checkpoints/{slot}?strict" if strict else f"/checkpoints/{slot}"
+    return await kupo_get_json(session, kupo_url, path, "checkpoints")
@@ -0,0 +1,142 @@
+"""Helpers for tracking how long requested feeds take to reach the
+chain.
+
+Each feed requested from the validator is recorded with the time it
+was requested. When a newer datum for the feed is later seen on-chain
+the request is fulfilled and its latency is the time between the
+request and the on-chain timestamp of the datum. Requests not
+fulfilled within their timeout are flagged as unfulfilled.
+
+Only the latest datum of each feed is observed, so if a feed is
+published more than once between observations the latency is measured
+to the latest publication.
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+from typing import Final, Optional
+
+logger = logging.getLogger(__name__)
+
+LATENCY_FILE: Final[str] = "pubwatch_latency.sqlite"
+
+# How long fulfilled and unfulfilled requests are kept, in seconds.
+LATENCY_RETENTION: Final[int] = 7 * 24 * 60 * 60
+
+
+def default_latency_path(filename: str = LATENCY_FILE) -> str:
+    """Return the default location of a latency tracker."""
+    return os.path.join(tempfile.gettempdir(), filename)
+
+
+class LatencyTracker:
+    """Persistent record of feed requests and their publication
+    latency.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path else default_latency_path()
+        self._conn = sqlite3.connect(self.path, timeout=30)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS requests (
+                pair TEXT NOT NULL,
+                requested INTEGER NOT NULL,
+                on_chain INTEGER NOT NULL,
+                expires INTEGER NOT NULL,
+                published INTEGER,
+                unfulfilled INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS requests_pair ON requests (pair, requested)"
+        )
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, pairs: list, now: int, timeouts: dict, on_chain: dict) -> None:
+        """Record pairs as requested at `now`.
+
+        `timeouts` gives how long each pair has to be published before
+        its request is flagged as unfulfilled and `on_chain` the latest
+        on-chain time of each pair when it was requested, in seconds.
+        """
+        self._conn.executemany(
+            "INSERT INTO requests (pair, requested, on_chain, expires) VALUES (?, ?, ?, ?)",
+            [
+                (pair, now, on_chain.get(pair, 0), now + timeouts[pair])
+                for pair in pairs
+            ],
+        )
+        self._conn.commit()
+
+    def observe(self, on_chain: dict, now: int) -> tuple[list, list]:
+        """Match outstanding requests against the latest on-chain time
+        of each pair.
+
+        Returns the pair and latency of each request fulfilled and the
+        pairs whose requests have timed out unfulfilled.
+        """
+        fulfilled = []
+        unfulfilled = []
+        rows = self._conn.execute(
+            """SELECT rowid, pair, requested, on_chain, expires FROM requests
+            WHERE published IS NULL AND unfulfilled = 0
+            ORDER BY requested"""
+        ).fetchall()
+        for rowid, pair, requested, requested_on_chain, expires in rows:
+            latest = on_chain.get(pair, 0)
+            if latest > requested_on_chain:
+                fulfilled.append((pair, max(0, latest - requested)))
+                self._conn.execute(
+                    "UPDATE requests SET published = ? WHERE rowid = ?",
+                    (latest, rowid),
+                )
+                continue
+            if now >= expires:
+                unfulfilled.append(pair)
+                self._conn.execute(
+                    "UPDATE requests SET unfulfilled = 1 WHERE rowid = ?", (rowid,)
+                )
+        self._conn.execute(
+            "DELETE FROM requests WHERE requested < ?", (now - LATENCY_RETENTION,)
+        )
+        self._conn.commit()
+        if unfulfilled:
+            logger.warning("requested feeds never published: %s", unfulfilled)
+        return fulfilled, unfulfilled
+
+    def latencies(self, since: int = 0) -> dict:
+        """Return the publication latencies of each pair requested
+        since the given time, in seconds.
+        """
+        latencies = {}
+        for pair, latency in self._conn.execute(
+            """SELECT pair, MAX(0, published - requested) FROM requests
+            WHERE published IS NOT NULL AND requested >= ?
+            ORDER BY pair, requested""",
+            (since,),
+        ):
+            latencies.setdefault(pair, []).append(latency)
+        return latencies
+
+    def unfulfilled(self, since: int = 0) -> list:
+        """Return the pairs and request times of requests that were
+        never fulfilled since the given time.
+        """
+        return self._conn.execute(
+            """SELECT pair, requested FROM requests
+            WHERE unfulfilled = 1 AND requested >= ?
+            ORDER BY requested, pair""",
+            (since,),
+        ).fetchall()
+
+    def close(self) -> None:
+        """Close the tracker."""
+        self._conn.close()
@@ -0,0 +1,111 @@
+"""Helpers for keeping track of feeds already requested from the
+validator.
+
+Requested feeds are recorded in a persistent ledger until their
+request expires or a newer datum for the feed is seen on-chain. Feeds
+still pending are not requested again so that repeated or overlapping
+runs don't ask the validator for the same feeds twice.
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+from typing import Final, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING_LEDGER_FILE: Final[str] = "pubwatch_pending.sqlite"
+
+
+def default_ledger_path(filename: str = PENDING_LEDGER_FILE) -> str:
+    """Return the default location of a pending request ledger."""
+    return os.path.join(tempfile.gettempdir(), filename)
+
+
+def get_ttl(interval: int, threshold: int) -> int:
+    """Return how long a request for a feed with the given interval
+    remains pending, in seconds.
+
+    A request outlasts the feed's interval by the interval threshold so
+    that the next run a whole interval later doesn't request the feed
+    again while its publication is still landing.
+    """
+    return interval + threshold
+
+
+class PendingLedger:
+    """Persistent ledger of pending validator requests keyed by pair."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path if path else default_ledger_path()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pending (
+                pair TEXT PRIMARY KEY,
+                requested INTEGER NOT NULL,
+                expires INTEGER NOT NULL,
+                on_chain INTEGER NOT NULL
+            )"""
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def claim(self, pairs: list, now: int, ttls: dict, on_chain: dict) -> list:
+        """Record pairs as pending and return those that weren't
+        already pending.
+
+        A pair is pending until its request expires or a datum newer
+        than the one on-chain when it was requested is seen. `ttls`
+        and `on_chain` give the TTL and latest on-chain time of each
+        pair in seconds. Pairs are claimed atomically so that
+        overlapping runs don't both request the same pair.
+        """
+        claimed = []
+        suppressed = []
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for pair in pairs:
+                row = self._conn.execute(
+                    "SELECT expires, on_chain FROM pending WHERE pair = ?", (pair,)
+                ).fetchone()
+                latest = on_chain.get(pair, 0)
+                if row is not None and row[0] > now and latest <= row[1]:
+                    suppressed.append(pair)
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pending VALUES (?, ?, ?, ?)",
+                    (pair, now, now + ttls[pair], latest),
+                )
+                claimed.append(pair)
+            self._conn.execute("DELETE FROM pending WHERE expires <= ?", (now,))
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        if suppressed:
+            logger.info("already requested, pending: %s", suppressed)
+        return claimed
+
+    def release(self, pairs: list) -> None:
+        """Remove pairs from the ledger, e.g. if requesting them
+        failed.
+        """
+        self._conn.executemany(
+            "DELETE FROM pending WHERE pair = ?", [(pair,) for pair in pairs]
+        )
+
+    def pending(self, now: int) -> list:
+        """Return the pairs currently pending."""
+        rows = self._conn.execute(
+            "SELECT pair FROM pending WHERE expires > ? ORDER BY pair", (now,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        """Close the ledger."""
+        self._conn.close()
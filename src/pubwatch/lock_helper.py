@@ -0,0 +1,129 @@
+"""Helpers for stopping runs from overlapping.
+
+A run holds a lock file for each target it checks so that a second
+invocation, e.g. cron starting the next run while a slow one is still
+going, doesn't repeat its work. The lock records the host and process
+of its holder and when the holder's deadline expires, if it has one. A
+lock whose holder has exited or overrun its deadline is stale and is
+taken over.
+
+The lock file is checked and written while holding an empty `.guard`
+file next to it. The guard file is left in place: removing it would let
+a process still waiting on the removed file and one opening a new file
+both hold the guard.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+import uuid
+from typing import Final, Optional
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE: Final[str] = "pubwatch.lock"
+
+
+def default_lock_path(filename: str = LOCK_FILE) -> str:
+    """Return the location of a lock in the system's temp directory."""
+    return os.path.join(tempfile.gettempdir(), filename)
+
+
+def process_alive(pid: int) -> bool:
+    """Return true if a process with the given ID is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def is_stale(holder: Optional[dict], now: float) -> bool:
+    """Return true if a lock's holder has exited or overrun."""
+    if not holder:
+        return True
+    try:
+        if holder["expires"] is not None and holder["expires"] < now:
+            return True
+        if holder["host"] == socket.gethostname():
+            return not process_alive(holder["pid"])
+    except (KeyError, TypeError):
+        return True
+    return False
+
+
+class RunLock:
+    """Lock file held for the duration of a run."""
+
+    def __init__(self, path: str = None):
+        self.path = path if path else default_lock_path()
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def _guard(self):
+        """Return a file held locked while the lock file is checked and
+        written so that only one process can take over a stale lock.
+        """
+        guard = open(  # pylint: disable=R1732
+            f"{self.path}.guard", "a", encoding="utf-8"
+        )
+        fcntl.flock(guard, fcntl.LOCK_EX)
+        return guard
+
+    def holder(self) -> Optional[dict]:
+        """Return the holder of the lock, or `None` if it isn't held."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as lock_file:
+                return json.load(lock_file)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            return {}
+
+    def acquire(self, expires: Optional[float]) -> bool:
+        """Take the lock until `expires` (unix time), or until this
+        process exits if it is `None`, and return true, or return false
+        if it is held by a run still in progress.
+        """
+        with self._guard():
+            holder = self.holder()
+            if holder is not None:
+                if not is_stale(holder, time.time()):
+                    logger.warning("run already in progress: %s", holder)
+                    return False
+                logger.warning("taking over stale lock: %s", holder)
+            with open(self.path, "w", encoding="utf-8") as lock_file:
+                json.dump(
+                    {
+                        "host": socket.gethostname(),
+                        "pid": os.getpid(),
+                        "token": self.token,
+                        "started": int(time.time()),
+                        "expires": expires,
+                    },
+                    lock_file,
+                )
+        self.acquired = True
+        return True
+
+    def release(self) -> None:
+        """Release the lock if it is still held by this run."""
+        if not self.acquired:
+            return
+        with self._guard():
+            holder = self.holder()
+            if holder and holder.get("token") == self.token:
+                os.remove(self.path)
+        self.acquired = False
@@ -0,0 +1,154 @@
+"""Helpers for logging without blocking the event loop.
+
+Records are put on a queue by the logging call and written to the log
+file and stderr by a background thread, so a slow disk or terminal
+doesn't hold up a run. Records can be written as text or as one JSON
+object per line.
+
+Repetitive messages, i.e. the same message template logged over and
+over such as a line per feed, are rate limited. Once a template has
+been logged `LOG_RATE_LIMIT` times within `LOG_RATE_PERIOD` seconds
+further records are dropped, and the number dropped is noted on the
+next record let through. Per-feed messages are also sampled where
+they are logged so that the number of lines logged doesn't grow with
+the number of feeds.
+"""
+
+# pylint: disable=R0903
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Final, Iterable
+
+LOG_FILE: Final[str] = "monitor.log"
+LOG_FORMAT: Final[
+    str
+] = "%(asctime)-15s %(levelname)s :: %(filename)s:%(lineno)s:%(funcName)s() :: %(message)s"
+LOG_DATE_FORMAT: Final[str] = "%Y-%m-%d %H:%M:%S"
+
+# Records of a template allowed per period before the rest are dropped.
+LOG_RATE_LIMIT: Final[int] = 20
+LOG_RATE_PERIOD: Final[int] = 60
+
+# Number of items logged from a sample of a longer list.
+LOG_SAMPLE_SIZE: Final[int] = 10
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as a single line JSON object."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "function": record.funcName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop records of a message template logged more than `limit`
+    times in `period` seconds. Warnings and errors aren't limited.
+
+    Windows are evicted once their period has passed, or a period later
+    if messages were suppressed so that the count can still be noted
+    on the template's next record.
+    """
+
+    def __init__(
+        self,
+        limit: int = LOG_RATE_LIMIT,
+        period: float = LOG_RATE_PERIOD,
+        level: int = logging.INFO,
+    ):
+        super().__init__()
+        self.limit = limit
+        self.period = period
+        self.level = level
+        self._windows = {}
+        self._evicted = 0.0
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> None:
+        """Drop windows that are no longer needed."""
+        self._windows = {
+            key: window
+            for key, window in self._windows.items()
+            if now - window[0] < self.period * (2 if window[2] else 1)
+        }
+        self._evicted = now
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.level:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            if record.created - self._evicted >= self.period:
+                self._evict(record.created)
+            window = self._windows.get(key)
+            if window is None or record.created - window[0] >= self.period:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [record.created, 1, 0]
+            elif window[1] < self.limit:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if suppressed and isinstance(record.args, tuple):
+            record.msg = f"{record.msg} (%s similar messages suppressed)"
+            record.args = record.args + (suppressed,)
+        return True
+
+
+def sample(items: Iterable, size: int = LOG_SAMPLE_SIZE) -> str:
+    """Return a description of the first `size` items and how many
+    others there are, for logging a long list in a single line.
+    """
+    items = list(items)
+    if len(items) <= size:
+        return str(items)
+    return f"{items[:size]} and {len(items) - size} more"
+
+
+def setup_logging(
+    log_file: str = LOG_FILE,
+    json_format: bool = False,
+    rate_limit: bool = True,
+) -> logging.handlers.QueueListener:
+    """Configure the root logger to write to `log_file` and stderr from
+    a background thread and return the thread's listener. The listener
+    is stopped, writing any records left on the queue, at exit.
+    """
+    formatter = (
+        JsonFormatter()
+        if json_format
+        else logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+    )
+    handlers = [logging.handlers.WatchedFileHandler(log_file), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if rate_limit:
+        queue_handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
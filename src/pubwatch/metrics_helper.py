@@ -0,0 +1,193 @@
+"""Helpers for exporting metrics about pubwatch runs.
+
+`Metrics` is a stage timer that also keeps a latency histogram per
+stage and cumulative counts so that the stages timed during a run can
+be exported in the Prometheus text format, either as a textfile for
+the node exporter's textfile collector or over HTTP.
+
+Stages named `kupo_<endpoint>` are exported as Kupo request latency
+by endpoint, all other stages as stage duration. Observations are
+exported as a histogram per observed name labelled by feed.
+"""
+
+# pylint: disable=E0401,C0415
+
+import bisect
+import logging
+import os
+import tempfile
+import time
+from typing import Final
+
+from . import timing_helper
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of histogram buckets in seconds.
+BUCKETS: Final[tuple] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+
+# Upper bounds of histogram buckets of observations in seconds.
+OBSERVATION_BUCKETS: Final[dict] = {
+    "publication_latency": (30, 60, 120, 300, 600, 1200, 1800, 3600, 7200),
+}
+
+OBSERVATION_HELP: Final[dict] = {
+    "publication_latency": "Time from requesting a feed to its publication on-chain.",
+}
+
+KUPO_STAGE_PREFIX: Final[str] = "kupo_"
+
+METRICS_CONTENT_TYPE: Final[str] = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Cumulative histogram of observations."""
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add an observation to the histogram."""
+        idx = bisect.bisect_left(self.buckets, value)
+        if idx < len(self.buckets):
+            self.counts[idx] += 1
+        self.count += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str) -> list[str]:
+        """Return the sample lines of the histogram."""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Metrics(timing_helper.StageTimer):
+    """Stage timer exporting its stages and counts as Prometheus
+    metrics.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        super().__init__()
+        self.buckets = buckets
+        self.histograms = {}
+        self.observation_histograms = {}
+        self.last_run = None
+
+    def record(self, name: str, seconds: float) -> None:
+        """Add time to a stage and observe it in the stage histogram."""
+        super().record(name, seconds)
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(self.buckets)
+        self.histograms[name].observe(seconds)
+        if name == "run":
+            self.last_run = time.time()
+
+    def observe(self, name: str, label: str, value: float) -> None:
+        """Add an observation and observe it in the histogram of its
+        name and label.
+        """
+        super().observe(name, label, value)
+        histograms = self.observation_histograms.setdefault(name, {})
+        if label not in histograms:
+            histograms[label] = Histogram(OBSERVATION_BUCKETS.get(name, self.buckets))
+        histograms[label].observe(value)
+
+    def render(self) -> str:
+        """Return the metrics in the Prometheus text format."""
+        kupo = {
+            name[len(KUPO_STAGE_PREFIX) :]: histogram
+            for name, histogram in sorted(self.histograms.items())
+            if name.startswith(KUPO_STAGE_PREFIX)
+        }
+        stages = {
+            name: histogram
+            for name, histogram in sorted(self.histograms.items())
+            if not name.startswith(KUPO_STAGE_PREFIX)
+        }
+        lines = [
+            "# HELP pubwatch_kupo_request_seconds Kupo request latency by endpoint.",
+            "# TYPE pubwatch_kupo_request_seconds histogram",
+        ]
+        for endpoint, histogram in kupo.items():
+            lines += histogram.render(
+                "pubwatch_kupo_request_seconds", f'endpoint="{endpoint}"'
+            )
+        lines += [
+            "# HELP pubwatch_stage_seconds Duration of each stage of a run.",
+            "# TYPE pubwatch_stage_seconds histogram",
+        ]
+        for stage, histogram in stages.items():
+            lines += histogram.render("pubwatch_stage_seconds", f'stage="{stage}"')
+        for name, histograms in sorted(self.observation_histograms.items()):
+            if name in OBSERVATION_HELP:
+                lines.append(f"# HELP pubwatch_{name}_seconds {OBSERVATION_HELP[name]}")
+            lines.append(f"# TYPE pubwatch_{name}_seconds histogram")
+            for label, histogram in sorted(histograms.items()):
+                lines += histogram.render(f"pubwatch_{name}_seconds", f'feed="{label}"')
+        for name, value in sorted(self.counts.items()):
+            lines += [
+                f"# TYPE pubwatch_{name}_total counter",
+                f"pubwatch_{name}_total {value}",
+            ]
+        if self.last_run is not None:
+            lines += [
+                "# HELP pubwatch_last_run_timestamp_seconds Completion time of the last run.",
+                "# TYPE pubwatch_last_run_timestamp_seconds gauge",
+                f"pubwatch_last_run_timestamp_seconds {self.last_run}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Write the metrics to a textfile, replacing it atomically so
+        that a collector never reads a partially written file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, suffix=".tmp", delete=False, encoding="utf-8"
+        ) as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(metrics_file.name, path)
+
+
+async def start_server(metrics: Metrics, host: str, port: int):
+    """Serve metrics on `/metrics`. The returned `web.AppRunner` must
+    be cleaned up by the caller.
+    """
+    from aiohttp import web
+
+    async def handle_metrics(_):
+        return web.Response(
+            body=metrics.render().encode(),
+            headers={"Content-Type": METRICS_CONTENT_TYPE},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("serving metrics on: http://%s:%s/metrics", host, port)
+    return runner
@@ -8,46 +8,51 @@ monitoring anticipated to pick up where pubwatch leaves off.
 Feeds: https://github.com/orcfax/cer-feeds/main/feeds/cer-feeds.json
 """
 
-import argparse
+# pylint: disable=C0415
+
+from __future__ import annotations
+
 import asyncio
-import binascii
 import json
 import logging
-import logging.handlers
 import os
-import ssl
 import sys
 import tempfile
 import time
 from datetime import datetime, timedelta
-from typing import Final, Union
-
-import cbor2
-import certifi
-import requests
-
-# pylint: disable=E0401
-import websockets
-
-try:
-    import feed_helper
-except ModuleNotFoundError:
-    try:
-        from src.pubwatch import feed_helper
-    except ModuleNotFoundError:
-        from pubwatch import feed_helper
-
-
-logging.basicConfig(
-    format="%(asctime)-15s %(levelname)s :: %(filename)s:%(lineno)s:%(funcName)s() :: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    level="INFO",
-    handlers=[
-        logging.handlers.WatchedFileHandler("monitor.log"),
-        logging.StreamHandler(),
-    ],
+from typing import TYPE_CHECKING, Final, Union
+
+if not __package__:
+    # Run as a script, e.g. `python pubwatch.py`, so import the helpers
+    # from the package the script is in (PEP 366).
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "pubwatch"  # pylint: disable=W0622
+
+from . import (  # pylint: disable=C0413
+    archive_helper,
+    cli_helper,
+    deadline_helper,
+    deviation_helper,
+    evaluate_helper,
+    feed_helper,
+    index_helper,
+    kupo_helper,
+    latency_helper,
+    ledger_helper,
+    lock_helper,
+    log_helper,
+    metrics_helper,
+    run_helper,
+    shard_helper,
+    state_helper,
+    target_helper,
+    timing_helper,
+    validator_helper,
 )
 
+if TYPE_CHECKING:
+    import aiohttp
+
 logger = logging.getLogger(__name__)
 
 
@@ -65,165 +70,53 @@ SLOTFILE: Final[str] = "pubwatch_slotfile"
 INTERVAL_THRESHOLD: Final[str] = 120
 
 
+def setup_logging(json_format: bool = False) -> None:
+    """Configure logging for the script. Logging is configured by the
+    entry point rather than on import so that importing the module has
+    no side effects.
+
+    Records are written by a background thread so that logging doesn't
+    block the event loop, optionally as JSON.
+    """
+    log_helper.setup_logging(json_format=json_format)
+
+
 class PubWatchException(Exception):
     """Sensible exception to return if there's a problem with this
     script.
     """
 
 
-def get_user_agent() -> str:
-    """Return a user-agent string to connect to the monitor websocket."""
-    return "orcfax-pubwatch/0.0.0"
-
-
-async def connect_to_websocket(ws_uri: str, msg_to_send: str, local: bool):
-    """Connect to the websocket and parse the response."""
-    validator_connection = ws_uri
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    if local:
-        ssl_context = None
-    try:
-        # pylint: disable=E1101
-        async with websockets.connect(
-            validator_connection,
-            user_agent_header=get_user_agent(),
-            ssl=ssl_context,
-        ) as websocket:
-            logger.info("connected to websocket")
-            await websocket.send(msg_to_send)
-            logger.info(msg_to_send)
-            msg = await websocket.recv()
-            try:
-                return json.loads(msg)
-            except json.JSONDecodeError:
-                pass
-            return msg
-    except websockets.exceptions.InvalidURI as err:
-        logger.error(
-            "ensure 'ORCFAX_VALIDATOR' environment variable is set: %s (`export ORCFAX_VALIDATOR=wss://`)",
-            err,
-        )
-        sys.exit(1)
-    except TypeError as err:
-        logger.error("ensure data is sent as JSON: %s", err)
-    except (
-        websockets.exceptions.ConnectionClosedError,
-        websockets.exceptions.InvalidStatusCode,
-    ) as err:
-        logger.warning(
-            "closed connection error '%s', attempting exponential retry: %s",
-            ws_uri,
-            err,
-        )
-    except json.decoder.JSONDecodeError as err:
-        logger.error("json error decoding server response '%s': %s", msg, err)
-    except websockets.exceptions.ConnectionClosedOK as err:
-        logger.error("connection to: '%s' made: %s", ws_uri, err)
-
-
-async def request_new_prices(pairs_to_request: dict, local: bool):
+async def request_new_prices(
+    pairs_to_request: str,
+    local: bool,
+    client: validator_helper.ValidatorClient = None,
+):
     """Send a validation request to the server to ask for a new price
     to be placed on-chain.
-    """
-    validate_uri = f"{VALIDATION_REQUEST_URI}"
-    await connect_to_websocket(validate_uri, pairs_to_request, local)
-    return
-
-
-async def unwrap_cbor(data: cbor2.CBORTag, unwrapped: list) -> Union[list | dict]:
-    """Unwrap CBOR so that it renders to the API."""
-    if isinstance(data.value, dict):
-        return data.value
-    if not isinstance(data.value, list):
-        return unwrapped
-    for cbor_obj in data.value:
-        if isinstance(cbor_obj, cbor2.CBORTag):
-            nested = []
-            unwrapped.append(nested)
-            await unwrap_cbor(cbor_obj, nested)
-            continue
-        try:
-            unwrapped.append(cbor_obj.decode())
-        except AttributeError:
-            unwrapped.append(cbor_obj)
-        except UnicodeDecodeError:
-            unwrapped.append(binascii.hexlify(cbor_obj).decode())
-    return unwrapped
-
-
-async def process_cbor(data: str) -> dict:
-    """Process metadata CBOR and return a dict/json representation."""
-    dec = binascii.a2b_hex(data)
-    cbor_data = cbor2.loads(dec)
-    return cbor_data
-
-
-async def get_datum(datum_hash: str) -> list:
-    """Get the datum from Kupo."""
-    datums_url = f"{KUPO_URL}/datums/{datum_hash}"
-    datum = requests.get(datums_url, timeout=30)
-    res = datum.json()
-    cbor = await process_cbor(res["datum"])
-    unwrapped = await unwrap_cbor(cbor, [])
-    return unwrapped[0]
-
-
-async def get_latest_feed_data(fs_policy_id: str, created_after: int = 0):
-    """Get the latest feed data for processing."""
-    matches_url = (
-        f"{KUPO_URL}/matches/{fs_policy_id}.*?created_after={created_after}&unspent"
-    )
-    matches = requests.get(matches_url, timeout=30)
-    res = matches.json()
-    datum_hashes = []
-    for item in res:
-        datum_hashes.append(item["datum_hash"])
-    datum = []
-    for datum_hash in datum_hashes:
-        datum.append(await get_datum(datum_hash))
-    return datum
-
-
-async def get_policy_from_fsp(fsp_policy_id: str, validity_token_name: str):
-    """List the current policy ID from the Fact Statement Pointer.
-
-    Requires the fsp policy as input as well as the validity token
-    name.
-
-    The script will return the current fact statement policy ID.
-
-    ```sh
-    curl -s \
-        "http://<kupo_url>:<port>/datums/$(curl -s "http://<kupo_url>:<port>/matches/*?policy_id=0690081bc113f74e04640ea78a87d88abbd2f18831c44c4064524230&unspent&asset_name=000de140&order=most_recent_first" \
-            | jq -r .[].datum_hash)?unspent"     \
-                | jq -r .[] | cbor-diag
 
-    ```
+    An existing validator client can be provided so that its
+    connection is reused.
+    """
+    if client is not None:
+        return await client.request(pairs_to_request)
+    async with validator_helper.ValidatorClient(
+        VALIDATION_REQUEST_URI, local
+    ) as new_client:
+        return await new_client.request(pairs_to_request)
 
-    * Example FSP policy: `0690081bc113f74e04640ea78a87d88abbd2f18831c44c4064524230`.
-    * Example validity token name: `000de140`.
 
-    """
-    matches_url = f"{KUPO_URL}/matches/*?policy_id={fsp_policy_id}&asset_name={validity_token_name}&unspent"
-    matches = requests.get(matches_url, timeout=30)
-    res = matches.json()
-    datum_hash = res[0]["datum_hash"]
-    datums_url = f"{KUPO_URL}/datums/{datum_hash}"
-    datum = requests.get(datums_url, timeout=30)
-    res = datum.json()
-    cbor = await process_cbor(res["datum"])
-    return binascii.hexlify(cbor).decode()
-
-
-async def get_slot() -> str:
+async def get_slot(
+    session: aiohttp.ClientSession, kupo_url: str, slotfile: str = SLOTFILE
+) -> tuple[str, str]:
     """Retrieve and store slot somewhere for future reference. Return
-    previous slot as a reference point for UTxO retrieval functions."""
-    health = requests.get(f"{KUPO_URL}/health", timeout=30)
-    slot = health.headers["X-Most-Recent-Checkpoint"]
+    previous slot as a reference point for UTxO retrieval functions
+    alongside the current slot."""
+    slot = await kupo_helper.get_checkpoint(session, kupo_url)
     previous_slot = "0"
     try:
         with open(
-            os.path.join(tempfile.gettempdir(), SLOTFILE), "r", encoding="utf=8"
+            os.path.join(tempfile.gettempdir(), slotfile), "r", encoding="utf=8"
         ) as slot_file:
             previous_slot = slot_file.read().strip()
     except FileNotFoundError:
@@ -231,10 +124,10 @@ async def get_slot() -> str:
     if int(slot) <= int(previous_slot):
         raise PubWatchException("slot hasn't changed since last update")
     with open(
-        os.path.join(tempfile.gettempdir(), SLOTFILE), "w", encoding="utf-8"
+        os.path.join(tempfile.gettempdir(), slotfile), "w", encoding="utf-8"
     ) as slot_file:
         slot_file.write(slot)
-    return previous_slot
+    return previous_slot, slot
 
 
 def create_interval_dict(feeds: list, hour_boundary: bool = False) -> dict:
@@ -242,16 +135,24 @@ def create_interval_dict(feeds: list, hour_boundary: bool = False) -> dict:
     which should ensure that we always have datum within an anticipated
     window.
     """
-    intervals = {}
-    for feed in feeds:
-        if feed.interval == 0:
-            # Make sure there is a way to null this value.
-            continue
-        if hour_boundary:
-            intervals[f"{feed.type}/{feed.pair}"] = feed.interval
-            continue
-        intervals[f"{feed.type}/{feed.pair}"] = feed.interval - INTERVAL_THRESHOLD
-    return intervals
+    if hour_boundary:
+        return feed_helper.get_intervals(feeds)
+    return feed_helper.get_intervals(feeds, INTERVAL_THRESHOLD)
+
+
+def load_intervals(feeds_file: str, hour_boundary: bool = False) -> dict:
+    """Return the intervals of the feeds in a feeds file, only reading
+    and validating the file again if it has changed.
+    """
+    compiled = feed_helper.load_feeds(feeds_file, INTERVAL_THRESHOLD)
+    return compiled.intervals(hour_boundary)
+
+
+def load_deviations(feeds_file: str) -> dict:
+    """Return the deviations of the feeds in a feeds file, only reading
+    and validating the file again if it has changed.
+    """
+    return feed_helper.load_feeds(feeds_file, INTERVAL_THRESHOLD).deviations
 
 
 def get_feed_id(feed_name: str):
@@ -281,17 +182,23 @@ def get_on_chain_time(feed_time: str) -> int:
     return int(int(feed_time) / 1000)
 
 
-def collate_latest_timestamps(on_chain_feed_data: list) -> dict:
+def get_feed_state(
+    on_chain_feed_data: Union[list | state_helper.FeedState],
+) -> state_helper.FeedState:
+    """Return an indexed feed state for on-chain feed data, indexing it
+    if it hasn't been already.
+    """
+    if isinstance(on_chain_feed_data, state_helper.FeedState):
+        return on_chain_feed_data
+    return state_helper.FeedState.from_observations(on_chain_feed_data)
+
+
+def collate_latest_timestamps(
+    on_chain_feed_data: Union[list | state_helper.FeedState],
+) -> dict:
     """Retrieve all the smallest intervals for all the feeds."""
-    res = {}
-    for item in on_chain_feed_data:
-        feed = get_feed_id(item[0]).upper()
-        on_chain_time = get_on_chain_time(item[1])
-        try:
-            res[feed] = on_chain_time if res[feed] < on_chain_time else res[feed]
-        except KeyError:
-            res[feed] = on_chain_time
-    logger.info("existing on-chain feeds to compare: %s", len(set(res)))
+    res = get_feed_state(on_chain_feed_data).latest_timestamps()
+    logger.info("existing on-chain feeds to compare: %s", len(res))
     return res
 
 
@@ -309,8 +216,6 @@ async def compare_hourly_intervals(
     required_feeds = []
     for feed, timestamp in latest_feed_timestamps.items():
         try:
-            if feed in required_feeds:
-                continue
             required = hour_baseline_delta(
                 now=curr_time,
                 latest=timestamp,
@@ -333,8 +238,6 @@ async def compare_direct_intervals(
     for feed, timestamp in latest_feed_timestamps.items():
         delta = get_delta(curr_time, timestamp)
         try:
-            if feed in required_feeds:
-                continue
             if intervals[feed] < delta:
                 logger.info(
                     "feed: '%s' out of date, delta: '%s', actual: '%s'",
@@ -350,7 +253,9 @@ async def compare_direct_intervals(
 
 
 async def compare_intervals(
-    intervals: dict, on_chain_feed_data: list, hour_boundary: bool = False
+    intervals: dict,
+    on_chain_feed_data: Union[list | state_helper.FeedState],
+    hour_boundary: bool = False,
 ) -> list:
     """Compare feed intervals with what we have on-chain and return a
     list of gaps.
@@ -361,19 +266,40 @@ async def compare_intervals(
     )
     if hour_boundary:
         logger.info("using the hour as a boundary")
-        required_feeds = await compare_hourly_intervals(
-            latest_feed_timestamps, curr_time, intervals
-        )
-        to_request = [feed.split("/", 1)[1] for feed in required_feeds]
-        return to_request
-    required_feeds = await compare_direct_intervals(
-        latest_feed_timestamps, curr_time, intervals
+    required_feeds, unmonitored = evaluate_helper.evaluate(
+        latest_feed_timestamps,
+        curr_time,
+        intervals,
+        hour_boundary,
+        INTERVAL_THRESHOLD,
     )
+    if unmonitored:
+        logger.info(
+            "feeds not being monitored: %s, %s",
+            len(unmonitored),
+            log_helper.sample(unmonitored),
+        )
+    if not hour_boundary:
+        for feed in required_feeds[: log_helper.LOG_SAMPLE_SIZE]:
+            logger.info(
+                "feed: '%s' out of date, delta: '%s', actual: '%s'",
+                feed,
+                get_delta(curr_time, latest_feed_timestamps[feed]),
+                latest_feed_timestamps[feed],
+            )
+        if len(required_feeds) > log_helper.LOG_SAMPLE_SIZE:
+            logger.info(
+                "feeds out of date: %s (%s not shown)",
+                len(required_feeds),
+                len(required_feeds) - log_helper.LOG_SAMPLE_SIZE,
+            )
     to_request = [feed.split("/", 1)[1] for feed in required_feeds]
     return to_request
 
 
-async def compare_gaps(feeds: dict, on_chain_data: list[list]) -> list:
+async def compare_gaps(
+    feeds: dict, on_chain_data: Union[list | state_helper.FeedState]
+) -> list:
     """Compare publication gaps based on label and not interval. These
     feeds need to be requested in any case.
 
@@ -381,109 +307,644 @@ async def compare_gaps(feeds: dict, on_chain_data: list[list]) -> list:
     will need to be modified to ignore inactive feeds at some point if
     the nomenclature is added.
     """
-    requested = []
-    on_chain = []
-    for feed in feeds.keys():
-        requested.append(feed)
-    for feed in on_chain_data:
-        on_chain.append(get_feed_id(feed[0]).upper())
-    feeds_missing = set(requested).difference(set(on_chain))
-    required = []
-    for item in feeds_missing:
-        required.append(item.split("/")[1])
-    return required
+    return get_feed_state(on_chain_data).gaps(feeds)
 
 
 async def remove_gaps(gaps: list, on_chain: list[list]) -> list[dict]:
     """Remove anything we absolutely need to publish from mainnet.
     The on-chain list is returned for interval comparison.
     """
-    for item in on_chain:
-        feed = item[0]
-        feed = get_feed_id(feed).upper().split("/")[1]
-        if feed not in gaps:
-            continue
-        on_chain.remove(item)
-    return on_chain
+    gaps = set(gaps)
+    return [item for item in on_chain if get_feed_id(item[0]).split("/")[1] not in gaps]
 
 
-async def pubwatch(
-    feeds_file: str,
-    local: bool = False,
-    nopublish: bool = False,
-    hour_boundary: bool = True,
-) -> None:
-    """Compare feed data with what should be published and request new
-    feeds to be put on-chain if they're missing.
+async def stream_feed_state(
+    kupo: kupo_helper.Kupo, fs_policy_id: str, observations: list = None
+) -> state_helper.FeedState:
+    """Return the state of the latest feed data streamed from Kupo, as
+    much of it as is retrieved before the deadline.
     """
-    _ = await get_slot()
-    feeds = await feed_helper.read_feeds_file(feeds_file=feeds_file)
-    fs_policy_id = await get_policy_from_fsp(
-        fsp_policy_id=FSP_POLICY, validity_token_name=VALIDITY_TOKEN
+    feed_state = state_helper.FeedState({}, observations=observations)
+    unspent = 0
+    batches = deadline_helper.until_deadline(
+        kupo_helper.stream_latest_feed_data(kupo, fs_policy_id), "matches"
     )
-    logger.info("policy: %s", fs_policy_id)
-    intervals = create_interval_dict(feeds=feeds, hour_boundary=hour_boundary)
-    on_chain_feed_data = await get_latest_feed_data(fs_policy_id=fs_policy_id)
-    logger.info("unspent datum: %s", len(on_chain_feed_data))
-    gaps = await compare_gaps(
-        intervals,
-        on_chain_feed_data,
+    try:
+        async for batch in batches:
+            feed_state.update(batch)
+            unspent += len(batch)
+    except deadline_helper.DeadlineExceeded as err:
+        logger.warning("continuing with partial feed data: %s", err)
+        timing_helper.count("deadline_truncated")
+        feed_state.complete = False
+    logger.info("unspent datum: %s", unspent)
+    return feed_state
+
+
+async def get_indexed_feed_state(
+    kupo: kupo_helper.Kupo,
+    target: target_helper.Target,
+    fs_policy_id: str,
+    slot: str,
+    observations: list = None,
+) -> state_helper.FeedState:
+    """Return the state of the latest feed data in the target's local
+    UTxO index, updated from Kupo unless the deadline is reached first.
+    """
+    index_path = os.path.join(
+        tempfile.gettempdir(), target.state_file(index_helper.UTXO_INDEX_FILE)
     )
-    on_chain_feed_data = await remove_gaps(gaps, on_chain_feed_data)
+    complete = True
+    with index_helper.UtxoIndex(index_path) as index:
+        try:
+            on_chain_feed_data = await deadline_helper.bounded(
+                kupo_helper.get_indexed_feed_data(
+                    kupo, index, fs_policy_id, checkpoint=int(slot)
+                ),
+                "matches",
+            )
+        except deadline_helper.DeadlineExceeded as err:
+            logger.warning("continuing with the index's feed data: %s", err)
+            timing_helper.count("deadline_truncated")
+            on_chain_feed_data = kupo_helper.read_indexed_feed_data(index)
+            complete = False
+    logger.info("unspent datum: %s", len(on_chain_feed_data))
+    feed_state = state_helper.FeedState({}, complete, observations)
+    feed_state.update(on_chain_feed_data)
+    return feed_state
+
+
+async def get_on_chain_feed_data(
+    context: run_helper.RunContext,
+    slot: str,
+    target: target_helper.Target = None,
+    archive: archive_helper.ObservationArchive = None,
+) -> state_helper.FeedState:
+    """Resolve the current fact statement policy of a target and return
+    the state of the latest feed data published under it.
+
+    If an archive is provided, the feed data retrieved under the
+    resolved policy is added to it and must be flushed by the caller.
+
+    If a policy has previously been resolved for the target, its feed
+    data is retrieved while the policy is checked so that resolving
+    the policy is kept off the critical path. The feed data is only
+    retrieved again if the policy has since changed.
+    """
+    target = target if target else default_target()
+    kupo = context.kupo(target)
+
+    async def _get_policy() -> str:
+        with timing_helper.stage("policy"):
+            return await deadline_helper.bounded(
+                kupo_helper.get_policy_from_fsp(
+                    kupo.session,
+                    fsp_policy_id=target.fsp_policy,
+                    validity_token_name=target.validity_token,
+                    kupo_url=target.kupo_url,
+                    policy_cache=context.policy_cache,
+                ),
+                "policy",
+            )
+
+    async def _get_feed_data(fs_policy_id: str) -> state_helper.FeedState:
+        # Observations are buffered rather than archived straight away
+        # as they may have been retrieved under a policy that has since
+        # changed.
+        observations = [] if archive is not None else None
+        if not context.config.incremental:
+            return await stream_feed_state(kupo, fs_policy_id, observations)
+        return await get_indexed_feed_state(
+            kupo, target, fs_policy_id, slot, observations
+        )
+
+    cached_policy_id = None
+    if context.policy_cache is not None:
+        cached_policy_id = context.policy_cache.peek(
+            kupo_helper.get_fsp_key(
+                target.fsp_policy, target.validity_token, target.kupo_url
+            )
+        )
+    if cached_policy_id is None:
+        fs_policy_id = await _get_policy()
+        feed_state = await _get_feed_data(fs_policy_id)
+    else:
+        fs_policy_id, feed_state = await asyncio.gather(
+            _get_policy(), _get_feed_data(cached_policy_id)
+        )
+        if fs_policy_id != cached_policy_id:
+            logger.info("policy changed from: %s", cached_policy_id)
+            feed_state = await _get_feed_data(fs_policy_id)
+    logger.info("policy: %s", fs_policy_id)
+    if archive is not None:
+        archive.add(feed_state.observations)
+        feed_state.observations = None
+    return feed_state
+
+
+async def get_pairs_to_request(
+    intervals: dict,
+    on_chain_feed_data: Union[list | state_helper.FeedState],
+    hour_boundary: bool,
+) -> list:
+    """Return the pairs that are missing on-chain or out of date.
+
+    If the feed data is incomplete, feeds not seen aren't requested as
+    they may still be on-chain.
+    """
+    feed_state = get_feed_state(on_chain_feed_data)
+    gaps = []
+    if feed_state.complete:
+        gaps = await compare_gaps(intervals, feed_state)
+    else:
+        logger.warning(
+            "feed data incomplete, not requesting unseen feeds: %s",
+            len(feed_state.gaps(intervals)),
+        )
     pairs_to_request = await compare_intervals(
-        intervals, on_chain_feed_data, hour_boundary
+        intervals, feed_state.without(gaps), hour_boundary
     )
-    if not gaps and not pairs_to_request:
-        logger.info("no new pairs needed on-chain...")
-        return
-    pairs_to_request = pairs_to_request + gaps
-    logger.info("we need to request the following feeds: %s", pairs_to_request)
-    req = json.dumps({"feeds": pairs_to_request})
-    if nopublish:
-        logger.info("not publishing, returning from script...")
-        return
-    await request_new_prices(req, local)
+    return pairs_to_request + gaps
 
 
-def main():
-    """Primary entry point of this script."""
-    parser = argparse.ArgumentParser(
-        prog="pubwatch",
-        description="inspects prices on-chain and looks for anything not posted at the top of the last hour and publishes it",
-        epilog="for more information visit https://orcfax.io",
+async def get_deviated_pairs(
+    session: aiohttp.ClientSession,
+    reference,
+    deviations: dict,
+    on_chain_feed_data: Union[list | state_helper.FeedState],
+) -> list:
+    """Return the pairs whose latest on-chain value has deviated from
+    its reference price by more than the feed's deviation. Errors
+    retrieving reference prices are logged and nothing is returned.
+    """
+    import aiohttp
+
+    try:
+        prices = await deadline_helper.bounded(
+            reference.get_prices(session), "reference"
+        )
+    except (
+        aiohttp.ClientError,
+        asyncio.TimeoutError,
+        OSError,
+        ValueError,
+        deadline_helper.DeadlineExceeded,
+    ) as err:
+        logger.error("error retrieving reference prices: %s", err)
+        return []
+    deviated = deviation_helper.get_deviated(
+        get_feed_state(on_chain_feed_data).latest, prices, deviations
     )
-    parser.add_argument(
-        "--local",
-        help="run code locally without ssl",
-        required=False,
-        action="store_true",
+    if deviated:
+        logger.info(
+            "feeds deviated from reference (bps): %s",
+            log_helper.sample(f"{pair} ({bps})" for pair, bps in deviated.items()),
+        )
+    timing_helper.count("feeds_deviated", len(deviated))
+    return list(deviated)
+
+
+def merge_pairs(pairs_to_request: list, deviated: list) -> list:
+    """Return the pairs to request with deviated pairs not already
+    among them.
+    """
+    requested = set(pairs_to_request)
+    return pairs_to_request + [pair for pair in deviated if pair not in requested]
+
+
+def get_pair_feed_ids(intervals: dict) -> dict:
+    """Return the feed ID of each monitored pair."""
+    return {feed_id.split("/", 1)[1]: feed_id for feed_id in intervals}
+
+
+def get_pair_timestamps(
+    on_chain_feed_data: Union[list | state_helper.FeedState],
+) -> dict:
+    """Return the latest on-chain time of each pair in seconds."""
+    return {
+        feed_id.split("/", 1)[1]: timestamp
+        for feed_id, timestamp in get_feed_state(on_chain_feed_data)
+        .latest_timestamps()
+        .items()
+    }
+
+
+def get_pending_ttls(intervals: dict) -> dict:
+    """Return how long a request for each pair remains pending.
+
+    Intervals are less the interval threshold unless runs are aligned to
+    the hour boundary, so the threshold is added back to make sure the
+    request outlasts the feed's whole interval.
+    """
+    return {
+        feed.split("/", 1)[1]: ledger_helper.get_ttl(
+            interval + INTERVAL_THRESHOLD, INTERVAL_THRESHOLD
+        )
+        for feed, interval in intervals.items()
+    }
+
+
+def get_request_timeouts(intervals: dict) -> dict:
+    """Return how long each pair has to be published once requested
+    before the request is considered unfulfilled.
+    """
+    return {
+        feed.split("/", 1)[1]: interval + INTERVAL_THRESHOLD
+        for feed, interval in intervals.items()
+    }
+
+
+def claim_pairs(
+    ledger: ledger_helper.PendingLedger,
+    pairs_to_request: list,
+    intervals: dict,
+    on_chain: dict,
+) -> list:
+    """Record pairs as pending in the ledger and return those that
+    haven't already been requested.
+    """
+    ttls = get_pending_ttls(intervals)
+    return ledger.claim(
+        pairs_to_request,
+        int(time.time()),
+        {pair: ttls.get(pair, INTERVAL_THRESHOLD) for pair in pairs_to_request},
+        on_chain,
     )
-    parser.add_argument(
-        "--feeds",
-        help="feed data describing feeds being monitored (CER-feeds (JSON))",
-        required=True,
+
+
+def track_latency(
+    tracker: latency_helper.LatencyTracker,
+    on_chain_feed_data: Union[list | state_helper.FeedState],
+) -> None:
+    """Match earlier requests against the feed data on-chain and
+    observe the publication latency of those fulfilled. Nothing is
+    observed from incomplete feed data.
+    """
+    feed_state = get_feed_state(on_chain_feed_data)
+    if not feed_state.complete:
+        return
+    fulfilled, unfulfilled = tracker.observe(
+        get_pair_timestamps(feed_state), int(time.time())
     )
-    parser.add_argument(
-        "--nopublish",
-        help="provide a way of running this script's logic without publishing",
-        required=False,
-        action="store_true",
+    for pair, latency in fulfilled:
+        timing_helper.observe("publication_latency", pair, latency)
+    if fulfilled:
+        logger.info(
+            "feeds published after request: %s",
+            log_helper.sample(f"{pair} ({latency}s)" for pair, latency in fulfilled),
+        )
+    timing_helper.count("requests_fulfilled", len(fulfilled))
+    timing_helper.count("requests_unfulfilled", len(unfulfilled))
+
+
+async def publish(  # pylint: disable=R0913
+    pairs_to_request: list,
+    config: run_helper.RunConfig,
+    client: validator_helper.ValidatorClient = None,
+    ledger: ledger_helper.PendingLedger = None,
+    intervals: dict = None,
+    on_chain_feed_data: Union[list | state_helper.FeedState] = None,
+    tracker: latency_helper.LatencyTracker = None,
+) -> list:
+    """Request new prices for the given pairs from the validator and
+    return the pairs requested.
+
+    If a ledger is provided, pairs already pending are not requested
+    again. If a tracker is provided, requests are recorded so that
+    their publication latency can be tracked. `intervals` and
+    `on_chain_feed_data` are then used to determine how long requests
+    remain pending and have to be published.
+    """
+    if not pairs_to_request:
+        logger.info("no new pairs needed on-chain...")
+        return []
+    on_chain = {}
+    if ledger is not None or tracker is not None:
+        on_chain = get_pair_timestamps(on_chain_feed_data)
+    if ledger is not None and not config.nopublish:
+        pairs_to_request = claim_pairs(ledger, pairs_to_request, intervals, on_chain)
+        if not pairs_to_request:
+            logger.info("all pairs needed on-chain already requested...")
+            return []
+    logger.info("we need to request the following feeds: %s", pairs_to_request)
+    timing_helper.count("feeds_requested", len(pairs_to_request))
+    if config.nopublish:
+        logger.info("not publishing, returning from script...")
+        return pairs_to_request
+    with timing_helper.stage("validator"):
+        if client is not None:
+            request = client.request_feeds(pairs_to_request)
+        else:
+            req = json.dumps({"feeds": pairs_to_request})
+            request = request_new_prices(req, config.local, client)
+        try:
+            res = await deadline_helper.bounded(request, "publish")
+        except (
+            deadline_helper.DeadlineExceeded,
+            validator_helper.InvalidValidatorURI,
+        ):
+            if ledger is not None:
+                ledger.release(pairs_to_request)
+            raise
+    if res is None:
+        if ledger is not None:
+            ledger.release(pairs_to_request)
+        return pairs_to_request
+    if tracker is not None:
+        timeouts = get_request_timeouts(intervals)
+        tracker.record(
+            pairs_to_request,
+            int(time.time()),
+            {pair: timeouts.get(pair, INTERVAL_THRESHOLD) for pair in pairs_to_request},
+            on_chain,
+        )
+    return pairs_to_request
+
+
+def get_ledger_path(
+    target: target_helper.Target, shard: shard_helper.ShardCoordinator = None
+) -> str:
+    """Return the location of a target's pending request ledger, shared
+    by every instance if feeds are sharded.
+    """
+    filename = target.state_file(ledger_helper.PENDING_LEDGER_FILE)
+    if shard is not None:
+        return shard.path(filename)
+    return ledger_helper.default_ledger_path(filename)
+
+
+def get_shard_feed_state(
+    shard: shard_helper.ShardCoordinator,
+    on_chain_feed_data: Union[list | state_helper.FeedState],
+) -> state_helper.FeedState:
+    """Return the feed state of the feeds assigned to this instance."""
+    feed_state = get_feed_state(on_chain_feed_data)
+    return state_helper.FeedState(shard.select(feed_state.latest), feed_state.complete)
+
+
+def default_target(feeds_file: str = "", reference: str = "") -> target_helper.Target:
+    """Return the target configured by environment variables."""
+    return target_helper.Target(
+        name=target_helper.DEFAULT_TARGET,
+        kupo_url=KUPO_URL if KUPO_URL else "",
+        fsp_policy=FSP_POLICY if FSP_POLICY else "",
+        validity_token=VALIDITY_TOKEN if VALIDITY_TOKEN else "",
+        validator=VALIDATOR_URI if VALIDATOR_URI else "",
+        feeds=feeds_file,
+        reference=reference if reference else "",
     )
-    parser.add_argument(
-        "--hour-boundary",
-        help="use an hourly boundary for publication",
-        required=False,
-        action="store_true",
+
+
+async def get_target_feed_data(
+    context: run_helper.RunContext, target: target_helper.Target, slot: str
+) -> state_helper.FeedState:
+    """Return the state of a target's feed data, archiving the feed
+    data observed if the run has an archive directory.
+    """
+    archive = archive_helper.open_archive(
+        context.config.archive_dir, target.state_file(archive_helper.ARCHIVE_FILE)
     )
-    args = parser.parse_args()
-    asyncio.run(
-        pubwatch(
-            feeds_file=args.feeds,
-            local=args.local,
-            nopublish=args.nopublish,
-            hour_boundary=args.hour_boundary,
+    try:
+        feed_state = await get_on_chain_feed_data(context, slot, target, archive)
+        if archive is not None:
+            with timing_helper.stage("archive"):
+                archive.flush()
+    finally:
+        if archive is not None:
+            archive.close()
+    return feed_state
+
+
+async def get_target_pairs(
+    context: run_helper.RunContext,
+    target: target_helper.Target,
+    intervals: dict,
+    feed_state: state_helper.FeedState,
+) -> list:
+    """Return the pairs of a target that are missing on-chain or out of
+    date and, if the target has a reference source, those that have
+    deviated from their reference price.
+    """
+    with timing_helper.stage("comparison"):
+        pairs_to_request = await get_pairs_to_request(
+            intervals, feed_state, context.config.hour_boundary
         )
+    reference = deviation_helper.open_reference_source(target.reference)
+    if reference is None:
+        return pairs_to_request
+    with timing_helper.stage("deviation"):
+        return merge_pairs(
+            pairs_to_request,
+            await get_deviated_pairs(
+                context.session, reference, load_deviations(target.feeds), feed_state
+            ),
+        )
+
+
+async def check_target(
+    context: run_helper.RunContext,
+    validators: validator_helper.ValidatorPool,
+    target: target_helper.Target,
+) -> list:
+    """Compare the feed data of a target with what should be published,
+    request any missing feeds and return their pairs.
+    """
+    with timing_helper.stage("slot"):
+        _, slot = await deadline_helper.bounded(
+            get_slot(context.session, target.kupo_url, target.state_file(SLOTFILE)),
+            "slot",
+        )
+    with timing_helper.stage("feeds"):
+        intervals = load_intervals(target.feeds, context.config.hour_boundary)
+        if context.shard is not None:
+            intervals = context.shard.select(intervals)
+    feed_state = await get_target_feed_data(context, target, slot)
+    with latency_helper.LatencyTracker(
+        latency_helper.default_latency_path(
+            target.state_file(latency_helper.LATENCY_FILE)
+        )
+    ) as tracker:
+        with timing_helper.stage("latency"):
+            track_latency(tracker, feed_state)
+        if context.shard is not None:
+            feed_state = get_shard_feed_state(context.shard, feed_state)
+        pairs_to_request = await get_target_pairs(
+            context, target, intervals, feed_state
+        )
+        with timing_helper.stage("publish"):
+            ledger = None
+            if context.config.pending_ledger:
+                ledger = ledger_helper.PendingLedger(
+                    get_ledger_path(target, context.shard)
+                )
+            try:
+                return await publish(
+                    pairs_to_request,
+                    context.config,
+                    validators.get(target.validation_request_uri),
+                    ledger,
+                    intervals,
+                    feed_state,
+                    tracker,
+                )
+            finally:
+                if ledger is not None:
+                    ledger.close()
+
+
+async def pubwatch_target(
+    context: run_helper.RunContext,
+    validators: validator_helper.ValidatorPool,
+    target: target_helper.Target,
+) -> list:
+    """Compare the feed data of a single target with what should be
+    published, request any missing feeds and return their pairs.
+
+    With the `pending_ledger` option, pairs already requested by an
+    earlier run are not requested again until their request expires or
+    a new datum is published. With `archive_dir`, the feed data
+    observed is archived there. If the target has a reference source,
+    feeds that have deviated from their reference price are also
+    requested. With a shard, only the feeds assigned to this instance
+    are compared.
+
+    A target is only checked by one run at a time. If another run is
+    still checking it, or a stage can't complete before the run's
+    deadline, nothing is requested.
+    """
+    run_lock = lock_helper.RunLock(
+        lock_helper.default_lock_path(target.state_file(lock_helper.LOCK_FILE))
     )
+    run_deadline = deadline_helper.get_deadline()
+    # A run without a deadline holds the lock until it exits.
+    expires = None
+    if run_deadline is not None:
+        expires = time.time() + run_deadline.remaining()
+    if not run_lock.acquire(expires):
+        logger.warning("target '%s' is being checked by another run", target.name)
+        timing_helper.count("runs_overlapped")
+        return []
+    try:
+        return await check_target(context, validators, target)
+    except deadline_helper.DeadlineExceeded as err:
+        logger.error("target '%s' ran out of time: %s", target.name, err)
+        timing_helper.count("deadline_exceeded")
+        return []
+    finally:
+        run_lock.release()
+
+
+async def pubwatch(
+    config: run_helper.RunConfig = None, targets: list[target_helper.Target] = None
+) -> dict:
+    """Compare feed data with what should be published and request new
+    feeds to be put on-chain if they're missing.
+
+    Without `targets` the target configured by environment variables
+    is monitored using the feeds file and reference prices of the
+    config, if given, and any error is raised. Otherwise all targets
+    are monitored concurrently, sharing connections to Kupo and the
+    validator, and an error in one target doesn't affect the others.
+
+    With the `deadline` option, the run is given until the interval
+    threshold before the next hour (with `hour_boundary`) to complete,
+    at most `deadline_helper.MAX_RUN_BUDGET` seconds. Feeds are
+    compared using whatever feed data has been retrieved by the time
+    the budget for retrieving it runs out.
+
+    With `shard_dir`, feeds are split between the instances holding a
+    lease in that directory and only those assigned to `instance_id`
+    are compared. The lease lasts `shard_lease` seconds so that it is
+    held until the next run.
+
+    The pairs requested, or the error, are returned by target name.
+    """
+    config = config if config else run_helper.RunConfig()
+    isolated = targets is not None
+    if not isolated:
+        targets = [default_target(config.feeds_file, config.reference)]
+    run_deadline = None
+    if config.deadline:
+        run_deadline = deadline_helper.Deadline(
+            deadline_helper.run_budget(
+                time.time(), config.hour_boundary, INTERVAL_THRESHOLD
+            )
+        )
+    with timing_helper.stage("run"), deadline_helper.deadline(run_deadline):
+        context = run_helper.open_context(config, config.shard_lease)
+        try:
+            if context.shard is not None:
+                with timing_helper.stage("shard"):
+                    context.shard.heartbeat(int(time.time()))
+            # Only requests from several targets can be coalesced.
+            coalesce_window = (
+                validator_helper.COALESCE_WINDOW if len(targets) > 1 else 0
+            )
+            async with kupo_helper.create_kupo_session(
+                concurrency=config.concurrency
+            ) as session, validator_helper.ValidatorPool(
+                config.local, coalesce_window
+            ) as validators:
+                context.session = session
+                results = await asyncio.gather(
+                    *[
+                        pubwatch_target(context, validators, target)
+                        for target in targets
+                    ],
+                    return_exceptions=isolated,
+                )
+        finally:
+            context.close()
+    for target, result in zip(targets, results):
+        if isinstance(result, Exception):
+            logger.error("target '%s' failed: %s", target.name, result)
+            continue
+        if isolated:
+            logger.info("target '%s' requested: %s", target.name, result)
+    return {target.name: result for target, result in zip(targets, results)}
+
+
+def run(main_coroutine) -> None:
+    """Run pubwatch until it completes, exiting with an error if the
+    validator isn't configured.
+    """
+    try:
+        asyncio.run(main_coroutine)
+    except validator_helper.InvalidValidatorURI as err:
+        logger.error(
+            "ensure 'ORCFAX_VALIDATOR' environment variable is set: %s (`export ORCFAX_VALIDATOR=wss://`)",
+            err,
+        )
+        sys.exit(1)
+
+
+def main():
+    """Primary entry point of this script."""
+    parser = cli_helper.get_parser()
+    args = parser.parse_args()
+    setup_logging(json_format=args.log_format == "json")
+    if not args.feeds and not args.targets:
+        parser.error("one of --feeds or --targets is required")
+    if args.targets and args.daemon:
+        parser.error("--targets is not supported in daemon mode")
+    config = cli_helper.get_run_config(args)
+    metrics = None
+    if args.metrics_textfile or args.metrics_port:
+        metrics = metrics_helper.Metrics()
+    if args.daemon:
+        from . import daemon
+
+        run(daemon.pubwatch_daemon(config, metrics))
+        return
+    targets = None
+    if args.targets:
+        targets = target_helper.read_targets_file(args.targets)
+    try:
+        with timing_helper.timing(metrics):
+            run(pubwatch(config, targets))
+    finally:
+        if args.metrics_textfile:
+            metrics.write_textfile(args.metrics_textfile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,263 @@
+"""Replay recorded on-chain feed data against pubwatch's comparison
+modes.
+
+A virtual clock is advanced over the history of every feed, e.g. from
+an archive written with `--archive-dir`, and the feeds pubwatch would
+have requested at every tick are reported for each boundary mode and
+interval threshold. The latest on-chain time of every feed at every
+tick is looked up in one vectorized pass so that a year of hourly ticks
+can be replayed in seconds.
+
+Requests are replayed against what was actually published, i.e. a
+replayed request doesn't cause a publication, so a feed keeps being
+requested at every tick until it was published in the history.
+
+```sh
+pubwatch-replay --feeds cer-feeds.json --history pubwatch_archive.sqlite \\
+    --start 2024-01-01 --end 2025-01-01 --threshold 60 120 300
+```
+"""
+
+# pylint: disable=R0913,R0914,C0415
+
+import argparse
+import dataclasses
+import json
+import logging
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Final
+
+from . import archive_helper, evaluate_helper, feed_helper, state_helper
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Default tick of the virtual clock, i.e. an hourly cron run.
+REPLAY_STEP: Final[int] = 3600
+
+
+@dataclasses.dataclass(frozen=True)
+class ReplayResult:
+    """Requests that would have been sent by one comparison mode."""
+
+    hour_boundary: bool
+    threshold: int
+    ticks: int
+    requests: int
+    messages: int
+    by_feed: dict
+    times: list
+
+    def summary(self) -> dict:
+        """Return the result without the time of every request."""
+        return {
+            "hour_boundary": self.hour_boundary,
+            "threshold": self.threshold,
+            "ticks": self.ticks,
+            "requests": self.requests,
+            "messages": self.messages,
+            "by_feed": self.by_feed,
+        }
+
+
+def load_history(path: str) -> dict:
+    """Return the on-chain times of each feed in seconds, sorted, from
+    an archive or a JSON array of unwrapped datum lists.
+    """
+    if path.endswith((".sqlite", ".db")):
+        with archive_helper.ObservationArchive(path) as archive:
+            return archive.history()
+    with open(path, "r", encoding="utf-8") as history_file:
+        data = json.load(history_file)
+    history = {}
+    for item in data:
+        observation = state_helper.as_observation(item)
+        history.setdefault(observation.feed_id, []).append(
+            observation.timestamp // 1000
+        )
+    return {feed_id: sorted(times) for feed_id, times in history.items()}
+
+
+def latest_at(history: dict, feeds: list, ticks: "np.ndarray") -> "np.ndarray":
+    """Return the latest on-chain time of each feed at each tick, with
+    `evaluate_helper.UNMONITORED` where a feed had not been published.
+    """
+    import numpy as np
+
+    latest = np.full((len(feeds), len(ticks)), evaluate_helper.UNMONITORED)
+    for row, feed in enumerate(feeds):
+        times = np.asarray(history.get(feed, []), dtype=np.int64)
+        if not times.size:
+            continue
+        idx = np.searchsorted(times, ticks, side="right") - 1
+        published = idx >= 0
+        latest[row, published] = times[idx[published]]
+    return latest
+
+
+def hour_boundaries(ticks: "np.ndarray", windows: "np.ndarray") -> "np.ndarray":
+    """Return the hourly boundary of each feed at each tick."""
+    import numpy as np
+
+    unique_windows, inverse = np.unique(windows, return_inverse=True)
+    boundaries = np.array(
+        [
+            [
+                evaluate_helper.previous_hour_timestamp(int(tick), int(window))
+                for tick in ticks
+            ]
+            for window in unique_windows
+        ],
+        dtype=np.int64,
+    )
+    return boundaries[inverse.reshape(-1)]
+
+
+def due_at(
+    latest: "np.ndarray",
+    ticks: "np.ndarray",
+    windows: "np.ndarray",
+    boundaries: "np.ndarray",
+    hour_boundary: bool,
+    threshold: int,
+) -> "np.ndarray":
+    """Return a mask of the feeds due at each tick, using the same
+    comparisons as a live run. Feeds not yet published are always due.
+    """
+    import numpy as np
+
+    missing = latest == evaluate_helper.UNMONITORED
+    if hour_boundary:
+        due = (latest + threshold) < boundaries
+    else:
+        age = np.abs(ticks[None, :] - np.where(missing, 0, latest))
+        due = (windows - threshold)[:, None] < age
+    return due | missing
+
+
+def replay(
+    history: dict,
+    intervals: dict,
+    start: int,
+    end: int,
+    step: int = REPLAY_STEP,
+    modes: tuple = ((True, 120), (False, 120)),
+) -> list[ReplayResult]:
+    """Replay history from `start` to `end` and return the requests
+    each `(hour_boundary, threshold)` mode would have sent.
+
+    `intervals` are the intervals of the monitored feeds, without a
+    threshold, by feed ID.
+    """
+    import numpy as np
+
+    feeds = sorted(intervals)
+    ticks = np.arange(start, end + 1, step, dtype=np.int64)
+    latest = latest_at(history, feeds, ticks)
+    windows = np.fromiter(
+        (intervals[feed] for feed in feeds), dtype=np.int64, count=len(feeds)
+    )
+    boundaries = None
+    if any(hour_boundary for hour_boundary, _ in modes):
+        boundaries = hour_boundaries(ticks, windows)
+    results = []
+    for hour_boundary, threshold in modes:
+        due = due_at(latest, ticks, windows, boundaries, hour_boundary, threshold)
+        per_feed = due.sum(axis=1)
+        per_tick = due.any(axis=0)
+        times = [
+            (int(ticks[col]), [feeds[row] for row in np.flatnonzero(due[:, col])])
+            for col in np.flatnonzero(per_tick)
+        ]
+        results.append(
+            ReplayResult(
+                hour_boundary=hour_boundary,
+                threshold=threshold,
+                ticks=len(ticks),
+                requests=int(per_feed.sum()),
+                messages=int(per_tick.sum()),
+                by_feed={
+                    feed: int(count) for feed, count in zip(feeds, per_feed) if count
+                },
+                times=times,
+            )
+        )
+    return results
+
+
+def parse_time(value: str) -> int:
+    """Parse a unix timestamp or ISO 8601 date/time."""
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp())
+
+
+def main():
+    """Primary entry point of the replay command."""
+    parser = argparse.ArgumentParser(
+        prog="pubwatch-replay",
+        description="replays recorded on-chain feed data and reports the requests pubwatch would have sent",
+        epilog="for more information visit https://orcfax.io",
+    )
+    parser.add_argument(
+        "--feeds",
+        help="feed data describing feeds being monitored (CER-feeds (JSON))",
+        required=True,
+    )
+    parser.add_argument(
+        "--history",
+        help="archive (.sqlite) or JSON array of on-chain datum to replay",
+        required=True,
+    )
+    parser.add_argument(
+        "--start", help="unix time or ISO date to start from", required=True
+    )
+    parser.add_argument("--end", help="unix time or ISO date to end at (default: now)")
+    parser.add_argument(
+        "--step",
+        help="seconds between ticks of the virtual clock",
+        type=int,
+        default=REPLAY_STEP,
+    )
+    parser.add_argument(
+        "--threshold",
+        help="interval thresholds to replay",
+        type=int,
+        nargs="+",
+        default=[120],
+    )
+    parser.add_argument(
+        "--times",
+        help="include the time and feeds of every request in the output",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level="INFO")
+    intervals = feed_helper.load_feeds(args.feeds, 0).intervals(True)
+    history = load_history(args.history)
+    end = parse_time(args.end) if args.end else int(time.time())
+    modes = tuple(
+        (hour_boundary, threshold)
+        for hour_boundary in (True, False)
+        for threshold in args.threshold
+    )
+    started = time.perf_counter()
+    results = replay(history, intervals, parse_time(args.start), end, args.step, modes)
+    logger.info("replayed in: %.2fs", time.perf_counter() - started)
+    print(
+        json.dumps(
+            [
+                dataclasses.asdict(result) if args.times else result.summary()
+                for result in results
+            ],
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
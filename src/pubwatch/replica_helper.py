@@ -0,0 +1,278 @@
+"""Helpers for spreading Kupo requests across replicas.
+
+A Kupo URL may list several replicas separated by commas. Requests go
+to the fastest healthy replica. If it hasn't responded by the time its
+latency for the endpoint reaches a high percentile, the request is
+also sent to the next replica and the first response wins. Replicas
+that fail are backed off and the request fails over to the next one.
+
+The checkpoint of every replica is checked before a run. Replicas
+whose index lags more than a few blocks behind the most recent
+checkpoint are only used once the up-to-date replicas have failed.
+
+A single URL is requested directly, without hedging.
+"""
+
+# pylint: disable=R0914,C0415
+
+import asyncio
+import collections
+import logging
+import time
+from typing import Awaitable, Callable, Final, Optional
+
+from . import timing_helper
+
+logger = logging.getLogger(__name__)
+
+# Latency percentile of a replica after which a request is hedged.
+HEDGE_PERCENTILE: Final[float] = 0.95
+
+# Seconds to wait before hedging until enough latencies are known.
+HEDGE_DELAY: Final[float] = 2.0
+HEDGE_MIN_SAMPLES: Final[int] = 10
+
+# Number of latencies kept per replica and endpoint.
+LATENCY_WINDOW: Final[int] = 200
+
+# Seconds a failed replica is avoided for.
+REPLICA_BACKOFF: Final[int] = 30
+
+# Slots a replica's checkpoint may lag the most recent checkpoint by,
+# about three blocks.
+REPLICA_MAX_LAG: Final[int] = 60
+
+
+class ReplicaError(Exception):
+    """Raised when no Kupo replica can be used."""
+
+
+def split_urls(kupo_url: str) -> list[str]:
+    """Return the URLs of the replicas in a Kupo URL."""
+    return [url.strip().rstrip("/") for url in kupo_url.split(",") if url.strip()]
+
+
+def is_replica_error(err: BaseException) -> bool:
+    """Return true if an error is the fault of the replica rather than
+    the request, i.e. the request should be tried elsewhere.
+    """
+    import aiohttp
+
+    if isinstance(err, aiohttp.ClientResponseError):
+        return err.status >= 500
+    return isinstance(err, (aiohttp.ClientError, asyncio.TimeoutError, OSError))
+
+
+class Replica:
+    """Health and latency of a single Kupo replica."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.checkpoint = None
+        self.latencies = {}
+        self.failed_until = 0.0
+
+    def observe(self, endpoint: str, seconds: float) -> None:
+        """Record the latency of a successful request."""
+        if endpoint not in self.latencies:
+            self.latencies[endpoint] = collections.deque(maxlen=LATENCY_WINDOW)
+        self.latencies[endpoint].append(seconds)
+        self.failed_until = 0.0
+
+    def fail(self) -> None:
+        """Avoid the replica for a while."""
+        self.failed_until = time.monotonic() + REPLICA_BACKOFF
+
+    @property
+    def available(self) -> bool:
+        """Return true if the replica isn't being avoided."""
+        return time.monotonic() >= self.failed_until
+
+    def percentile(self, endpoint: str, percentile: float) -> Optional[float]:
+        """Return a percentile of the replica's latency for an
+        endpoint, if enough latencies are known.
+        """
+        latencies = self.latencies.get(endpoint, ())
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+
+class ReplicaSet:
+    """Kupo replicas that requests can be sent to."""
+
+    def __init__(
+        self,
+        urls: list[str],
+        hedge_percentile: float = HEDGE_PERCENTILE,
+        max_lag: int = REPLICA_MAX_LAG,
+    ):
+        if not urls:
+            raise ReplicaError("no kupo url given")
+        self.replicas = [Replica(url) for url in urls]
+        self.hedge_percentile = hedge_percentile
+        self.max_lag = max_lag
+        self.checkpoint = None
+
+    def lagging(self, replica: Replica) -> bool:
+        """Return true if a replica is behind the latest checkpoint."""
+        if self.checkpoint is None:
+            return False
+        if replica.checkpoint is None:
+            return True
+        return replica.checkpoint < self.checkpoint - self.max_lag
+
+    def candidates(self, endpoint: str) -> tuple[list[Replica], list[Replica]]:
+        """Return the replicas that are up to date, available ones
+        first, fastest first, and the replicas lagging behind them to
+        fall back to, closest first.
+        """
+        current = [replica for replica in self.replicas if not self.lagging(replica)]
+        lagging = [
+            replica
+            for replica in self.replicas
+            if self.lagging(replica) and replica.checkpoint is not None
+        ]
+        if not current and not lagging:
+            raise ReplicaError("no kupo replica has a known checkpoint")
+        current.sort(
+            key=lambda replica: (
+                not replica.available,
+                replica.percentile(endpoint, 0.5) or 0,
+            ),
+        )
+        lagging.sort(key=lambda replica: (not replica.available, -replica.checkpoint))
+        return current, lagging
+
+    def hedge_delay(self, replica: Replica, endpoint: str) -> float:
+        """Return how long to wait for a replica before hedging."""
+        delay = replica.percentile(endpoint, self.hedge_percentile)
+        return HEDGE_DELAY if delay is None else delay
+
+    async def check_health(self, get_checkpoint: Callable[[str], Awaitable]) -> int:
+        """Update the checkpoint of every replica and return the most
+        recent.
+        """
+        if len(self.replicas) == 1:
+            self.checkpoint = int(await get_checkpoint(self.replicas[0].url))
+            self.replicas[0].checkpoint = self.checkpoint
+            return self.checkpoint
+        results = await asyncio.gather(
+            *[get_checkpoint(replica.url) for replica in self.replicas],
+            return_exceptions=True,
+        )
+        errors = []
+        for replica, result in zip(self.replicas, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    "kupo replica '%s' is unhealthy: %s", replica.url, result
+                )
+                replica.checkpoint = None
+                replica.fail()
+                errors.append(result)
+                continue
+            replica.checkpoint = int(result)
+        known = [r.checkpoint for r in self.replicas if r.checkpoint is not None]
+        if not known:
+            raise errors[0]
+        self.checkpoint = max(known)
+        for replica in self.replicas:
+            if replica.checkpoint is not None and self.lagging(replica):
+                logger.warning(
+                    "kupo replica '%s' is behind: %s < %s",
+                    replica.url,
+                    replica.checkpoint,
+                    self.checkpoint,
+                )
+        return self.checkpoint
+
+    async def request(
+        self,
+        fetch: Callable[[str], Awaitable],
+        endpoint: str,
+        discard: Callable = None,
+    ):
+        """Call `fetch` with the URL of a replica and return its result.
+
+        The request is hedged on a second replica if the first is slow
+        and fails over to the next replica if one fails. Results that
+        lose a hedge are passed to `discard`, e.g. to release a
+        response. Lagging replicas are only failed over to, never
+        hedged on.
+        """
+        if len(self.replicas) == 1:
+            return await fetch(self.replicas[0].url)
+        current, lagging = self.candidates(endpoint)
+        candidates = current + lagging
+        pending = {}
+        errors = []
+        hedged = False
+
+        async def _fetch(replica: Replica):
+            start = time.perf_counter()
+            result = await fetch(replica.url)
+            replica.observe(endpoint, time.perf_counter() - start)
+            return result
+
+        def _launch() -> Replica:
+            replica = candidates[len(pending) + len(errors)]
+            pending[asyncio.ensure_future(_fetch(replica))] = replica
+            return replica
+
+        primary = _launch()
+        try:
+            while pending:
+                timeout = None
+                if not hedged and len(pending) + len(errors) < len(current):
+                    timeout = self.hedge_delay(primary, endpoint)
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    timing_helper.count("kupo_hedged")
+                    logger.info("hedging slow kupo replica: %s", primary.url)
+                    _launch()
+                    continue
+                for task in done:
+                    replica = pending.pop(task)
+                    err = task.exception()
+                    if err is None:
+                        return task.result()
+                    if not is_replica_error(err):
+                        raise err
+                    logger.warning("kupo replica '%s' failed: %s", replica.url, err)
+                    replica.fail()
+                    errors.append(err)
+                if not pending and len(errors) < len(candidates):
+                    timing_helper.count("kupo_failover")
+                    primary = _launch()
+                    if primary in lagging:
+                        logger.warning(
+                            "falling back to lagging kupo replica: %s", primary.url
+                        )
+            raise errors[-1]
+        finally:
+            for task in pending:
+                task.cancel()
+                if discard is not None:
+                    task.add_done_callback(
+                        lambda task: (
+                            discard(task.result())
+                            if not task.cancelled() and task.exception() is None
+                            else None
+                        )
+                    )
+
+
+replica_sets: dict = {}
+
+
+def get_replicas(kupo_url: str) -> ReplicaSet:
+    """Return the replica set of a Kupo URL, keeping replica health
+    and latency for the life of the process.
+    """
+    if kupo_url not in replica_sets:
+        replica_sets[kupo_url] = ReplicaSet(split_urls(kupo_url or ""))
+    return replica_sets[kupo_url]
@@ -0,0 +1,93 @@
+"""Helpers for describing a run of pubwatch.
+
+The options a run is given, e.g. from the command line, are kept
+together in a `RunConfig`. The connections and caches shared by the
+targets checked in a run, or by every poll of the daemon, are kept
+together with the options in a `RunContext`.
+"""
+
+# pylint: disable=R0902
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Final
+
+from . import cache_helper, kupo_helper, shard_helper
+
+if TYPE_CHECKING:
+    import aiohttp
+
+    from . import target_helper
+
+# Daemon mode settings. The poll interval determines how often Kupo is
+# checked for new blocks and is roughly Cardano's average block time.
+DAEMON_POLL_INTERVAL: Final[int] = 20
+
+
+@dataclass
+class RunConfig:
+    """Options of a run of pubwatch. Options after `shard_lease` only
+    apply in daemon mode.
+    """
+
+    feeds_file: str = None
+    local: bool = False
+    nopublish: bool = False
+    hour_boundary: bool = True
+    concurrency: int = kupo_helper.KUPO_CONCURRENCY
+    datum_cache: bool = True
+    incremental: bool = False
+    pending_ledger: bool = True
+    archive_dir: str = None
+    deadline: bool = True
+    reference: str = None
+    shard_dir: str = None
+    instance_id: str = None
+    shard_lease: int = shard_helper.SHARD_LEASE
+    poll_interval: int = DAEMON_POLL_INTERVAL
+    metrics_port: int = None
+    metrics_textfile: str = None
+
+
+@dataclass
+class RunContext:
+    """The options of a run and the connections and caches shared by
+    the targets it checks.
+    """
+
+    config: RunConfig
+    session: aiohttp.ClientSession = None
+    cache: cache_helper.DatumCache = None
+    policy_cache: cache_helper.PolicyCache = None
+    shard: shard_helper.ShardCoordinator = None
+
+    def kupo(self, target: target_helper.Target) -> kupo_helper.Kupo:
+        """Return the Kupo instance of a target, queried over the
+        shared session.
+        """
+        return kupo_helper.Kupo(
+            self.session, target.kupo_url, self.config.concurrency, self.cache
+        )
+
+    def close(self) -> None:
+        """Close the datum cache and shard coordinator, if any."""
+        if self.cache is not None:
+            self.cache.close()
+        if self.shard is not None:
+            self.shard.close()
+
+
+def open_context(config: RunConfig, shard_lease: int) -> RunContext:
+    """Return a context with a policy cache and the datum cache and
+    shard coordinator the config asks for. The shard lease lasts
+    `shard_lease` seconds. The context must be closed by the caller.
+    """
+    context = RunContext(config, policy_cache=cache_helper.PolicyCache())
+    if config.datum_cache:
+        context.cache = cache_helper.DatumCache()
+    if config.shard_dir:
+        context.shard = shard_helper.ShardCoordinator(
+            config.shard_dir, config.instance_id, shard_lease
+        )
+    return context
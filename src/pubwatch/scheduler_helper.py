@@ -0,0 +1,143 @@
+"""Helpers for scheduling feed checks in long-running mode.
+
+Each monitored feed is given a deadline, the earliest time at which
+the interval comparison could find it out of date. Deadlines are kept
+in a priority queue so that the daemon only needs to wake for the
+feed that is due next. Feeds that have been requested are deferred,
+across rebuilds, until the validator has had time to publish them.
+"""
+
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def direct_deadline(latest: int, window: int) -> int:
+    """Return the earliest time at which a feed published at `latest`
+    exceeds its interval `window`.
+    """
+    return latest + window + 1
+
+
+def hourly_deadline(latest: int, window: int, threshold: int) -> int:
+    """Return the earliest time at which a feed published at `latest`
+    is found to be out of date relative to the hourly boundary.
+
+    A feed is out of date once the current hour, minus its window,
+    is later than `latest + threshold`, i.e. at the first hour boundary
+    after `latest + threshold + window - 3600`.
+    """
+    target = datetime.fromtimestamp(latest + threshold + window - 3600)
+    hour = target.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return int(hour.timestamp())
+
+
+class FeedScheduler:
+    """Priority queue of feed deadlines.
+
+    Rescheduling a feed leaves its previous entry in the heap. Stale
+    entries are discarded when they reach the front of the queue.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+        self._deferred = {}
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, feed: str, deadline: int) -> None:
+        """Schedule, or reschedule, a feed to be checked at the given
+        deadline.
+        """
+        self._deadlines[feed] = deadline
+        heapq.heappush(self._heap, (deadline, feed))
+
+    def _discard_stale(self) -> None:
+        """Remove entries from the front of the queue that have been
+        rescheduled.
+        """
+        while self._heap:
+            deadline, feed = self._heap[0]
+            if self._deadlines.get(feed) == deadline:
+                return
+            heapq.heappop(self._heap)
+
+    def next_deadline(self) -> Optional[int]:
+        """Return the earliest deadline or None if nothing is
+        scheduled.
+        """
+        self._discard_stale()
+        if not self._heap:
+            return None
+        return self._heap[0][0]
+
+    def pop_due(self, now: int) -> list[str]:
+        """Remove and return every feed whose deadline has passed."""
+        due = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                return due
+            _, feed = heapq.heappop(self._heap)
+            del self._deadlines[feed]
+            due.append(feed)
+
+    def defer(self, feeds: list[str], until: int) -> None:
+        """Defer feeds until the given time, e.g. once they have been
+        requested, so that they aren't due or requested again before
+        then even if the queue is rebuilt.
+        """
+        for feed in feeds:
+            self._deferred[feed] = until
+            if self._deadlines.get(feed, 0) < until:
+                self.schedule(feed, until)
+
+    def defer_due(self, now: int, delay: int) -> list[str]:
+        """Defer every feed whose deadline has passed to `delay`
+        seconds from now and return them.
+        """
+        due = self.pop_due(now)
+        self.defer(due, now + delay)
+        return due
+
+    def deferred(self, now: int) -> set[str]:
+        """Return the feeds that are still deferred."""
+        return {feed for feed, until in self._deferred.items() if until > now}
+
+    def rebuild(  # pylint: disable=R0913
+        self,
+        latest_feed_timestamps: dict,
+        intervals: dict,
+        now: int,
+        hour_boundary: bool,
+        threshold: int,
+    ) -> None:
+        """Recalculate the deadline of every monitored feed from the
+        latest on-chain timestamps. Feeds without an on-chain timestamp
+        are due immediately, unless they are still deferred.
+        """
+        self._heap = []
+        self._deadlines = {}
+        self._deferred = {
+            feed: until
+            for feed, until in self._deferred.items()
+            if until > now and feed in intervals
+        }
+        for feed, window in intervals.items():
+            if feed not in latest_feed_timestamps:
+                deadline = now
+            elif hour_boundary:
+                deadline = hourly_deadline(
+                    latest_feed_timestamps[feed], window, threshold
+                )
+            else:
+                deadline = direct_deadline(latest_feed_timestamps[feed], window)
+            self.schedule(feed, max(deadline, self._deferred.get(feed, deadline)))
+        logger.info(
+            "scheduled: %s feeds, next deadline: %s", len(self), self.next_deadline()
+        )
@@ -0,0 +1,161 @@
+"""Helpers for splitting feeds between several pubwatch instances.
+
+Instances sharing a shard directory, e.g. on a shared volume, each
+hold a lease in a SQLite database there that they renew every run or
+poll. Feeds are assigned to the instances holding a lease by
+consistent hashing over feed ID, so each instance only compares and
+requests its own feeds. An instance whose lease expires, or that
+leaves, drops out of the ring and its feeds are reassigned to the
+remaining instances, with consistent hashing moving as few feeds as
+possible.
+
+Instances briefly disagree about ownership while the ring changes. The
+pending request ledger is kept in the shard directory too so that a
+feed is still only requested once.
+"""
+
+# pylint: disable=R0903
+
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+from typing import Final, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+SHARD_FILE: Final[str] = "pubwatch_shards.sqlite"
+
+# Points each instance has on the hash ring.
+SHARD_VNODES: Final[int] = 64
+
+# Seconds an instance's lease lasts without being renewed. Cron runs
+# renew it hourly so it lasts a run plus a grace period.
+SHARD_LEASE: Final[int] = 3600 + 600
+
+# Polls a daemon's lease lasts without being renewed.
+SHARD_DAEMON_POLLS: Final[int] = 3
+
+
+def default_instance_id() -> str:
+    """Return the ID of this instance, stable across cron runs."""
+    return socket.gethostname()
+
+
+def hash_key(key: str) -> int:
+    """Return the position of a key on the hash ring."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring of instances."""
+
+    def __init__(self, members: Iterable[str], vnodes: int = SHARD_VNODES):
+        self.members = sorted(members)
+        points = sorted(
+            (hash_key(f"{member}#{vnode}"), member)
+            for member in self.members
+            for vnode in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, feed_id: str) -> Optional[str]:
+        """Return the instance a feed is assigned to."""
+        if not self._hashes:
+            return None
+        idx = bisect.bisect(self._hashes, hash_key(feed_id.upper()))
+        return self._owners[idx % len(self._owners)]
+
+
+class ShardCoordinator:
+    """Lease of this instance and the ring of instances holding one."""
+
+    def __init__(
+        self,
+        directory: str,
+        instance_id: str = None,
+        lease: int = SHARD_LEASE,
+        filename: str = SHARD_FILE,
+    ):
+        self.directory = directory
+        self.instance_id = instance_id if instance_id else default_instance_id()
+        self.lease = lease
+        self.ring = HashRing([self.instance_id])
+        self._conn = sqlite3.connect(
+            os.path.join(directory, filename), timeout=30, isolation_level=None
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS members (
+                instance TEXT PRIMARY KEY,
+                expires INTEGER NOT NULL
+            )"""
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def path(self, filename: str) -> str:
+        """Return the location of a file shared by the instances."""
+        return os.path.join(self.directory, filename)
+
+    def heartbeat(self, now: int) -> bool:
+        """Renew this instance's lease, drop instances whose lease has
+        expired and return true if the ring has changed.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO members VALUES (?, ?)",
+                (self.instance_id, now + self.lease),
+            )
+            expired = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT instance FROM members WHERE expires <= ?", (now,)
+                )
+            ]
+            self._conn.execute("DELETE FROM members WHERE expires <= ?", (now,))
+            members = [
+                row[0] for row in self._conn.execute("SELECT instance FROM members")
+            ]
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        if expired:
+            logger.warning("shard instances expired: %s", expired)
+        if sorted(members) == self.ring.members:
+            return False
+        self.ring = HashRing(members)
+        logger.info("shard instances: %s", self.ring.members)
+        return True
+
+    def owns(self, feed_id: str) -> bool:
+        """Return true if a feed is assigned to this instance."""
+        return self.ring.owner(feed_id) == self.instance_id
+
+    def select(self, feeds: dict) -> dict:
+        """Return the feeds of a map keyed by feed ID assigned to this
+        instance.
+        """
+        return {
+            feed_id: value for feed_id, value in feeds.items() if self.owns(feed_id)
+        }
+
+    def leave(self) -> None:
+        """Give up this instance's lease so that its feeds are
+        reassigned straight away.
+        """
+        self._conn.execute(
+            "DELETE FROM members WHERE instance = ?", (self.instance_id,)
+        )
+
+    def close(self) -> None:
+        """Close the database, keeping the lease until it expires."""
+        self._conn.close()
@@ -0,0 +1,91 @@
+"""Helpers for indexing on-chain feed data.
+
+The on-chain feed data for a run is indexed once into a `FeedState`
+mapping each feed ID to its latest observation. Comparison stages then
+work from the index rather than walking every observation again.
+"""
+
+from typing import Iterable, Union
+
+from . import decode_helper
+
+
+def as_observation(
+    item: Union[decode_helper.FeedObservation | list],
+) -> decode_helper.FeedObservation:
+    """Return an observation for an observation or unwrapped datum
+    list.
+    """
+    if isinstance(item, decode_helper.FeedObservation):
+        return item
+    return decode_helper.FeedObservation.from_datum(item)
+
+
+class FeedState:
+    """Latest on-chain observation of each feed keyed by feed ID.
+    `complete` is false if the feed data was cut short, e.g. by a run's
+    deadline, so that feeds not seen may still be on-chain.
+
+    If `observations` is a list, every observation indexed is also
+    buffered in it, e.g. so that they can be archived once the feed
+    data is known to be wanted.
+    """
+
+    __slots__ = ("latest", "complete", "observations")
+
+    def __init__(self, latest: dict, complete: bool = True, observations=None):
+        self.latest = latest
+        self.complete = complete
+        self.observations = observations
+
+    @classmethod
+    def from_observations(cls, on_chain_feed_data: Iterable):
+        """Index on-chain feed data in a single pass."""
+        feed_state = cls({})
+        feed_state.update(on_chain_feed_data)
+        return feed_state
+
+    def update(self, on_chain_feed_data: Iterable) -> None:
+        """Add on-chain feed data to the index, keeping only the latest
+        observation of each feed.
+        """
+        latest = self.latest
+        observations = self.observations
+        for item in on_chain_feed_data:
+            observation = as_observation(item)
+            if observations is not None:
+                observations.append(observation)
+            current = latest.get(observation.feed_id)
+            if current is None or current.timestamp < observation.timestamp:
+                latest[observation.feed_id] = observation
+
+    def __len__(self):
+        return len(self.latest)
+
+    def __contains__(self, feed_id: str):
+        return feed_id in self.latest
+
+    def latest_timestamps(self) -> dict:
+        """Return the latest on-chain time of each feed in seconds."""
+        return {
+            feed_id: observation.timestamp // 1000
+            for feed_id, observation in self.latest.items()
+        }
+
+    def gaps(self, feeds: Iterable) -> list:
+        """Return the pairs of the given feed IDs that have no on-chain
+        observation.
+        """
+        return [feed.split("/")[1] for feed in feeds if feed not in self.latest]
+
+    def without(self, pairs: Iterable):
+        """Return a new state without the given pairs."""
+        pairs = set(pairs)
+        return FeedState(
+            {
+                feed_id: observation
+                for feed_id, observation in self.latest.items()
+                if observation.pair not in pairs
+            },
+            self.complete,
+        )
@@ -0,0 +1,93 @@
+"""Helpers for processing large JSON responses incrementally.
+
+Kupo returns matches as a single JSON array. Rather than loading the
+whole document, the array is parsed one element at a time as the body
+is received so that memory use depends on the size of an element and
+not the size of the response.
+"""
+
+import codecs
+import json
+from typing import AsyncIterable, AsyncIterator
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+# Parser states, i.e. what is expected next.
+_START, _FIRST, _ELEMENT, _DONE = range(4)
+
+
+class StreamError(ValueError):
+    """Raised when a stream isn't a well-formed JSON array."""
+
+
+def _skip(buffer: str, pos: int) -> int:
+    """Return the position of the next non-whitespace character."""
+    while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+async def _with_eof(chunks: AsyncIterable[bytes]) -> AsyncIterator:
+    """Yield each chunk of a stream and whether it is the end of the
+    stream, ending with an empty chunk.
+    """
+    async for chunk in chunks:
+        yield chunk, False
+    yield b"", True
+
+
+async def iter_json_array(chunks: AsyncIterable[bytes]) -> AsyncIterator:
+    """Yield the elements of a JSON array as they are parsed from a
+    stream of bytes.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    state = _START
+    async for chunk, eof in _with_eof(chunks):
+        buffer += decoder.decode(chunk, final=eof)
+        pos = _skip(buffer, 0)
+        while pos < len(buffer) and state != _DONE:
+            if state == _START:
+                if buffer[pos] != "[":
+                    raise StreamError("expected a json array")
+                state = _FIRST
+                pos = _skip(buffer, pos + 1)
+                continue
+            if state == _FIRST and buffer[pos] == "]":
+                state = _DONE
+                break
+            try:
+                element, end = _DECODER.raw_decode(buffer, pos)
+            except json.JSONDecodeError as err:
+                if eof:
+                    raise StreamError(f"invalid json array: {err}") from err
+                break
+            sep = _skip(buffer, end)
+            if sep == len(buffer) or buffer[sep] not in ",]":
+                # Wait for the separator so that truncated scalars,
+                # e.g. `1.5` of `1.5e10`, aren't mistaken for complete
+                # elements.
+                if eof:
+                    raise StreamError("expected ',' or ']' in json array")
+                break
+            yield element
+            state = _DONE if buffer[sep] == "]" else _ELEMENT
+            pos = _skip(buffer, sep + 1)
+        buffer = buffer[pos:]
+        if state == _DONE:
+            break
+        if eof:
+            raise StreamError("unexpected end of json array")
+
+
+async def batched(items: AsyncIterable, size: int) -> AsyncIterator[list]:
+    """Yield lists of up to `size` items from an async iterable."""
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
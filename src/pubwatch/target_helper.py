@@ -0,0 +1,93 @@
+"""Helpers for describing the targets monitored by pubwatch.
+
+A target is a fact statement pointer policy on a network, the Kupo
+instance and validator used to monitor and publish it, and the feeds
+expected to be published under it. Several targets can be described
+in a single targets file, e.g.:
+
+```json
+{
+    "targets": [
+        {
+            "name": "mainnet",
+            "kupo_url": "http://localhost:1442",
+            "fsp_policy": "0690081bc113f74e04640ea78a87d88abbd2f18831c44c4064524230",
+            "validity_token": "000de140",
+            "validator": "wss://",
+            "feeds": "cer-feeds.json",
+            "reference": "https://<reference prices>/"
+        }
+    ]
+}
+```
+
+The optional `reference` is a URL or file of reference prices used to
+request feeds that have deviated from them. Relative feeds and
+reference files are resolved against the targets file.
+"""
+
+# pylint: disable=E0611,R0902,C0415
+
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Final
+
+logger = logging.getLogger(__name__)
+
+# Name of the target configured via environment variables.
+DEFAULT_TARGET: Final[str] = "default"
+
+# Target names are used in file names.
+TARGET_NAME: Final[re.Pattern] = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+@dataclass(frozen=True)
+class Target:
+    name: str
+    kupo_url: str
+    fsp_policy: str
+    validity_token: str
+    validator: str
+    feeds: str
+    reference: str = ""
+
+    def __post_init__(self):
+        if not TARGET_NAME.match(self.name):
+            raise ValueError(f"invalid target name: '{self.name}'")
+
+    @property
+    def validation_request_uri(self) -> str:
+        """Return the URI validation requests are sent to."""
+        return f"{self.validator}validate_on_demand/"
+
+    def state_file(self, filename: str) -> str:
+        """Return the name of a state file belonging to this target so
+        that targets don't share slot files or indexes.
+        """
+        if self.name == DEFAULT_TARGET:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        return f"{stem}_{self.name}{ext}"
+
+
+def read_targets_file(targets_file: str) -> list[Target]:
+    """Read and validate a targets file."""
+    with open(targets_file, "r", encoding="utf-8") as json_targets:
+        targets_dict = json.loads(json_targets.read())
+    base = os.path.dirname(os.path.abspath(targets_file))
+    for item in targets_dict["targets"]:
+        item["feeds"] = os.path.join(base, item["feeds"])
+        reference = item.get("reference")
+        if reference and not reference.startswith(("http://", "https://")):
+            item["reference"] = os.path.join(base, reference)
+    from pydantic import TypeAdapter
+
+    targets = TypeAdapter(list[Target]).validate_python(targets_dict["targets"])
+    names = [target.name for target in targets]
+    if len(set(names)) != len(names):
+        raise ValueError(f"target names must be unique: {names}")
+    logger.info("number of targets in targets file: %s", len(targets))
+    return targets
@@ -0,0 +1,99 @@
+"""Helpers for timing the stages of a pubwatch run.
+
+Stages are timed, events counted and values observed by the
+`StageTimer` active in the current context, if there is one, so that
+callers such as benchmarks and metrics exporters can measure a run
+without it having to be threaded through every function.
+"""
+
+import collections
+import contextlib
+import contextvars
+import time
+from typing import Final, Optional
+
+# Most recent observations kept of each labelled value, e.g. so that a
+# long-running daemon doesn't keep every latency it has observed.
+OBSERVATION_SAMPLES: Final[int] = 100
+
+_current_timer: contextvars.ContextVar = contextvars.ContextVar(
+    "pubwatch_stage_timer", default=None
+)
+
+
+class StageTimer:
+    """Accumulated wall-clock time of each stage of a run."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.observations = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        """Add time to a stage."""
+        self.stages[name] = self.stages.get(name, 0) + seconds
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Add to a count."""
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def observe(self, name: str, label: str, value: float) -> None:
+        """Add an observation of a labelled value, e.g. the latency of
+        a feed, keeping only the most recent.
+        """
+        labels = self.observations.setdefault(name, {})
+        if label not in labels:
+            labels[label] = collections.deque(maxlen=OBSERVATION_SAMPLES)
+        labels[label].append(value)
+
+
+def get_timer() -> Optional[StageTimer]:
+    """Return the timer active in the current context."""
+    return _current_timer.get()
+
+
+@contextlib.contextmanager
+def timing(timer: Optional[StageTimer]):
+    """Make a timer active for the duration of the context. A timer of
+    `None` disables timing.
+    """
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Time a stage into the active timer, if any."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.record(name, time.perf_counter() - start)
+
+
+def record(name: str, seconds: float) -> None:
+    """Add time to a stage of the active timer, if any."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.record(name, seconds)
+
+
+def count(name: str, value: int = 1) -> None:
+    """Add to a count of the active timer, if any."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.increment(name, value)
+
+
+def observe(name: str, label: str, value: float) -> None:
+    """Add an observation to the active timer, if any."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.observe(name, label, value)
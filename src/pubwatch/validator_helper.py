@@ -0,0 +1,275 @@
+"""Helpers for connecting to the Orcfax validator.
+
+A single websocket connection is kept open and reused across requests.
+The connection is kept alive with websocket pings and is re-established
+with jittered exponential backoff if it is lost. Feed requests made
+close together, e.g. by several targets sharing a validator, can be
+coalesced into a single message.
+
+websockets is only imported once a request is made so that runs with
+nothing to publish don't pay for importing it. certifi may already
+have been imported, e.g. via aiohttp, so only parsing its CA bundle is
+deferred, and it is parsed once per process.
+"""
+
+# pylint: disable=E0401,R0902,R0913,C0415
+
+import asyncio
+import functools
+import json
+import logging
+import random
+import ssl
+from typing import Final, Union
+
+logger = logging.getLogger(__name__)
+
+# Heartbeat, i.e. websocket ping, settings in seconds.
+HEARTBEAT_INTERVAL: Final[int] = 20
+HEARTBEAT_TIMEOUT: Final[int] = 20
+
+# Retry settings.
+MAX_RETRIES: Final[int] = 5
+BACKOFF_BASE: Final[float] = 0.5
+BACKOFF_CAP: Final[float] = 30
+
+# Time to wait for a response from the validator.
+RESPONSE_TIMEOUT: Final[int] = 60
+
+# Feed requests made within this many seconds of each other are sent
+# to the validator as one message, if coalescing.
+COALESCE_WINDOW: Final[float] = 0.25
+
+
+class InvalidValidatorURI(ValueError):
+    """Raised when the validator URI can't be connected to, e.g. because
+    it isn't configured.
+    """
+
+
+def get_user_agent() -> str:
+    """Return a user-agent string to connect to the monitor websocket."""
+    return "orcfax-pubwatch/0.0.0"
+
+
+@functools.lru_cache(maxsize=1)
+def get_ssl_context() -> ssl.SSLContext:
+    """Return an SSL context for the validator, parsing the CA bundle
+    only once per process.
+    """
+    import certifi
+
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+def backoff_delay(
+    attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP
+) -> float:
+    """Return a delay for the given retry attempt using exponential
+    backoff with full jitter.
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class ValidatorClient:
+    """Reusable connection to the validator websocket."""
+
+    def __init__(
+        self,
+        ws_uri: str,
+        local: bool = False,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_cap: float = BACKOFF_CAP,
+        coalesce_window: float = 0.0,
+    ):
+        self.ws_uri = ws_uri
+        self.local = local
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.coalesce_window = coalesce_window
+        self.connections = 0
+        self._websocket = None
+        self._lock = asyncio.Lock()
+        self._batch = None
+        self._batch_task = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _connect(self):
+        """Return an open websocket connection, connecting if we are not
+        already connected.
+        """
+        if self._websocket is not None and not self._websocket.closed:
+            return self._websocket
+        import websockets
+
+        # pylint: disable=E1101
+        self._websocket = await websockets.connect(
+            self.ws_uri,
+            user_agent_header=get_user_agent(),
+            ssl=None if self.local else get_ssl_context(),
+            ping_interval=HEARTBEAT_INTERVAL,
+            ping_timeout=HEARTBEAT_TIMEOUT,
+        )
+        self.connections += 1
+        logger.info("connected to websocket")
+        return self._websocket
+
+    async def _send(self, msg_to_send: str):
+        """Send a message, connecting first if needed, and return the
+        connection it was sent on.
+        """
+        websocket = await self._connect()
+        await websocket.send(msg_to_send)
+        logger.info("sent: %s", msg_to_send)
+        return websocket
+
+    async def _receive(self, websocket):
+        """Return the parsed response to a message sent."""
+        msg = await asyncio.wait_for(websocket.recv(), RESPONSE_TIMEOUT)
+        try:
+            return json.loads(msg)
+        except json.JSONDecodeError:
+            pass
+        return msg
+
+    async def request(self, msg_to_send: str) -> Union[dict | str | None]:
+        """Send a message to the validator and return its response,
+        retrying with backoff if the connection fails before the message
+        is sent.
+
+        Once sent, a message isn't sent again even if no response is
+        received so that the validator isn't asked twice.
+        """
+        import websockets
+
+        connection_errors = (
+            websockets.exceptions.ConnectionClosed,
+            websockets.exceptions.InvalidHandshake,
+            asyncio.TimeoutError,
+            OSError,
+        )
+        async with self._lock:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    websocket = await self._send(msg_to_send)
+                except websockets.exceptions.InvalidURI as err:
+                    raise InvalidValidatorURI(
+                        f"invalid validator uri '{self.ws_uri}': {err}"
+                    ) from err
+                except TypeError as err:
+                    logger.error("ensure data is sent as JSON: %s", err)
+                    return None
+                except connection_errors as err:
+                    await self._discard()
+                    if attempt == self.max_retries:
+                        logger.error(
+                            "giving up on '%s' after %s retries: %s",
+                            self.ws_uri,
+                            attempt,
+                            err,
+                        )
+                        return None
+                    delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                    logger.warning(
+                        "connection error '%s', retrying in %.2fs: %s",
+                        self.ws_uri,
+                        delay,
+                        err,
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                try:
+                    return await self._receive(websocket)
+                except connection_errors as err:
+                    await self._discard()
+                    logger.error(
+                        "no response from '%s' to a request already sent: %s",
+                        self.ws_uri,
+                        err,
+                    )
+                    return None
+        return None
+
+    async def request_feeds(self, pairs: list) -> Union[dict | str | None]:
+        """Request new prices for pairs and return the validator's
+        response.
+
+        Pairs requested within the coalescing window of the first are
+        sent together in a single message and share its response.
+        Without a coalescing window, pairs are requested straight away.
+        """
+        if not self.coalesce_window:
+            return await self.request(json.dumps({"feeds": list(pairs)}))
+        if self._batch is None:
+            self._batch = ({}, asyncio.get_running_loop().create_future())
+            self._batch_task = asyncio.ensure_future(self._send_batch())
+        feeds, response = self._batch
+        feeds.update(dict.fromkeys(pairs))
+        return await asyncio.shield(response)
+
+    async def _send_batch(self):
+        """Send the pending batch of feeds once the coalescing window
+        has passed.
+        """
+        feeds, response = self._batch
+        try:
+            await asyncio.sleep(self.coalesce_window)
+            self._batch = None
+            response.set_result(await self.request(json.dumps({"feeds": list(feeds)})))
+        except asyncio.CancelledError:
+            if self._batch is not None and self._batch[1] is response:
+                self._batch = None
+            response.cancel()
+            raise
+        except BaseException as err:  # pylint: disable=W0718
+            # Raised to every caller sharing the batch as it would have
+            # been had they made the request themselves.
+            response.set_exception(err)
+
+    async def _discard(self):
+        """Close and forget the current connection."""
+        websocket, self._websocket = self._websocket, None
+        if websocket is not None:
+            await websocket.close()
+
+    async def close(self):
+        """Close the connection to the validator."""
+        await self._discard()
+
+
+class ValidatorPool:
+    """Validator clients shared between everything using the same
+    validator URI, coalescing their requests within `coalesce_window`.
+    """
+
+    def __init__(self, local: bool = False, coalesce_window: float = 0.0):
+        self.local = local
+        self.coalesce_window = coalesce_window
+        self.clients = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def get(self, ws_uri: str) -> ValidatorClient:
+        """Return the client for a validator URI, creating it if
+        needed.
+        """
+        if ws_uri not in self.clients:
+            self.clients[ws_uri] = ValidatorClient(
+                ws_uri, self.local, coalesce_window=self.coalesce_window
+            )
+        return self.clients[ws_uri]
+
+    async def close(self):
+        """Close every client in the pool."""
+        await asyncio.gather(*[client.close() for client in self.clients.values()])
@@ -0,0 +1,59 @@
+"""Helpers shared by tests that run pubwatch against stand-ins for Kupo
+and the validator.
+"""
+
+# pylint: disable=E0401
+
+import tempfile
+from typing import Callable
+
+from benchmarks import stand_ins
+from src.pubwatch import pubwatch, run_helper, timing_helper
+
+
+def use_stand_ins(monkeypatch, kupo, validator_uri: str = None) -> None:
+    """Point pubwatch at a stand-in Kupo, and validator if given, until
+    the end of the test.
+    """
+    monkeypatch.setattr(pubwatch, "KUPO_URL", stand_ins.kupo_url(kupo))
+    monkeypatch.setattr(pubwatch, "FSP_POLICY", stand_ins.FSP_POLICY)
+    monkeypatch.setattr(pubwatch, "VALIDITY_TOKEN", stand_ins.VALIDITY_TOKEN)
+    if validator_uri is not None:
+        monkeypatch.setattr(pubwatch, "VALIDATOR_URI", validator_uri)
+        monkeypatch.setattr(
+            pubwatch, "VALIDATION_REQUEST_URI", f"{validator_uri}validate_on_demand/"
+        )
+
+
+async def run_pubwatch(
+    monkeypatch,
+    tmp_path,
+    config: stand_ins.KupoConfig,
+    repeat: int = 1,
+    timer_factory: Callable = timing_helper.StageTimer,
+    **options,
+) -> tuple[list, list]:
+    """Run pubwatch `repeat` times against fresh stand-ins with a feeds
+    file of every pair on-chain. Return the timer and Kupo requests of
+    every run and the requests the validator received.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    kupo = await stand_ins.start_kupo(config)
+    validator = stand_ins.FakeValidator()
+    use_stand_ins(monkeypatch, kupo, await validator.start())
+    feeds_file = stand_ins.write_feeds_file(
+        str(tmp_path / "cer-feeds.json"), stand_ins.feed_pairs(config.feeds)
+    )
+    runs = []
+    try:
+        for _ in range(repeat):
+            kupo.app[stand_ins.REQUESTS].clear()
+            with timing_helper.timing(timer_factory()) as timer:
+                await pubwatch.pubwatch(
+                    run_helper.RunConfig(feeds_file=feeds_file, local=True, **options)
+                )
+            runs.append((timer, dict(kupo.app[stand_ins.REQUESTS])))
+    finally:
+        await kupo.close()
+        await validator.close()
+    return runs, validator.requests
@@ -0,0 +1,119 @@
+"""Observation archive tests."""
+
+# pylint: disable=E0401
+
+import sqlite3
+
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import archive_helper, cache_helper, kupo_helper, pubwatch, run_helper
+from src.pubwatch.decode_helper import FeedObservation
+from tests import helpers
+
+
+def observations(*seconds: int) -> list:
+    """Return ADA-USD observations at the given times."""
+    return [FeedObservation("CER/ADA-USD/3", ts * 1000, 1, 2) for ts in seconds]
+
+
+def test_only_new_observations_are_archived(tmp_path):
+    """Ensure observations are written once, and only when flushed."""
+    path = str(tmp_path / "archive.sqlite")
+    with archive_helper.ObservationArchive(path) as archive:
+        archive.add(observations(100, 200))
+        archive.add(observations(200))
+        assert archive.flush() == 2
+        assert archive.flush() == 0
+    with archive_helper.ObservationArchive(path) as archive:
+        assert archive.feeds() == ["CER/ADA-USD"]
+        archive.add(observations(100, 200, 300))
+        assert archive.flush() == 1
+        archive.add(observations(400))
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT COUNT(*) FROM observations").fetchone()[0] == 3
+
+
+def test_stats(tmp_path):
+    """Ensure gaps and staleness are measured within the window."""
+    with archive_helper.ObservationArchive(str(tmp_path / "a.sqlite")) as archive:
+        archive.add(observations(-100, 3000, 10000, 20000))
+        archive.flush()
+        stats = archive.stats("CER/ADA-USD", 0, 14400, 3600, 120)
+        assert archive.timestamps("CER/ADA-USD", 0, 14400) == [-100, 3000, 10000]
+    assert stats.observations == 2
+    assert stats.gaps == [(6720, 10000), (13720, 14400)]
+    assert stats.gap_seconds == 3960
+    assert stats.max_age == 7000
+    assert stats.staleness == 4200 / 14400
+
+
+def test_stats_without_observations(tmp_path):
+    """Ensure a feed never seen is a gap for the whole window."""
+    with archive_helper.ObservationArchive(str(tmp_path / "a.sqlite")) as archive:
+        stats = archive.all_stats(0, 7200, {"CER/FACT-ADA": 3600})["CER/FACT-ADA"]
+    assert stats.observations == 0
+    assert stats.gaps == [(3600, 7200)]
+    assert stats.staleness == 0.5
+
+
+@pytest.mark.asyncio
+async def test_run_is_archived(tmp_path, monkeypatch):
+    """Ensure a run archives the feed data it observes."""
+    server = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=20, feeds=4))
+    helpers.use_stand_ins(monkeypatch, server)
+    monkeypatch.setattr(pubwatch.tempfile, "tempdir", str(tmp_path))
+    feeds_file = stand_ins.write_feeds_file(
+        str(tmp_path / "cer-feeds.json"), stand_ins.feed_pairs(4)
+    )
+    try:
+        await pubwatch.pubwatch(
+            run_helper.RunConfig(
+                feeds_file=feeds_file,
+                nopublish=True,
+                datum_cache=False,
+                archive_dir=str(tmp_path),
+            )
+        )
+    finally:
+        await server.close()
+    path = str(tmp_path / archive_helper.ARCHIVE_FILE)
+    with archive_helper.ObservationArchive(path) as archive:
+        assert len(archive.feeds()) == 4
+
+
+@pytest.mark.asyncio
+async def test_changed_policy_is_not_archived(tmp_path, monkeypatch):
+    """Ensure feed data retrieved under a cached policy that has since
+    changed isn't archived.
+    """
+
+    async def stream_latest_feed_data(_, fs_policy_id, **__):
+        yield observations(100 if fs_policy_id == "stale" else 200)
+
+    async def get_policy_from_fsp(*_, **__):
+        return "current"
+
+    monkeypatch.setattr(kupo_helper, "stream_latest_feed_data", stream_latest_feed_data)
+    monkeypatch.setattr(kupo_helper, "get_policy_from_fsp", get_policy_from_fsp)
+    target = pubwatch.default_target()
+    policy_cache = cache_helper.PolicyCache(path=str(tmp_path / "policy.json"))
+    policy_cache.put(
+        kupo_helper.get_fsp_key(
+            target.fsp_policy, target.validity_token, target.kupo_url
+        ),
+        "0@moved",
+        "moved",
+        "stale",
+    )
+    with archive_helper.ObservationArchive(str(tmp_path / "a.sqlite")) as archive:
+        feed_state = await pubwatch.get_on_chain_feed_data(
+            run_helper.RunContext(run_helper.RunConfig(), policy_cache=policy_cache),
+            "0",
+            target,
+            archive,
+        )
+        archive.flush()
+        assert archive.timestamps("CER/ADA-USD", 0, 1000) == [200]
+    assert feed_state.latest_timestamps() == {"CER/ADA-USD": 200}
@@ -0,0 +1,70 @@
+"""Datum cache tests."""
+
+import time
+
+from src.pubwatch.cache_helper import DatumCache, PolicyCache
+
+DATUM: list = ["CER/ADA-USD/3", 1723186803981, [697, 2000]]
+
+
+def test_cache_round_trip(tmp_path):
+    """Ensure datum persist across cache instances."""
+    path = str(tmp_path / "cache.sqlite")
+    with DatumCache(path=path) as cache:
+        assert cache.get("abc") is None
+        cache.put("abc", DATUM)
+        assert cache.get("abc") == DATUM
+        assert (cache.hits, cache.misses) == (1, 1)
+    with DatumCache(path=path) as cache:
+        assert cache.get("abc") == DATUM
+        assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_memory_lru_is_bounded(tmp_path):
+    """Ensure the in-memory front of the cache is bounded and falls
+    back to disk.
+    """
+    with DatumCache(path=str(tmp_path / "cache.sqlite"), memory_max_entries=2) as cache:
+        for idx in range(5):
+            cache.put(f"hash{idx}", [idx])
+        assert len(cache._memory) == 2  # pylint: disable=W0212
+        assert cache.get("hash0") == [0]
+
+
+def test_evict_by_size(tmp_path):
+    """Ensure the least recently used entries are evicted first."""
+    path = str(tmp_path / "cache.sqlite")
+    with DatumCache(path=path, disk_max_entries=3) as cache:
+        for idx in range(5):
+            cache.put(f"hash{idx}", [idx])
+    with DatumCache(path=path, memory_max_entries=0) as cache:
+        assert cache.get("hash0") is None
+        assert cache.get("hash4") == [4]
+
+
+def test_evict_by_age(tmp_path, monkeypatch):
+    """Ensure entries older than the maximum age are evicted."""
+    path = str(tmp_path / "cache.sqlite")
+    with DatumCache(path=path) as cache:
+        cache.put("old", [0])
+    real_time = time.time()
+    monkeypatch.setattr(time, "time", lambda: real_time + 3600)
+    with DatumCache(path=path, disk_max_age=60, memory_max_entries=0) as cache:
+        cache.put("new", [1])
+        assert cache.evict() == 1
+        assert cache.get("old") is None
+        assert cache.get("new") == [1]
+
+
+def test_policy_cache(tmp_path):
+    """Ensure cached policies persist and are only valid while the
+    pointer remains in the same UTxO with the same datum.
+    """
+    path = str(tmp_path / "policy.json")
+    PolicyCache(path=path).put("fsp", "0@abc", "hash", "policy")
+    cache = PolicyCache(path=path)
+    assert cache.get("fsp", "0@abc", "hash") == "policy"
+    assert cache.get("fsp", "0@def", "hash") is None
+    assert cache.get("fsp", "0@abc", "other") is None
+    assert cache.get("other", "0@abc", "hash") is None
+    assert cache.peek("fsp") == "policy"
@@ -0,0 +1,70 @@
+"""Long-running mode tests."""
+
+# pylint: disable=E0401
+
+import asyncio
+import contextlib
+import tempfile
+import time
+import types
+from collections import Counter
+
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import daemon, pubwatch, run_helper
+from tests import helpers
+
+
+@pytest.mark.asyncio
+async def test_stale_feeds_requested_once_per_threshold(tmp_path, monkeypatch):
+    """Ensure feeds that stay out of date over many checkpoints are
+    only requested again once the interval threshold has passed.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    now = int(time.time())
+    # Every feed is out of date, two are missing altogether.
+    clock = [now + 4 * 3600]
+    fake_time = types.SimpleNamespace(
+        time=lambda: clock[0], perf_counter=time.perf_counter
+    )
+    monkeypatch.setattr(pubwatch, "time", fake_time)
+    monkeypatch.setattr(daemon, "time", fake_time)
+    kupo = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=40, feeds=4), now)
+    validator = stand_ins.FakeValidator()
+    validator_uri = await validator.start()
+    helpers.use_stand_ins(monkeypatch, kupo, validator_uri)
+    pairs = stand_ins.feed_pairs(6)
+    feeds_file = stand_ins.write_feeds_file(str(tmp_path / "cer-feeds.json"), pairs)
+    run = asyncio.ensure_future(
+        daemon.pubwatch_daemon(
+            run_helper.RunConfig(
+                feeds_file=feeds_file,
+                local=True,
+                hour_boundary=False,
+                datum_cache=False,
+                pending_ledger=False,
+                poll_interval=0.01,
+            )
+        )
+    )
+    elapsed = 0
+    try:
+        while elapsed < 4 * pubwatch.INTERVAL_THRESHOLD:
+            await asyncio.sleep(0.1)
+            clock[0] += 30
+            elapsed += 30
+        await asyncio.sleep(0.1)
+    finally:
+        run.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await run
+        await kupo.close()
+        await validator.close()
+    requested = Counter(
+        pair for request in validator.requests for pair in request["feeds"]
+    )
+    assert set(requested) == set(pairs)
+    assert kupo.app[stand_ins.REQUESTS]["health"] > 3 * max(requested.values())
+    for count in requested.values():
+        assert 2 <= count <= elapsed // pubwatch.INTERVAL_THRESHOLD + 1
@@ -0,0 +1,242 @@
+"""Run deadline and overlapping run tests."""
+
+# pylint: disable=E0401,W0621
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+
+from benchmarks import stand_ins
+from src.pubwatch import (
+    deadline_helper,
+    kupo_helper,
+    lock_helper,
+    pubwatch,
+    run_helper,
+    state_helper,
+    timing_helper,
+)
+from tests import helpers
+
+SRC: str = os.path.dirname(lock_helper.__file__)
+
+
+def test_run_budget():
+    """Ensure a run's budget ends the threshold before the next hour
+    with an hourly boundary, within the minimum and maximum budget.
+    """
+    start = datetime(2024, 8, 28, 9, 3).timestamp()
+    assert deadline_helper.run_budget(start, True, 120) == 600
+    late = datetime(2024, 8, 28, 9, 50).timestamp()
+    assert deadline_helper.run_budget(late, True, 120) == 480
+    assert deadline_helper.run_budget(late, False, 120) == 600
+    overrun = datetime(2024, 8, 28, 9, 59).timestamp()
+    assert deadline_helper.run_budget(overrun, True, 120) == 60
+
+
+def test_stage_budgets():
+    """Ensure the remaining time is spread across the stages left."""
+    run_deadline = deadline_helper.Deadline(100)
+    assert run_deadline.budget("slot") == pytest.approx(9.1, abs=0.1)
+    assert run_deadline.budget("matches") == pytest.approx(66.7, abs=0.1)
+    assert run_deadline.budget("publish") == pytest.approx(100, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_bounded_stage():
+    """Ensure a stage that overruns its budget raises and one without
+    a deadline doesn't.
+    """
+    assert await deadline_helper.bounded(asyncio.sleep(0.01, "slot"), "slot") == "slot"
+    with deadline_helper.deadline(deadline_helper.Deadline(0.5)):
+        with pytest.raises(deadline_helper.DeadlineExceeded):
+            await deadline_helper.bounded(asyncio.sleep(1), "slot")
+
+
+@pytest.mark.asyncio
+async def test_items_stop_at_deadline():
+    """Ensure items are yielded until the stage's budget runs out and
+    that running out is raised.
+    """
+
+    async def slow_batches():
+        for batch in range(10):
+            await asyncio.sleep(0.1 if batch else 0)
+            yield [batch]
+
+    received = []
+    with deadline_helper.deadline(deadline_helper.Deadline(0.2)):
+        with pytest.raises(deadline_helper.DeadlineExceeded):
+            async for batch in deadline_helper.until_deadline(
+                slow_batches(), "publish"
+            ):
+                received.append(batch)
+    assert 0 < len(received) < 10
+    batches = deadline_helper.until_deadline(slow_batches(), "publish")
+    assert len([batch async for batch in batches]) == 10
+
+
+@pytest.mark.asyncio
+async def test_incomplete_feed_data_requests_no_gaps():
+    """Ensure feeds not seen before the deadline aren't requested but
+    feeds seen out of date are.
+    """
+    intervals = {"CER/ADA-USD": 3600, "CER/FACT-ADA": 3600}
+    on_chain = [["CER/ADA-USD/3", 0, [1, 2]]]
+    feed_state = state_helper.FeedState.from_observations(on_chain)
+    assert sorted(
+        await pubwatch.get_pairs_to_request(intervals, feed_state, False)
+    ) == ["ADA-USD", "FACT-ADA"]
+    feed_state.complete = False
+    assert await pubwatch.get_pairs_to_request(intervals, feed_state, False) == [
+        "ADA-USD"
+    ]
+
+
+def test_run_lock(tmp_path):
+    """Ensure a lock is only held by one run at a time."""
+    path = str(tmp_path / "pubwatch.lock")
+    expires = time.time() + 60
+    with lock_helper.RunLock(path) as first:
+        assert first.acquire(expires)
+        assert not lock_helper.RunLock(path).acquire(expires)
+    assert lock_helper.RunLock(path).acquire(expires)
+
+
+def test_stale_locks_are_taken_over(tmp_path):
+    """Ensure locks held by exited or overrun runs are taken over."""
+    path = str(tmp_path / "pubwatch.lock")
+    overrun = lock_helper.RunLock(path)
+    assert overrun.acquire(time.time() - 1)
+    with lock_helper.RunLock(path) as lock:
+        assert lock.acquire(time.time() + 60)
+        # The overrun run doesn't remove a lock it no longer holds.
+        overrun.release()
+        assert lock_helper.RunLock(path).holder()["token"] == lock.token
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, time; sys.path.insert(0, {SRC!r});"
+            "import lock_helper;"
+            f"lock_helper.RunLock({path!r}).acquire(time.time() + 60)",
+        ],
+        check=True,
+    )
+    assert lock_helper.RunLock(path).holder() is not None
+    assert lock_helper.RunLock(path).acquire(time.time() + 60)
+
+
+def test_lock_without_deadline_does_not_expire(tmp_path):
+    """Ensure a lock taken without a deadline is held until its holder
+    exits, however long it runs for.
+    """
+    path = str(tmp_path / "pubwatch.lock")
+    with lock_helper.RunLock(path) as lock:
+        assert lock.acquire(None)
+        assert not lock_helper.is_stale(lock.holder(), time.time() + 10**6)
+        assert not lock_helper.RunLock(path).acquire(time.time() + 60)
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys; sys.path.insert(0, {SRC!r});"
+            "import lock_helper;"
+            f"lock_helper.RunLock({path!r}).acquire(None)",
+        ],
+        check=True,
+    )
+    assert lock_helper.RunLock(path).acquire(None)
+
+
+@pytest.mark.asyncio
+async def test_overlapping_run_is_skipped(monkeypatch, tmp_path):
+    """Ensure a target being checked by another run isn't checked."""
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    target = pubwatch.default_target("cer-feeds.json")
+    with lock_helper.RunLock(
+        lock_helper.default_lock_path(target.state_file(lock_helper.LOCK_FILE))
+    ) as lock:
+        assert lock.acquire(time.time() + 60)
+        assert await pubwatch.pubwatch_target(None, None, target) == []
+
+
+async def _overrun(*_, **__):
+    """Stand in for a stage that never completes."""
+    await asyncio.sleep(60)
+
+
+@pytest_asyncio.fixture
+async def stand_in_target(tmp_path, monkeypatch):
+    """Point pubwatch at stand-ins for Kupo and the validator, with a
+    short run deadline, and return a feeds file with more feeds than
+    are on-chain.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    kupo = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=60, feeds=20))
+    validator = stand_ins.FakeValidator()
+    validator_uri = await validator.start()
+    helpers.use_stand_ins(monkeypatch, kupo, validator_uri)
+    monkeypatch.setattr(pubwatch.deadline_helper, "run_budget", lambda *_: 0.5)
+    yield stand_ins.write_feeds_file(
+        str(tmp_path / "cer-feeds.json"), stand_ins.feed_pairs(24)
+    )
+    await kupo.close()
+    await validator.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "module, stage", [(pubwatch, "get_slot"), (kupo_helper, "get_policy_from_fsp")]
+)
+async def test_overrun_stage_ends_run(stand_in_target, monkeypatch, module, stage):
+    """Ensure a run whose slot or policy stage overruns requests nothing
+    and completes without raising.
+    """
+    monkeypatch.setattr(module, stage, _overrun)
+    with timing_helper.timing(timing_helper.StageTimer()) as timer:
+        result = await pubwatch.pubwatch(
+            run_helper.RunConfig(
+                feeds_file=stand_in_target, local=True, hour_boundary=False
+            )
+        )
+    assert result == {"default": []}
+    assert timer.counts["deadline_exceeded"] == 1
+
+
+@pytest.mark.asyncio
+async def test_incremental_overrun_uses_index(stand_in_target, monkeypatch):
+    """Ensure an incremental run whose update of the index overruns
+    compares the feed data already indexed as incomplete.
+    """
+    indexed = await pubwatch.pubwatch(
+        run_helper.RunConfig(
+            feeds_file=stand_in_target,
+            local=True,
+            nopublish=True,
+            hour_boundary=False,
+            incremental=True,
+        )
+    )
+    monkeypatch.setattr(kupo_helper, "get_indexed_feed_data", _overrun)
+    with timing_helper.timing(timing_helper.StageTimer()) as timer:
+        result = await pubwatch.pubwatch(
+            run_helper.RunConfig(
+                feeds_file=stand_in_target,
+                local=True,
+                nopublish=True,
+                hour_boundary=False,
+                incremental=True,
+            )
+        )
+    gaps = set(stand_ins.feed_pairs(24)) - set(stand_ins.feed_pairs(20))
+    assert result["default"]
+    assert set(result["default"]) == set(indexed["default"]) - gaps
+    assert timer.counts["deadline_truncated"] == 1
@@ -0,0 +1,72 @@
+"""Fact statement decoding tests."""
+
+import cbor2
+import pytest
+
+from src.pubwatch.decode_helper import (
+    FeedObservation,
+    decode_fact_statement,
+    decode_fact_statements,
+    process_cbor,
+    unwrap_cbor,
+)
+
+from .test_main import ON_CHAIN_EX
+
+
+def encode(datum: list) -> str:
+    """Encode an unwrapped datum list as fact statement CBOR."""
+    feed, timestamp, value = datum
+    return cbor2.dumps(
+        cbor2.CBORTag(
+            121,
+            [
+                cbor2.CBORTag(
+                    121, [feed.encode(), timestamp, cbor2.CBORTag(121, value)]
+                ),
+                b"\xde\xad",
+            ],
+        )
+    ).hex()
+
+
+@pytest.mark.asyncio
+async def test_decode_matches_unwrap_cbor():
+    """Ensure the fast decoder agrees with the generic unwrapper."""
+    datums_cbor = [encode(datum) for datum in ON_CHAIN_EX]
+    observations = decode_fact_statements(datums_cbor)
+    for datum_cbor, observation in zip(datums_cbor, observations):
+        unwrapped = await unwrap_cbor(await process_cbor(datum_cbor), [])
+        assert observation == unwrapped[0]
+        assert observation.as_datum() == unwrapped[0]
+
+
+def test_observation_fields():
+    """Ensure observations are parsed into their components once."""
+    observation = decode_fact_statement(
+        encode(["CER/ADA-iUSD/3", 1723186803981, [410779, 1000000]])
+    )
+    assert observation.feed_type == "CER"
+    assert observation.pair == "ADA-IUSD"
+    assert observation.feed_id == "CER/ADA-IUSD"
+    assert observation.timestamp == 1723186803981
+    assert (observation.num, observation.den) == (410779, 1000000)
+    assert observation[0] == "CER/ADA-iUSD/3"
+    assert observation[2] == [410779, 1000000]
+    other = FeedObservation.from_datum(observation.as_datum())
+    assert other.feed_id is observation.feed_id
+    assert not hasattr(observation, "__dict__")
+
+
+def test_unexpected_shape_is_unwrapped():
+    """Ensure datum shaped differently are still decoded, here with a
+    value that isn't wrapped in a constructor tag.
+    """
+    datum_cbor = cbor2.dumps(
+        cbor2.CBORTag(
+            121,
+            [cbor2.CBORTag(121, [b"CER/ADA-USD/3", 1723186803981, [697, 2000]])],
+        )
+    ).hex()
+    observation = decode_fact_statement(datum_cbor)
+    assert observation == ["CER/ADA-USD/3", 1723186803981, [697, 2000]]
@@ -0,0 +1,122 @@
+"""Deviation-triggered request tests."""
+
+# pylint: disable=E0401
+
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import (
+    deviation_helper,
+    feed_helper,
+    kupo_helper,
+    pubwatch,
+    state_helper,
+)
+
+ON_CHAIN: list = [
+    ["CER/ADA-USD/3", 1723194014750, [101, 100]],
+    ["CER/FACT-ADA/3", 1723194014750, [10101, 10000]],
+    ["CER/SNEK-ADA/3", 1723194014750, [10**40 + 10**38 + 1, 10**40]],
+    ["CER/IBTC-ADA/3", 1723194014750, [157397269397, 1000000]],
+]
+
+DEVIATIONS: dict = {
+    "CER/ADA-USD": 1,
+    "CER/FACT-ADA": 1,
+    "CER/SNEK-ADA": 1,
+    "CER/IBTC-ADA": 1,
+    "CER/ADA-EUR": 1,
+}
+
+
+def test_parse_price():
+    """Ensure reference prices are parsed exactly."""
+    assert deviation_helper.parse_price([2, 4]) == (1, 2)
+    assert deviation_helper.parse_price("0.0431") == (431, 10000)
+    assert deviation_helper.parse_price(2) == (2, 1)
+    with pytest.raises(ValueError):
+        deviation_helper.parse_prices([])
+
+
+def test_get_deviated():
+    """Ensure only feeds deviating by more than their deviation are
+    returned, exactly at the boundary and with large integers.
+    """
+    latest = state_helper.FeedState.from_observations(ON_CHAIN).latest
+    reference = deviation_helper.parse_prices(
+        {
+            "ADA-USD": 1,
+            "FACT-ADA": 1,
+            "SNEK-ADA": 1,
+            "IBTC-ADA": [157397269397, 10**6],
+        }
+    )
+    assert deviation_helper.get_deviated(latest, reference, DEVIATIONS) == {
+        "FACT-ADA": 101,
+        "SNEK-ADA": 100,
+    }
+
+
+def test_get_deviations():
+    """Ensure feeds without a deviation or interval aren't checked."""
+    feeds = feed_helper.get_feeds_adapter().validate_python(
+        [
+            {
+                "pair": pair,
+                "label": pair,
+                "interval": interval,
+                "deviation": deviation,
+                "source": "cex",
+                "calculation": "median",
+                "status": "showcase",
+            }
+            for pair, interval, deviation in [
+                ("ADA-USD", 3600, 1),
+                ("FACT-ADA", 3600, 0),
+                ("SNEK-ADA", 0, 1),
+            ]
+        ]
+    )
+    assert feed_helper.get_deviations(feeds) == {"CER/ADA-USD": 1}
+
+
+@pytest.mark.asyncio
+async def test_deviated_pairs_from_reference_server():
+    """Ensure reference prices are retrieved in a single request and
+    an unreachable source doesn't request anything.
+    """
+    server = await stand_ins.start_reference({"FACT-ADA": "1", "ADA-USD": [1, 1]})
+    try:
+        source = deviation_helper.open_reference_source(
+            f"{stand_ins.kupo_url(server)}/prices"
+        )
+        async with kupo_helper.create_kupo_session() as session:
+            deviated = await pubwatch.get_deviated_pairs(
+                session, source, DEVIATIONS, ON_CHAIN
+            )
+            unreachable = await pubwatch.get_deviated_pairs(
+                session,
+                deviation_helper.open_reference_source("http://127.0.0.1:1/prices"),
+                DEVIATIONS,
+                ON_CHAIN,
+            )
+    finally:
+        await server.close()
+    assert deviated == ["FACT-ADA"]
+    assert server.app[stand_ins.REQUESTS]["prices"] == 1
+    assert not unreachable
+    assert pubwatch.merge_pairs(["ADA-EUR", "FACT-ADA"], ["FACT-ADA", "SNEK-ADA"]) == [
+        "ADA-EUR",
+        "FACT-ADA",
+        "SNEK-ADA",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_file_reference_source(tmp_path):
+    """Ensure reference prices can be read from a file."""
+    path = tmp_path / "prices.json"
+    path.write_text('{"ada-usd": "0.45"}', encoding="utf-8")
+    source = deviation_helper.open_reference_source(str(path))
+    assert await source.get_prices(None) == {"ADA-USD": (9, 20)}
+    assert deviation_helper.open_reference_source("") is None
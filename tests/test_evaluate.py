@@ -0,0 +1,81 @@
+"""Vectorized staleness evaluation tests."""
+
+# pylint: disable=W0621
+
+import os
+import random
+import time
+
+import pytest
+
+from src.pubwatch.evaluate_helper import evaluate
+from src.pubwatch.pubwatch import (
+    INTERVAL_THRESHOLD,
+    compare_direct_intervals,
+    compare_hourly_intervals,
+)
+
+WINDOWS: list = [1, 657, 3480, 3600, 7200, 86400]
+
+
+@pytest.fixture(params=["UTC", "Europe/London", "Asia/Kolkata"])
+def timezone(request):
+    """Run a test in different local timezones, including ones with
+    daylight saving and non-hourly offsets.
+    """
+    if not hasattr(time, "tzset"):
+        pytest.skip("timezones cannot be changed on this platform")
+    original = os.environ.get("TZ")
+    os.environ["TZ"] = request.param
+    time.tzset()
+    yield request.param
+    if original is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = original
+    time.tzset()
+
+
+def random_feeds(rng: random.Random, now: int, number: int) -> tuple[dict, dict]:
+    """Return random latest timestamps and intervals for a number of
+    feeds, some of which aren't monitored.
+    """
+    latest = {}
+    intervals = {}
+    for idx in range(number):
+        feed = f"CER/FEED{idx}-ADA"
+        latest[feed] = now - rng.randint(0, 3 * 86400)
+        if rng.random() < 0.9:
+            intervals[feed] = rng.choice(WINDOWS)
+    return latest, intervals
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hour_boundary", [True, False])
+async def test_evaluate_matches_scalar_comparison(timezone, hour_boundary):
+    """Ensure the vectorized evaluation returns exactly what the
+    per-feed comparisons return.
+    """
+    rng = random.Random(timezone)
+    # Include times either side of daylight saving changes.
+    for now in [1711846800, 1729990800, 1723632286] + [
+        rng.randint(1700000000, 1760000000) for _ in range(20)
+    ]:
+        latest, intervals = random_feeds(rng, now, 500)
+        required, unmonitored = evaluate(
+            latest, now, intervals, hour_boundary, INTERVAL_THRESHOLD
+        )
+        if hour_boundary:
+            expected = await compare_hourly_intervals(latest, now, intervals)
+        else:
+            expected = await compare_direct_intervals(latest, now, intervals)
+        assert required == expected
+        assert unmonitored == [feed for feed in latest if feed not in intervals]
+
+
+def test_evaluate_nothing_monitored():
+    """Ensure an empty evaluation is handled."""
+    assert evaluate({"CER/ADA-USD": 1}, 2, {}, True, INTERVAL_THRESHOLD) == (
+        [],
+        ["CER/ADA-USD"],
+    )
@@ -0,0 +1,53 @@
+"""Feeds specification tests."""
+
+import os
+
+import pydantic
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import feed_helper
+from src.pubwatch.pubwatch import INTERVAL_THRESHOLD, create_interval_dict
+
+
+def test_load_feeds(tmp_path):
+    """Ensure feeds are validated and compiled with both interval
+    maps.
+    """
+    path = stand_ins.write_feeds_file(
+        str(tmp_path / "feeds.json"), ["ADA-USD", "FACT-ADA"]
+    )
+    compiled = feed_helper.FeedsCache().load(path, INTERVAL_THRESHOLD)
+    assert [feed.pair for feed in compiled.feeds] == ["ADA-USD", "FACT-ADA"]
+    assert compiled.version == "0.0.0"
+    assert compiled.intervals(True) == create_interval_dict(compiled.feeds, True)
+    assert compiled.intervals(False) == create_interval_dict(compiled.feeds, False)
+    assert compiled.intervals(False)["CER/ADA-USD"] == 3600 - INTERVAL_THRESHOLD
+
+
+def test_feeds_are_reloaded_when_changed(tmp_path):
+    """Ensure feeds are only compiled again if the file changes."""
+    cache = feed_helper.FeedsCache()
+    path = stand_ins.write_feeds_file(str(tmp_path / "feeds.json"), ["ADA-USD"])
+    compiled = cache.load(path, INTERVAL_THRESHOLD)
+    assert cache.load(path, INTERVAL_THRESHOLD) is compiled
+    # Same content with a new modification time.
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert cache.load(path, INTERVAL_THRESHOLD) is compiled
+    stand_ins.write_feeds_file(path, ["ADA-USD", "ADA-EUR"])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2))
+    reloaded = cache.load(path, INTERVAL_THRESHOLD)
+    assert reloaded is not compiled
+    assert "CER/ADA-EUR" in reloaded.intervals(True)
+
+
+def test_invalid_feeds(tmp_path):
+    """Ensure invalid feeds are rejected."""
+    path = tmp_path / "feeds.json"
+    path.write_text(
+        '{"meta": {"version": "1"}, "feeds": [{"pair": "ADA-USD"}]}',
+        encoding="utf-8",
+    )
+    with pytest.raises(pydantic.ValidationError):
+        feed_helper.FeedsCache().load(str(path), INTERVAL_THRESHOLD)
@@ -0,0 +1,190 @@
+"""UTxO index tests."""
+
+# pylint: disable=E0401
+
+import tempfile
+import time
+from typing import Optional
+
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import pubwatch, run_helper
+from src.pubwatch.index_helper import ROLLBACK_WINDOW, UtxoIndex
+from tests import helpers
+
+POLICY: str = "policy"
+HEADER: str = "ab" * 32
+
+
+def match(idx: int, created: int, spent: Optional[int] = None) -> dict:
+    """Return a Kupo-like match object."""
+    return {
+        "transaction_id": f"{idx:064x}",
+        "output_index": 0,
+        "datum_hash": f"hash{idx}",
+        "created_at": {"slot_no": created, "header_hash": ""},
+        "spent_at": {"slot_no": spent, "header_hash": ""} if spent else None,
+    }
+
+
+def datum(idx: int) -> list:
+    """Return a datum for a match."""
+    return [f"CER/ADA-USD/{idx}", idx, [1, 2]]
+
+
+def fill_datum(index: UtxoIndex):
+    """Add datum for all UTxOs missing them."""
+    index.add_datum(
+        {datum_hash: datum(int(datum_hash[4:])) for datum_hash in index.missing_datum()}
+    )
+
+
+def test_initial_build(tmp_path):
+    """Ensure an index is built from scratch and only unspent UTxOs
+    are returned.
+    """
+    with UtxoIndex(path=str(tmp_path / "index.sqlite")) as index:
+        assert index.window_start(POLICY) == 0
+        index.apply(
+            POLICY,
+            0,
+            [match(1, 100), match(2, 200), match(3, 300, 400)],
+            [],
+            500,
+            HEADER,
+        )
+        assert sorted(index.missing_datum()) == ["hash1", "hash2"]
+        fill_datum(index)
+        assert index.missing_datum() == []
+        assert index.unspent_datum() == [datum(2), datum(1)]
+        assert index.checkpoint(POLICY) == 500
+
+
+def test_incremental_update(tmp_path):
+    """Ensure new and spent UTxOs are applied on top of the index."""
+    slot = ROLLBACK_WINDOW * 2
+    path = str(tmp_path / "index.sqlite")
+    with UtxoIndex(path=path) as index:
+        index.apply(POLICY, 0, [match(1, 100), match(2, 200)], [], slot, HEADER)
+        fill_datum(index)
+    with UtxoIndex(path=path) as index:
+        window_start = index.window_start(POLICY)
+        assert window_start == slot - ROLLBACK_WINDOW
+        index.apply(
+            POLICY,
+            window_start,
+            [match(3, slot + 10)],
+            [match(1, 100, slot + 5)],
+            slot + 20,
+            HEADER,
+        )
+        assert index.missing_datum() == ["hash3"]
+        fill_datum(index)
+        assert index.unspent_datum() == [datum(3), datum(2)]
+
+
+def test_rollback(tmp_path):
+    """Ensure UTxOs created or spent within the rollback window are
+    removed or restored if Kupo no longer reports them.
+    """
+    slot = ROLLBACK_WINDOW * 2
+    with UtxoIndex(path=str(tmp_path / "index.sqlite")) as index:
+        index.apply(
+            POLICY,
+            0,
+            [match(1, 100), match(2, slot - 10)],
+            [match(1, 100, slot - 5)],
+            slot,
+            HEADER,
+        )
+        fill_datum(index)
+        assert index.unspent_datum() == [datum(2)]
+        # UTxO 2 and the spend of UTxO 1 have been rolled back.
+        index.apply(POLICY, index.window_start(POLICY), [], [], slot + 1, HEADER)
+        fill_datum(index)
+        assert index.unspent_datum() == [datum(1)]
+
+
+def test_policy_change_rebuilds(tmp_path):
+    """Ensure the index is rebuilt if the fact statement policy
+    changes.
+    """
+    with UtxoIndex(path=str(tmp_path / "index.sqlite")) as index:
+        index.apply(POLICY, 0, [match(1, 100)], [], 500, HEADER)
+        assert index.window_start("new_policy") == 0
+        index.apply("new_policy", 0, [match(2, 200)], [], 600, HEADER)
+        fill_datum(index)
+        assert index.unspent_datum() == [datum(2)]
+
+
+def test_unchecked_index_rebuilds(tmp_path):
+    """Ensure an index without a header hash for its checkpoint is
+    rebuilt as it can't be checked for rollbacks.
+    """
+    with UtxoIndex(path=str(tmp_path / "index.sqlite")) as index:
+        index.apply(POLICY, 0, [match(1, 100)], [], ROLLBACK_WINDOW * 2, "")
+        assert index.window_start(POLICY) == 0
+        assert index.header_hash(POLICY) is None
+
+
+@pytest.mark.asyncio
+async def test_update_fetches_recent_matches(tmp_path, monkeypatch):
+    """Ensure the index is built from the unspent matches and an
+    incremental run only fetches the matches created or spent within
+    the rollback window of the last checkpoint, unless the checkpoint
+    has been rolled back.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    now = int(time.time())
+    config = stand_ins.KupoConfig(utxos=200, spent=100, feeds=10)
+    kupo = await stand_ins.start_kupo(config, now)
+    helpers.use_stand_ins(monkeypatch, kupo)
+    feeds_file = stand_ins.write_feeds_file(
+        str(tmp_path / "cer-feeds.json"), stand_ins.feed_pairs(10)
+    )
+    index_path = str(tmp_path / "pubwatch_utxo_index.sqlite")
+    utxos = stand_ins.generate_utxos(config, now)
+    rebuild = f"/matches/{stand_ins.FS_POLICY}.*?unspent"
+
+    async def run() -> int:
+        kupo.app[stand_ins.REQUESTS].clear()
+        kupo.app[stand_ins.QUERIES].clear()
+        await pubwatch.pubwatch(
+            run_helper.RunConfig(
+                feeds_file=feeds_file,
+                local=True,
+                nopublish=True,
+                hour_boundary=False,
+                datum_cache=False,
+                incremental=True,
+            )
+        )
+        return kupo.app[stand_ins.REQUESTS]["matched"]
+
+    def changed(window_start: int) -> int:
+        created = [u for u in utxos if u["created_at"]["slot_no"] > window_start]
+        spent = [
+            u
+            for u in utxos
+            if u["spent_at"] and u["spent_at"]["slot_no"] > window_start
+        ]
+        return len(created) + len(spent)
+
+    def rebuilt() -> bool:
+        return any(query.startswith(rebuild) for query in kupo.app[stand_ins.QUERIES])
+
+    try:
+        assert await run() == config.utxos
+        assert rebuilt()
+        with UtxoIndex(index_path) as index:
+            window_start = index.window_start(stand_ins.FS_POLICY)
+        assert await run() == changed(window_start)
+        assert not rebuilt()
+        assert await run() < config.utxos / 10
+        # The checkpoint is rolled back.
+        kupo.app[stand_ins.CHAIN]["fork"] += 1
+        assert await run() == config.utxos
+        assert rebuilt()
+    finally:
+        await kupo.close()
@@ -0,0 +1,243 @@
+"""Kupo client tests.
+
+Kupo is stood-in for by a small local aiohttp server so that requests
+can be made over a real socket with a configurable latency.
+"""
+
+# pylint: disable=W0621
+
+import asyncio
+import time
+from collections import Counter
+
+import cbor2
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from benchmarks import stand_ins
+from src.pubwatch import cache_helper, kupo_helper, pubwatch, run_helper, target_helper
+
+LATENCY: float = 0.02
+NUMBER_OF_DATUMS: int = 50
+
+REQUESTS = web.AppKey("requests", Counter)
+
+
+def fact_statement_datum(feed: str, timestamp: int, value: list) -> str:
+    """Return hex-encoded CBOR in the shape of a fact statement datum."""
+    datum = cbor2.CBORTag(
+        121,
+        [
+            cbor2.CBORTag(121, [feed.encode(), timestamp, cbor2.CBORTag(121, value)]),
+            b"\x00\x01",
+        ],
+    )
+    return cbor2.dumps(datum).hex()
+
+
+def make_kupo_app(
+    datums: dict, latency: float, resolve_hashes: bool = False, unresolved: tuple = ()
+) -> web.Application:
+    """Create a fake Kupo app serving the given datums. Requests are
+    counted per endpoint in `app[REQUESTS]`.
+
+    Without `resolve_hashes` the app behaves like a Kupo that doesn't
+    support resolving datum inline. Otherwise datum are returned
+    inline except for any hashes in `unresolved`.
+    """
+
+    async def matches(request):
+        request.app[REQUESTS]["matches"] += 1
+        await asyncio.sleep(latency)
+        if "resolve_hashes" not in request.query:
+            return web.json_response(
+                [{"datum_hash": datum_hash} for datum_hash in datums]
+            )
+        if not resolve_hashes:
+            raise web.HTTPBadRequest()
+        return web.json_response(
+            [
+                {
+                    "datum_hash": datum_hash,
+                    "datum": None if datum_hash in unresolved else datum,
+                }
+                for datum_hash, datum in datums.items()
+            ]
+        )
+
+    async def datum(request):
+        request.app[REQUESTS]["datums"] += 1
+        await asyncio.sleep(latency)
+        return web.json_response({"datum": datums[request.match_info["hash"]]})
+
+    app = web.Application()
+    app[REQUESTS] = Counter()
+    app.router.add_get("/matches/{pattern}", matches)
+    app.router.add_get("/datums/{hash}", datum)
+    return app
+
+
+async def start_kupo(**kwargs) -> TestServer:
+    """Start a fake Kupo server."""
+    datums = {
+        f"{idx:064x}": fact_statement_datum(
+            "CER/ADA-USD/3", 1723186803981 + idx, [697, 2000]
+        )
+        for idx in range(NUMBER_OF_DATUMS)
+    }
+    server = TestServer(make_kupo_app(datums, LATENCY, **kwargs))
+    await server.start_server()
+    server.url = str(server.make_url("")).rstrip("/")
+    server.datums = datums
+    return server
+
+
+@pytest_asyncio.fixture
+async def kupo():
+    """Provide a fake Kupo server that cannot resolve datum inline."""
+    server = await start_kupo()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def kupo_inline():
+    """Provide a fake Kupo server that resolves most datum inline."""
+    server = await start_kupo(
+        resolve_hashes=True,
+        unresolved=(f"{0:064x}", f"{1:064x}"),
+    )
+    yield server
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_get_latest_feed_data(kupo):
+    """Ensure datums are fetched, decoded, and returned in match
+    order.
+    """
+    async with kupo_helper.create_kupo_session() as session:
+        res = await kupo_helper.get_latest_feed_data(
+            kupo_helper.Kupo(session, kupo.url), "policy"
+        )
+    assert len(res) == len(kupo.datums)
+    assert res[0] == ["CER/ADA-USD/3", 1723186803981, [697, 2000]]
+    assert [item[1] for item in res] == [
+        1723186803981 + idx for idx in range(NUMBER_OF_DATUMS)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_datum_fetch_is_faster(kupo):
+    """Ensure concurrent datum fetching beats the sequential path.
+
+    With a concurrency of one the fetch is equivalent to fetching each
+    datum in turn.
+    """
+    async with kupo_helper.create_kupo_session(concurrency=1) as session:
+        start = time.perf_counter()
+        sequential = await kupo_helper.get_latest_feed_data(
+            kupo_helper.Kupo(session, kupo.url, concurrency=1), "policy"
+        )
+        sequential_time = time.perf_counter() - start
+    async with kupo_helper.create_kupo_session(concurrency=25) as session:
+        start = time.perf_counter()
+        concurrent = await kupo_helper.get_latest_feed_data(
+            kupo_helper.Kupo(session, kupo.url, concurrency=25), "policy"
+        )
+        concurrent_time = time.perf_counter() - start
+    assert sequential == concurrent
+    assert sequential_time >= LATENCY * len(kupo.datums)
+    assert concurrent_time * 5 < sequential_time
+
+
+@pytest.mark.asyncio
+async def test_datum_cache_avoids_refetch(kupo, tmp_path):
+    """Ensure a warm datum cache means no datum is fetched twice."""
+    cache = cache_helper.DatumCache(path=str(tmp_path / "cache.sqlite"))
+    async with kupo_helper.create_kupo_session() as session:
+        cached = kupo_helper.Kupo(session, kupo.url, cache=cache)
+        cold = await kupo_helper.get_latest_feed_data(cached, "policy")
+        assert kupo.app[REQUESTS]["datums"] == NUMBER_OF_DATUMS
+        warm = await kupo_helper.get_latest_feed_data(cached, "policy")
+        assert kupo.app[REQUESTS]["datums"] == NUMBER_OF_DATUMS
+    assert cold == warm
+    assert cache.hits == NUMBER_OF_DATUMS
+    assert cache.misses == NUMBER_OF_DATUMS
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_repeated_hashes_fetched_once(kupo):
+    """Ensure datum hashes repeated within a run are fetched once."""
+    datum_hash = next(iter(kupo.datums))
+    async with kupo_helper.create_kupo_session() as session:
+        res = await kupo_helper.get_datums(
+            kupo_helper.Kupo(session, kupo.url), [datum_hash] * 5
+        )
+    assert kupo.app[REQUESTS]["datums"] == 1
+    assert len(res) == 5
+
+
+@pytest.mark.asyncio
+async def test_inline_datums(kupo_inline, kupo):
+    """Ensure datum resolved inline are used and only unresolved datum
+    are fetched separately, and that the result is the same as when
+    Kupo cannot resolve datum inline.
+    """
+    async with kupo_helper.create_kupo_session() as session:
+        fallback = await kupo_helper.get_latest_feed_data(
+            kupo_helper.Kupo(session, kupo.url), "policy"
+        )
+        inline = await kupo_helper.get_latest_feed_data(
+            kupo_helper.Kupo(session, kupo_inline.url), "policy"
+        )
+    assert inline == fallback
+    assert kupo_inline.app[REQUESTS] == {"matches": 1, "datums": 2}
+    assert kupo.app[REQUESTS] == {"matches": 2, "datums": NUMBER_OF_DATUMS}
+
+
+@pytest.mark.asyncio
+async def test_policy_cache(tmp_path, monkeypatch):
+    """Ensure a cached policy is reused while the pointer is unchanged
+    and that feed data is retrieved again if the policy has changed.
+    """
+    monkeypatch.setattr(kupo_helper, "KUPO_RESOLVE_HASHES", False)
+    server = await stand_ins.start_kupo(
+        stand_ins.KupoConfig(utxos=10, feeds=2, resolve_hashes=False)
+    )
+    target = target_helper.Target(
+        name="test",
+        kupo_url=stand_ins.kupo_url(server),
+        fsp_policy=stand_ins.FSP_POLICY,
+        validity_token=stand_ins.VALIDITY_TOKEN,
+        validator="",
+        feeds="",
+    )
+    fsp = kupo_helper.get_fsp_key(
+        target.fsp_policy, target.validity_token, target.kupo_url
+    )
+    policy_cache = cache_helper.PolicyCache(path=str(tmp_path / "policy.json"))
+    try:
+        async with kupo_helper.create_kupo_session() as session:
+            context = run_helper.RunContext(
+                run_helper.RunConfig(), session, policy_cache=policy_cache
+            )
+            for _ in range(2):
+                res = await pubwatch.get_on_chain_feed_data(context, "0", target)
+                assert len(res) == 2
+            # Cold: FSP datum fetched. Warm: policy checked alongside
+            # the feed data and FSP datum not fetched again.
+            assert server.app[stand_ins.REQUESTS]["matches"] == 4
+            assert server.app[stand_ins.REQUESTS]["datums"] == 10 + 1 + 10
+            assert policy_cache.peek(fsp) == stand_ins.FS_POLICY
+            policy_cache.put(fsp, "0@moved", "moved", "stale")
+            server.app[stand_ins.REQUESTS].clear()
+            res = await pubwatch.get_on_chain_feed_data(context, "0", target)
+            assert len(res) == 2
+            assert server.app[stand_ins.REQUESTS]["matches"] == 3
+            assert policy_cache.peek(fsp) == stand_ins.FS_POLICY
+    finally:
+        await server.close()
@@ -0,0 +1,52 @@
+"""Publication latency tracking tests."""
+
+# pylint: disable=E0401
+
+from src.pubwatch import latency_helper, metrics_helper, pubwatch, timing_helper
+from src.pubwatch.decode_helper import FeedObservation
+
+TIMEOUTS: dict = {"ADA-USD": 3720, "FACT-ADA": 3720}
+
+
+def test_requests_are_matched(tmp_path):
+    """Ensure requests are fulfilled by the first newer on-chain time
+    and flagged once they time out.
+    """
+    path = str(tmp_path / "latency.sqlite")
+    with latency_helper.LatencyTracker(path) as tracker:
+        tracker.record(["ADA-USD", "FACT-ADA"], 1000, TIMEOUTS, {"ADA-USD": 500})
+        assert tracker.observe({"ADA-USD": 500}, 1100) == ([], [])
+        assert tracker.observe({"ADA-USD": 1090}, 1200) == ([("ADA-USD", 90)], [])
+        assert tracker.observe({"ADA-USD": 1500}, 4720) == ([], ["FACT-ADA"])
+    with latency_helper.LatencyTracker(path) as tracker:
+        assert tracker.latencies() == {"ADA-USD": [90]}
+        assert tracker.unfulfilled() == [("FACT-ADA", 1000)]
+        assert not tracker.latencies(since=1001)
+
+
+def test_latency_is_exported(tmp_path):
+    """Ensure fulfilled requests are observed in a histogram per feed."""
+    metrics = metrics_helper.Metrics()
+    with latency_helper.LatencyTracker(str(tmp_path / "latency.sqlite")) as tracker:
+        tracker.record(["ADA-USD"], 1000, TIMEOUTS, {})
+        with timing_helper.timing(metrics):
+            pubwatch.track_latency(
+                tracker,
+                [FeedObservation("CER/ADA-USD/3", 1_045_000, 1, 1)],
+            )
+    assert list(metrics.observations["publication_latency"]["ADA-USD"]) == [45]
+    text = metrics.render()
+    assert (
+        'pubwatch_publication_latency_seconds_bucket{feed="ADA-USD",le="60"} 1' in text
+    )
+    assert "pubwatch_requests_fulfilled_total 1" in text
+
+
+def test_observations_are_bounded():
+    """Ensure only the most recent observations of a value are kept."""
+    timer = timing_helper.StageTimer()
+    for value in range(timing_helper.OBSERVATION_SAMPLES + 50):
+        timer.observe("publication_latency", "ADA-USD", value)
+    latencies = timer.observations["publication_latency"]["ADA-USD"]
+    assert len(latencies) == timing_helper.OBSERVATION_SAMPLES
+    assert latencies[-1] == timing_helper.OBSERVATION_SAMPLES + 49
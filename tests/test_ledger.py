@@ -0,0 +1,118 @@
+"""Pending request ledger tests."""
+
+# pylint: disable=E0401,R0903
+
+import tempfile
+import time
+import types
+
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import ledger_helper, pubwatch, run_helper
+from tests import helpers
+
+TTLS: dict = {"ADA-USD": 60, "FACT-ADA": 600}
+
+
+def test_pending_pairs_are_suppressed(tmp_path):
+    """Ensure pending pairs are only requested again once their
+    request expires or a newer datum is seen on-chain.
+    """
+    path = str(tmp_path / "pending.sqlite")
+    with ledger_helper.PendingLedger(path) as ledger:
+        assert ledger.claim(["ADA-USD", "FACT-ADA"], 1000, TTLS, {}) == [
+            "ADA-USD",
+            "FACT-ADA",
+        ]
+        assert not ledger.claim(["ADA-USD", "FACT-ADA"], 1030, TTLS, {})
+        assert ledger.claim(["ADA-USD", "FACT-ADA"], 1060, TTLS, {}) == ["ADA-USD"]
+        assert ledger.claim(["FACT-ADA"], 1100, TTLS, {"FACT-ADA": 1090}) == [
+            "FACT-ADA"
+        ]
+    with ledger_helper.PendingLedger(path) as ledger:
+        assert ledger.pending(1100) == ["ADA-USD", "FACT-ADA"]
+        ledger.release(["ADA-USD"])
+        assert ledger.claim(["ADA-USD"], 1100, TTLS, {}) == ["ADA-USD"]
+
+
+def test_get_ttl():
+    """Ensure requests remain pending for the interval plus the
+    threshold.
+    """
+    assert ledger_helper.get_ttl(3600, 120) == 3720
+    assert ledger_helper.get_ttl(60, 120) == 180
+
+
+@pytest.mark.asyncio
+async def test_repeated_runs_are_deduplicated(tmp_path, monkeypatch):
+    """Ensure a second run doesn't request feeds still pending from the
+    first.
+    """
+    _, requests = await helpers.run_pubwatch(
+        monkeypatch,
+        tmp_path,
+        stand_ins.KupoConfig(utxos=20, feeds=4),
+        repeat=2,
+        concurrency=5,
+    )
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_next_run_does_not_request_again(tmp_path, monkeypatch):
+    """Ensure feeds requested by a run but not yet published aren't
+    requested again by the next run an interval later, only once
+    their request has expired.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    clock = [time.time()]
+    monkeypatch.setattr(
+        pubwatch,
+        "time",
+        types.SimpleNamespace(time=lambda: clock[0], perf_counter=time.perf_counter),
+    )
+    kupo = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=20, feeds=4))
+    validator = stand_ins.FakeValidator()
+    helpers.use_stand_ins(monkeypatch, kupo, await validator.start())
+    feeds_file = stand_ins.write_feeds_file(
+        str(tmp_path / "cer-feeds.json"), stand_ins.feed_pairs(6)
+    )
+    start = clock[0]
+    requested = []
+    try:
+        # The next hourly run, then the first run after the requests
+        # of the first have expired.
+        for offset in (0, 3600, 3600 + pubwatch.INTERVAL_THRESHOLD + 1):
+            clock[0] = start + offset
+            result = await pubwatch.pubwatch(
+                run_helper.RunConfig(
+                    feeds_file=feeds_file, local=True, hour_boundary=False
+                )
+            )
+            requested.append(set(result["default"]))
+    finally:
+        await kupo.close()
+        await validator.close()
+    assert requested[0]
+    assert not requested[0] & requested[1]
+    assert requested[0] <= requested[2]
+
+
+@pytest.mark.asyncio
+async def test_failed_requests_are_released(tmp_path):
+    """Ensure pairs are released if the validator couldn't be reached."""
+
+    class Unreachable:
+        """Validator client that never gets a response."""
+
+        async def request_feeds(self, _):
+            """Return no response."""
+            return None
+
+    with ledger_helper.PendingLedger(str(tmp_path / "pending.sqlite")) as ledger:
+        pairs = await pubwatch.publish(
+            ["ADA-USD"], run_helper.RunConfig(local=True), Unreachable(), ledger, {}, []
+        )
+        assert pairs == ["ADA-USD"]
+        assert not ledger.pending(0)
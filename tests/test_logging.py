@@ -0,0 +1,75 @@
+"""Logging pipeline tests."""
+
+# pylint: disable=E0401
+
+import atexit
+import json
+import logging
+
+from src.pubwatch import log_helper
+
+
+def make_record(created: float, feed: str) -> logging.LogRecord:
+    """Return a per-feed record created at the given time."""
+    record = logging.LogRecord(
+        "pubwatch", logging.INFO, __file__, 1, "feed: '%s' out of date", (feed,), None
+    )
+    record.created = created
+    return record
+
+
+def test_repetitive_messages_are_rate_limited():
+    """Ensure a template is only let through `limit` times per period
+    and the number dropped is noted once the period has passed.
+    """
+    rate_limit = log_helper.RateLimitFilter(limit=3, period=60)
+    passed = [rate_limit.filter(make_record(1000, f"FEED-{i}")) for i in range(10)]
+    assert passed == [True] * 3 + [False] * 7
+    record = make_record(1060, "FEED-10")
+    assert rate_limit.filter(record)
+    assert record.getMessage() == (
+        "feed: 'FEED-10' out of date (7 similar messages suppressed)"
+    )
+    warning = make_record(1060, "FEED-11")
+    warning.levelno = logging.WARNING
+    assert all(rate_limit.filter(warning) for _ in range(10))
+
+
+def test_rate_limit_windows_are_evicted():
+    """Ensure the windows of templates no longer logged are dropped."""
+    rate_limit = log_helper.RateLimitFilter(limit=3, period=60)
+    for idx in range(100):
+        record = make_record(1000, "ADA-USD")
+        record.msg = f"template {idx}: %s"
+        rate_limit.filter(record)
+    assert len(rate_limit._windows) == 100  # pylint: disable=W0212
+    rate_limit.filter(make_record(1060, "ADA-USD"))
+    assert len(rate_limit._windows) == 1  # pylint: disable=W0212
+
+
+def test_sample():
+    """Ensure long lists are logged as a sample and a count."""
+    assert log_helper.sample(["A", "B"], 3) == "['A', 'B']"
+    assert log_helper.sample(range(5), 3) == "[0, 1, 2] and 2 more"
+
+
+def test_queued_json_logging(tmp_path):
+    """Ensure records are written by the background writer as JSON."""
+    log_file = str(tmp_path / "monitor.log")
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    listener = log_helper.setup_logging(log_file, json_format=True)
+    try:
+        logging.getLogger("pubwatch").info("feed: '%s' out of date", "ADA-USD")
+    finally:
+        atexit.unregister(listener.stop)
+        listener.stop()
+        for handler in root.handlers:
+            if handler not in handlers:
+                root.removeHandler(handler)
+        root.setLevel(level)
+    with open(log_file, "r", encoding="utf-8") as log:
+        entry = json.loads(log.readline())
+    assert entry["level"] == "INFO"
+    assert entry["message"] == "feed: 'ADA-USD' out of date"
+    assert entry["function"] == "test_queued_json_logging"
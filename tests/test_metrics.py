@@ -0,0 +1,83 @@
+"""Metrics exporter tests."""
+
+# pylint: disable=E0401
+
+import aiohttp
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import metrics_helper, timing_helper
+from tests import helpers
+
+
+def test_histogram_is_cumulative():
+    """Ensure histogram buckets are rendered cumulatively."""
+    histogram = metrics_helper.Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+    assert histogram.render("latency", 'stage="run"') == [
+        'latency_bucket{stage="run",le="0.1"} 1',
+        'latency_bucket{stage="run",le="1"} 3',
+        'latency_bucket{stage="run",le="+Inf"} 4',
+        'latency_sum{stage="run"} 6.05',
+        'latency_count{stage="run"} 4',
+    ]
+
+
+def test_render():
+    """Ensure Kupo requests, stages and counts are exported."""
+    metrics = metrics_helper.Metrics()
+    with timing_helper.timing(metrics):
+        with timing_helper.stage("kupo_datums"):
+            pass
+        with timing_helper.stage("decode"):
+            pass
+        timing_helper.count("datums_fetched", 3)
+        timing_helper.count("datums_fetched", 2)
+    text = metrics.render()
+    assert 'pubwatch_kupo_request_seconds_count{endpoint="datums"} 1' in text
+    assert 'pubwatch_stage_seconds_count{stage="decode"} 1' in text
+    assert "pubwatch_datums_fetched_total 5" in text
+    assert "pubwatch_last_run_timestamp_seconds" not in text
+
+
+def test_write_textfile(tmp_path):
+    """Ensure the textfile is replaced with the current metrics."""
+    path = tmp_path / "pubwatch.prom"
+    path.write_text("stale", encoding="utf-8")
+    metrics = metrics_helper.Metrics()
+    metrics.record("run", 0.2)
+    metrics.write_textfile(str(path))
+    text = path.read_text(encoding="utf-8")
+    assert 'pubwatch_stage_seconds_count{stage="run"} 1' in text
+    assert "pubwatch_last_run_timestamp_seconds" in text
+    assert [item.name for item in tmp_path.iterdir()] == ["pubwatch.prom"]
+
+
+@pytest.mark.asyncio
+async def test_run_metrics(tmp_path, monkeypatch, unused_tcp_port):
+    """Ensure a run is measured end-to-end and metrics are served."""
+    metrics = metrics_helper.Metrics()
+    await helpers.run_pubwatch(
+        monkeypatch,
+        tmp_path,
+        stand_ins.KupoConfig(utxos=30, feeds=6, resolve_hashes=False),
+        timer_factory=lambda: metrics,
+        concurrency=5,
+        datum_cache=False,
+        pending_ledger=False,
+    )
+    runner = await metrics_helper.start_server(metrics, "127.0.0.1", unused_tcp_port)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f"http://127.0.0.1:{unused_tcp_port}/metrics"
+            ) as resp:
+                text = await resp.text()
+    finally:
+        await runner.cleanup()
+    # Fact statement datum plus the FSP datum.
+    assert 'pubwatch_kupo_request_seconds_count{endpoint="datums"} 31' in text
+    assert 'pubwatch_stage_seconds_count{stage="validator"} 1' in text
+    assert "pubwatch_datums_fetched_total 30" in text
+    assert "pubwatch_feeds_requested_total" in text
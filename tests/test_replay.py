@@ -0,0 +1,82 @@
+"""Replay engine tests."""
+
+# pylint: disable=E0401
+
+import random
+import time
+
+import pytest
+
+from src.pubwatch import pubwatch, replay, state_helper
+from src.pubwatch.decode_helper import FeedObservation
+
+START: int = 1_700_000_000
+INTERVALS: dict = {"CER/ADA-USD": 3600, "CER/FACT-ADA": 7200, "CER/SNEK-ADA": 657}
+
+
+def generate_history(feeds: list, start: int, end: int, seed: int = 0) -> dict:
+    """Return on-chain times published at irregular intervals."""
+    rng = random.Random(seed)
+    history = {}
+    for feed in feeds:
+        times = []
+        now = start - rng.randint(0, 7200)
+        while now < end:
+            times.append(now)
+            now += rng.randint(300, 9000)
+        history[feed] = times
+    return history
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hour_boundary", [True, False])
+@pytest.mark.parametrize("threshold", [0, 120, 600])
+async def test_replay_matches_live_comparison(hour_boundary, threshold, monkeypatch):
+    """Ensure every replayed tick requests the same pairs a live run
+    would have.
+    """
+    end = START + 3 * 86400
+    history = generate_history(sorted(INTERVALS), START, end)
+    # Not published until after the replay starts.
+    history["CER/SNEK-ADA"] = [ts for ts in history["CER/SNEK-ADA"] if ts > START]
+    step = 1800
+    results = replay.replay(
+        history, INTERVALS, START, end, step, ((hour_boundary, threshold),)
+    )
+    assert len(results) == 1
+    result = results[0]
+    monkeypatch.setattr(pubwatch, "INTERVAL_THRESHOLD", threshold)
+    intervals = {
+        feed: interval if hour_boundary else interval - threshold
+        for feed, interval in INTERVALS.items()
+    }
+    replayed = dict(result.times)
+    for tick in range(START, end + 1, step):
+        feed_state = state_helper.FeedState.from_observations(
+            FeedObservation(f"{feed}/3", ts * 1000, 1, 1)
+            for feed, times in history.items()
+            for ts in times
+            if ts <= tick
+        )
+        monkeypatch.setattr(pubwatch.time, "time", lambda tick=tick: tick)
+        live = await pubwatch.get_pairs_to_request(intervals, feed_state, hour_boundary)
+        expected = sorted(f"CER/{pair}" for pair in live)
+        assert sorted(replayed.get(tick, [])) == expected
+    assert result.requests == sum(len(feeds) for feeds in replayed.values())
+    assert result.messages == len(replayed)
+
+
+def test_replay_a_year():
+    """Ensure a year of hourly ticks across many feeds replays in
+    seconds.
+    """
+    end = START + 365 * 86400
+    intervals = {f"CER/FEED{idx}-ADA": 3600 * (1 + idx % 3) for idx in range(50)}
+    history = generate_history(sorted(intervals), START, end)
+    started = time.perf_counter()
+    results = replay.replay(
+        history, intervals, START, end, modes=((True, 120), (False, 120))
+    )
+    assert time.perf_counter() - started < 10
+    assert all(result.ticks == 8761 for result in results)
+    assert all(result.requests for result in results)
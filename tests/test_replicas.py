@@ -0,0 +1,112 @@
+"""Kupo replica hedging and failover tests."""
+
+# pylint: disable=E0401
+
+import time
+
+import aiohttp
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import kupo_helper, replica_helper, timing_helper
+
+CONFIG: stand_ins.KupoConfig = stand_ins.KupoConfig(utxos=20, feeds=4)
+
+
+async def latest_feeds(kupo_url: str) -> int:
+    """Return the number of feeds retrieved through the given URL."""
+    async with kupo_helper.create_kupo_session() as session:
+        await kupo_helper.get_checkpoint(session, kupo_url)
+        res = await kupo_helper.get_latest_feed_data(
+            kupo_helper.Kupo(session, kupo_url), stand_ins.FS_POLICY
+        )
+    return len({item[0] for item in res})
+
+
+def test_split_urls():
+    """Ensure replicas are listed in order without trailing slashes."""
+    assert replica_helper.split_urls("http://a:1442/, http://b:1442") == [
+        "http://a:1442",
+        "http://b:1442",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failover():
+    """Ensure requests fail over from a replica that is down."""
+    live = await stand_ins.start_kupo(CONFIG)
+    kupo_url = f"http://127.0.0.1:1,{stand_ins.kupo_url(live)}"
+    try:
+        assert await latest_feeds(kupo_url) == 4
+    finally:
+        await live.close()
+    down, up = replica_helper.get_replicas(kupo_url).replicas
+    assert down.checkpoint is None and not down.available
+    assert up.checkpoint is not None
+
+
+@pytest.mark.asyncio
+async def test_slow_replica_is_hedged(monkeypatch):
+    """Ensure a request to a slow replica is also sent to another and
+    the first response is used.
+    """
+    monkeypatch.setattr(replica_helper, "HEDGE_DELAY", 0.05)
+    slow = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=20, latency=2))
+    fast = await stand_ins.start_kupo(CONFIG)
+    kupo_url = f"{stand_ins.kupo_url(slow)},{stand_ins.kupo_url(fast)}"
+    replicas = replica_helper.get_replicas(kupo_url)
+    # The slow replica is tried first until latencies are known.
+    replicas.replicas[0].checkpoint = replicas.replicas[1].checkpoint = 1
+    timer = timing_helper.StageTimer()
+    try:
+        async with kupo_helper.create_kupo_session() as session:
+            start = time.perf_counter()
+            with timing_helper.timing(timer):
+                matches = await kupo_helper.get_matches(
+                    session, kupo_url, f"/matches/*?policy_id={stand_ins.FSP_POLICY}"
+                )
+            elapsed = time.perf_counter() - start
+    finally:
+        await slow.close()
+        await fast.close()
+    assert matches[0]["datum"]
+    assert elapsed < 1
+    assert timer.counts["kupo_hedged"] == 1
+
+
+@pytest.mark.asyncio
+async def test_lagging_replica_is_not_used():
+    """Ensure a replica behind the most recent checkpoint isn't used."""
+    now = int(time.time())
+    behind = await stand_ins.start_kupo(CONFIG, now=now - 100)
+    current = await stand_ins.start_kupo(CONFIG, now=now)
+    kupo_url = f"{stand_ins.kupo_url(behind)},{stand_ins.kupo_url(current)}"
+    try:
+        assert await latest_feeds(kupo_url) == 4
+    finally:
+        await behind.close()
+        await current.close()
+    assert behind.app[stand_ins.REQUESTS]["matches"] == 0
+    assert behind.app[stand_ins.REQUESTS]["health"] == 1
+    assert current.app[stand_ins.REQUESTS]["matches"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_lag", [replica_helper.REPLICA_MAX_LAG, 0])
+async def test_failover_to_replica_one_slot_behind(max_lag):
+    """Ensure a request fails over to a replica one slot behind the
+    most recent checkpoint, whether or not it is within the lag allowed.
+    """
+    replicas = replica_helper.ReplicaSet(["http://a", "http://b"], max_lag=max_lag)
+
+    async def get_checkpoint(url: str) -> int:
+        return {"http://a": 1001, "http://b": 1000}[url]
+
+    async def fetch(url: str) -> str:
+        if url == "http://a":
+            raise aiohttp.ClientConnectionError("connection refused")
+        return url
+
+    assert await replicas.check_health(get_checkpoint) == 1001
+    assert await replicas.request(fetch, "matches") == "http://b"
+    assert not replicas.replicas[0].available
@@ -0,0 +1,86 @@
+"""Feed scheduler tests."""
+
+import random
+
+import pytest
+
+from src.pubwatch.pubwatch import get_delta, hour_baseline_delta
+from src.pubwatch.scheduler_helper import (
+    FeedScheduler,
+    direct_deadline,
+    hourly_deadline,
+)
+
+THRESHOLD: int = 120
+
+
+@pytest.mark.parametrize("window", [3600, 7200, 86400])
+def test_hourly_deadline_matches_comparison(window):
+    """Ensure the hourly deadline is the first second at which the
+    hourly comparison requires a feed.
+    """
+    rng = random.Random(window)
+    for _ in range(200):
+        latest = rng.randint(1723000000, 1724000000)
+        deadline = hourly_deadline(latest, window, THRESHOLD)
+        assert not hour_baseline_delta(deadline - 1, latest, window, THRESHOLD)
+        assert hour_baseline_delta(deadline, latest, window, THRESHOLD)
+
+
+def test_direct_deadline_matches_comparison():
+    """Ensure the direct deadline is the first second at which the
+    direct comparison requires a feed.
+    """
+    latest = 1723194003
+    window = 3480
+    deadline = direct_deadline(latest, window)
+    assert not window < get_delta(deadline - 1, latest)
+    assert window < get_delta(deadline, latest)
+
+
+def test_scheduler_orders_by_deadline():
+    """Ensure feeds are returned in deadline order and rescheduled
+    feeds use their latest deadline.
+    """
+    scheduler = FeedScheduler()
+    scheduler.schedule("CER/ADA-USD", 300)
+    scheduler.schedule("CER/ADA-EUR", 100)
+    scheduler.schedule("CER/FACT-ADA", 200)
+    scheduler.schedule("CER/ADA-EUR", 400)
+    assert scheduler.next_deadline() == 200
+    assert scheduler.pop_due(300) == ["CER/FACT-ADA", "CER/ADA-USD"]
+    assert scheduler.next_deadline() == 400
+    assert not scheduler.pop_due(399)
+    assert len(scheduler) == 1
+
+
+def test_scheduler_rebuild():
+    """Ensure missing feeds are due immediately and deferred once
+    requested.
+    """
+    scheduler = FeedScheduler()
+    intervals = {"CER/ADA-USD": 3480, "CER/BTN-ADA": 3480}
+    scheduler.rebuild(
+        {"CER/ADA-USD": 1000}, intervals, 2000, hour_boundary=False, threshold=120
+    )
+    assert scheduler.next_deadline() == 2000
+    assert scheduler.defer_due(2000, 120) == ["CER/BTN-ADA"]
+    assert scheduler.next_deadline() == 2120
+    assert scheduler.pop_due(5000) == ["CER/BTN-ADA", "CER/ADA-USD"]
+
+
+def test_deferral_survives_rebuild():
+    """Ensure requested feeds stay deferred when the queue is rebuilt
+    and are due again once the deferral expires.
+    """
+    scheduler = FeedScheduler()
+    intervals = {"CER/ADA-USD": 3480, "CER/BTN-ADA": 3480}
+    latest = {"CER/ADA-USD": 1000}
+    scheduler.rebuild(latest, intervals, 5000, hour_boundary=False, threshold=120)
+    assert scheduler.defer_due(5000, 120) == ["CER/ADA-USD", "CER/BTN-ADA"]
+    scheduler.rebuild(latest, intervals, 5060, hour_boundary=False, threshold=120)
+    assert scheduler.deferred(5060) == {"CER/BTN-ADA", "CER/ADA-USD"}
+    assert not scheduler.pop_due(5060)
+    scheduler.rebuild(latest, intervals, 5120, hour_boundary=False, threshold=120)
+    assert not scheduler.deferred(5120)
+    assert scheduler.pop_due(5120) == ["CER/ADA-USD", "CER/BTN-ADA"]
@@ -0,0 +1,102 @@
+"""Sharded multi-instance tests."""
+
+# pylint: disable=E0401
+
+import tempfile
+import time
+
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import pubwatch, run_helper, shard_helper
+from tests import helpers
+
+FEEDS: list = [f"CER/{pair}" for pair in stand_ins.feed_pairs(300)]
+
+
+def test_ring_moves_only_departed_feeds():
+    """Ensure feeds are spread across instances and only the feeds of
+    an instance that leaves are reassigned.
+    """
+    ring = shard_helper.HashRing(["a", "b", "c"])
+    owners = {feed: ring.owner(feed) for feed in FEEDS}
+    assert all(
+        list(owners.values()).count(member) > len(FEEDS) / 6
+        for member in ["a", "b", "c"]
+    )
+    smaller = shard_helper.HashRing(["a", "c"])
+    for feed, owner in owners.items():
+        if owner != "b":
+            assert smaller.owner(feed) == owner
+    assert ring.owner("cer/ada-usd") == ring.owner("CER/ADA-USD")
+    assert shard_helper.HashRing([]).owner("CER/ADA-USD") is None
+
+
+def test_expired_instances_are_reassigned(tmp_path):
+    """Ensure every feed is owned by exactly one instance and that the
+    feeds of an instance that disappears or leaves are reassigned.
+    """
+    with shard_helper.ShardCoordinator(
+        str(tmp_path), "a", lease=60
+    ) as first, shard_helper.ShardCoordinator(str(tmp_path), "b", lease=10) as second:
+        assert not first.heartbeat(1000)
+        assert second.heartbeat(1000)
+        assert first.heartbeat(1005)
+        feeds = dict.fromkeys(FEEDS, 0)
+        owned = [first.select(feeds), second.select(feeds)]
+        assert owned[0] and owned[1]
+        assert not set(owned[0]) & set(owned[1])
+        assert set(owned[0]) | set(owned[1]) == set(FEEDS)
+        # The second instance stops renewing its lease.
+        assert first.heartbeat(1020)
+        assert first.select(feeds) == feeds
+        # It rejoins, then the first instance leaves.
+        assert not second.heartbeat(1030)
+        first.leave()
+        assert second.heartbeat(1031)
+        assert second.select(feeds) == feeds
+
+
+@pytest.mark.asyncio
+async def test_instances_split_requests(tmp_path, monkeypatch):
+    """Ensure instances sharing a shard directory request disjoint
+    feeds that together are every feed an unsharded run requests.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    shard_dir = tmp_path / "shards"
+    shard_dir.mkdir()
+    kupo = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=60, feeds=20))
+    validator = stand_ins.FakeValidator()
+    validator_uri = await validator.start()
+    helpers.use_stand_ins(monkeypatch, kupo, validator_uri)
+    feeds_file = stand_ins.write_feeds_file(
+        str(tmp_path / "cer-feeds.json"), stand_ins.feed_pairs(24)
+    )
+    with shard_helper.ShardCoordinator(str(shard_dir), "b") as other:
+        other.heartbeat(int(time.time()))
+    try:
+        unsharded = await pubwatch.pubwatch(
+            run_helper.RunConfig(
+                feeds_file=feeds_file, local=True, nopublish=True, hour_boundary=False
+            )
+        )
+        requested = [
+            await pubwatch.pubwatch(
+                run_helper.RunConfig(
+                    feeds_file=feeds_file,
+                    local=True,
+                    hour_boundary=False,
+                    shard_dir=str(shard_dir),
+                    instance_id=instance_id,
+                )
+            )
+            for instance_id in ["a", "b"]
+        ]
+    finally:
+        await kupo.close()
+        await validator.close()
+    first, second = (set(result["default"]) for result in requested)
+    assert first and second
+    assert not first & second
+    assert first | second == set(unsharded["default"])
+    assert (shard_dir / "pubwatch_pending.sqlite").exists()
@@ -0,0 +1,22 @@
+"""Startup tests.
+
+pubwatch is run from cron so the cost of importing it is paid on every
+run. The time taken is measured by `benchmarks.startup`, these tests
+only check what importing it does.
+"""
+
+from benchmarks import startup
+
+# Packages that must only be imported by the code paths that need them.
+DEFERRED: tuple = ("aiohttp", "cbor2", "numpy", "pydantic", "websockets")
+
+
+def test_imports_are_deferred(tmp_path):
+    """Ensure importing pubwatch defers heavy imports and has no side
+    effects.
+    """
+    times = startup.import_times(str(tmp_path))
+    assert startup.MODULE in times
+    for package in DEFERRED:
+        assert package not in times
+    assert not list(tmp_path.iterdir())
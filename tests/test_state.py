@@ -0,0 +1,51 @@
+"""Feed state tests."""
+
+import pytest
+
+from src.pubwatch.pubwatch import remove_gaps
+from src.pubwatch.state_helper import FeedState
+
+from .test_main import ON_CHAIN_DATA, ON_CHAIN_EX
+
+
+def test_latest_observation_per_feed():
+    """Ensure the latest observation of each feed is indexed."""
+    state = FeedState.from_observations(ON_CHAIN_DATA)
+    assert len(state) == 16
+    assert "CER/ADA-IUSD" in state
+    assert state.latest["CER/ADA-DJED"].as_datum() == [
+        "CER/ADA-DJED/3",
+        1723194014750,
+        [345233, 1000000],
+    ]
+    assert state.latest_timestamps()["CER/IBTC-ADA"] == 1723194003
+
+
+def test_state_matches_legacy_collation():
+    """Ensure indexed timestamps match a naive walk of the data."""
+    expected = {}
+    for item in ON_CHAIN_EX:
+        feed = item[0].rsplit("/", 1)[0].upper()
+        expected[feed] = max(expected.get(feed, 0), int(item[1] / 1000))
+    assert FeedState.from_observations(ON_CHAIN_EX).latest_timestamps() == expected
+
+
+def test_gaps_and_without():
+    """Ensure gaps are reported and can be removed from the state."""
+    state = FeedState.from_observations(ON_CHAIN_DATA)
+    assert state.gaps(["CER/ADA-USD", "CER/BTN-ADA"]) == ["BTN-ADA"]
+    reduced = state.without(["ADA-USD", "ADA-IUSD"])
+    assert len(reduced) == len(state) - 2
+    assert "CER/ADA-USD" not in reduced
+
+
+@pytest.mark.asyncio
+async def test_remove_gaps_adjacent_items():
+    """Ensure adjacent items for the same feed are all removed."""
+    on_chain = [
+        ["CER/ADA-USD/3", 1723194014750, [345233, 1000000]],
+        ["CER/ADA-USD/3", 1723194014751, [345233, 1000000]],
+        ["CER/ADA-EUR/3", 1723194014750, [345233, 1000000]],
+    ]
+    res = await remove_gaps(gaps=["ADA-USD"], on_chain=on_chain)
+    assert res == [["CER/ADA-EUR/3", 1723194014750, [345233, 1000000]]]
@@ -0,0 +1,86 @@
+"""Streaming match ingestion tests."""
+
+# pylint: disable=E0401
+
+import json
+import tracemalloc
+
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import kupo_helper, state_helper, stream_helper
+
+ARRAYS: list = [
+    [],
+    [{"datum_hash": "abc", "datum": None, "created_at": {"slot_no": 1}}] * 20,
+    [123456, "é,]", 1.5e10, True, None, [1, [2]]],
+]
+
+
+async def chunked(data: bytes, size: int):
+    """Yield data in chunks of the given size."""
+    for idx in range(0, len(data), size):
+        yield data[idx : idx + size]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("size", [1, 3, 64, 4096])
+@pytest.mark.parametrize("indent", [None, 2])
+async def test_iter_json_array(size, indent):
+    """Ensure arrays are parsed identically whatever the chunking."""
+    for array in ARRAYS:
+        data = json.dumps(array, indent=indent).encode()
+        parsed = [
+            item async for item in stream_helper.iter_json_array(chunked(data, size))
+        ]
+        assert parsed == array
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data", [b'{"a": 1}', b"[1, 2", b"[1 2]", b"[1,]", b""])
+async def test_iter_json_array_invalid(data):
+    """Ensure malformed arrays are rejected."""
+    with pytest.raises(stream_helper.StreamError):
+        async for _ in stream_helper.iter_json_array(chunked(data, 2)):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_batched():
+    """Ensure items are batched with a smaller final batch."""
+    batches = [batch async for batch in stream_helper.batched(chunked(b"abcde", 1), 2)]
+    assert batches == [[b"a", b"b"], [b"c", b"d"], [b"e"]]
+
+
+async def peak_memory(utxos: int) -> int:
+    """Return the peak memory allocated while ingesting the given
+    number of matches into a feed state.
+    """
+    server = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=utxos, feeds=10))
+    feed_state = state_helper.FeedState({})
+    try:
+        async with kupo_helper.create_kupo_session() as session:
+            kupo = kupo_helper.Kupo(session, stand_ins.kupo_url(server))
+            tracemalloc.start()
+            async for observations in kupo_helper.stream_latest_feed_data(
+                kupo, stand_ins.FS_POLICY, batch_size=100
+            ):
+                feed_state.update(observations)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        await server.close()
+    assert len(feed_state) == 10
+    return peak
+
+
+@pytest.mark.asyncio
+async def test_memory_is_bounded():
+    """Ensure peak memory stays flat as the number of matches grows.
+
+    Memory is measured with tracemalloc rather than RSS as RSS also
+    depends on the allocator returning memory to the system.
+    """
+    small = await peak_memory(1000)
+    large = await peak_memory(10000)
+    assert large < small * 2
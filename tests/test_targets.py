@@ -0,0 +1,135 @@
+"""Multiple target tests."""
+
+# pylint: disable=E0401
+
+import json
+import tempfile
+
+import pydantic
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import pubwatch, run_helper, target_helper, validator_helper
+
+TARGET: dict = {
+    "name": "preprod",
+    "kupo_url": "http://localhost:1442",
+    "fsp_policy": stand_ins.FSP_POLICY,
+    "validity_token": stand_ins.VALIDITY_TOKEN,
+    "validator": "ws://localhost:8000/",
+    "feeds": "cer-feeds.json",
+}
+
+
+def write_targets_file(path, targets: list) -> str:
+    """Write a targets file."""
+    path.write_text(json.dumps({"targets": targets}), encoding="utf-8")
+    return str(path)
+
+
+def test_read_targets_file(tmp_path):
+    """Ensure targets are read and feeds resolved against the targets
+    file.
+    """
+    targets_file = write_targets_file(
+        tmp_path / "targets.json", [TARGET, {**TARGET, "name": "mainnet"}]
+    )
+    preprod, mainnet = target_helper.read_targets_file(targets_file)
+    assert preprod.feeds == str(tmp_path / "cer-feeds.json")
+    assert preprod.validation_request_uri == "ws://localhost:8000/validate_on_demand/"
+    assert mainnet.state_file("pubwatch_slotfile") == "pubwatch_slotfile_mainnet"
+    assert (
+        pubwatch.default_target().state_file("pubwatch_slotfile") == "pubwatch_slotfile"
+    )
+
+
+def test_invalid_targets_file(tmp_path):
+    """Ensure target names are unique and usable in file names."""
+    with pytest.raises(ValueError):
+        target_helper.read_targets_file(
+            write_targets_file(tmp_path / "targets.json", [TARGET, TARGET])
+        )
+    with pytest.raises(pydantic.ValidationError):
+        target_helper.read_targets_file(
+            write_targets_file(
+                tmp_path / "targets.json", [{**TARGET, "name": "../preprod"}]
+            )
+        )
+
+
+@pytest.mark.asyncio
+async def test_targets_are_isolated(tmp_path, monkeypatch):
+    """Ensure targets are monitored together and a failing target
+    doesn't affect the others.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    mainnet = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=20, feeds=4))
+    preprod = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=10, feeds=2))
+    validator = stand_ins.FakeValidator()
+    validator_uri = await validator.start()
+    feeds_file = stand_ins.write_feeds_file(
+        str(tmp_path / "cer-feeds.json"), stand_ins.feed_pairs(6)
+    )
+    base = {**TARGET, "validator": validator_uri, "feeds": feeds_file}
+    targets = [
+        target_helper.Target(
+            **{**base, "name": "mainnet", "kupo_url": stand_ins.kupo_url(mainnet)}
+        ),
+        target_helper.Target(
+            **{**base, "name": "preprod", "kupo_url": stand_ins.kupo_url(preprod)}
+        ),
+        target_helper.Target(
+            **{**base, "name": "offline", "kupo_url": "http://127.0.0.1:1"}
+        ),
+    ]
+    try:
+        results = await pubwatch.pubwatch(
+            run_helper.RunConfig(local=True, hour_boundary=False, datum_cache=False),
+            targets,
+        )
+    finally:
+        await mainnet.close()
+        await preprod.close()
+        await validator.close()
+    assert set(results["mainnet"]) >= set(stand_ins.feed_pairs(6)[4:])
+    assert set(results["preprod"]) >= set(stand_ins.feed_pairs(6)[2:])
+    assert isinstance(results["offline"], Exception)
+    assert validator.connections == 1
+    # Requests from targets sharing a validator may be coalesced.
+    requested = {pair for request in validator.requests for pair in request["feeds"]}
+    assert requested == set(results["mainnet"]) | set(results["preprod"])
+    assert (tmp_path / "pubwatch_slotfile_mainnet").exists()
+    assert (tmp_path / "pubwatch_slotfile_preprod").exists()
+
+
+@pytest.mark.asyncio
+async def test_invalid_validator_is_isolated(tmp_path, monkeypatch):
+    """Ensure a target with an invalid validator URI fails without
+    affecting the targets with a valid one.
+    """
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    kupo = await stand_ins.start_kupo(stand_ins.KupoConfig(utxos=20, feeds=4))
+    validator = stand_ins.FakeValidator()
+    validator_uri = await validator.start()
+    feeds_file = stand_ins.write_feeds_file(
+        str(tmp_path / "cer-feeds.json"), stand_ins.feed_pairs(6)
+    )
+    base = {**TARGET, "kupo_url": stand_ins.kupo_url(kupo), "feeds": feeds_file}
+    targets = [
+        target_helper.Target(**{**base, "name": "mainnet", "validator": validator_uri}),
+        target_helper.Target(
+            **{**base, "name": "misconfigured", "validator": "localhost:8000/"}
+        ),
+    ]
+    try:
+        results = await pubwatch.pubwatch(
+            run_helper.RunConfig(local=True, hour_boundary=False, datum_cache=False),
+            targets,
+        )
+    finally:
+        await kupo.close()
+        await validator.close()
+    assert set(results["mainnet"]) >= set(stand_ins.feed_pairs(6)[4:])
+    assert isinstance(results["misconfigured"], validator_helper.InvalidValidatorURI)
+    requested = {pair for request in validator.requests for pair in request["feeds"]}
+    assert requested == set(results["mainnet"])
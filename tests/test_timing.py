@@ -0,0 +1,45 @@
+"""Stage timing tests."""
+
+import pytest
+
+from benchmarks import stand_ins
+from src.pubwatch import timing_helper
+from tests import helpers
+
+
+def test_stage_without_timer():
+    """Ensure stages are a no-op outside of a timed context."""
+    assert timing_helper.get_timer() is None
+    with timing_helper.stage("slot"):
+        pass
+
+
+def test_stages_accumulate():
+    """Ensure repeated stages accumulate into the active timer."""
+    with timing_helper.timing(timing_helper.StageTimer()) as timer:
+        for _ in range(3):
+            with timing_helper.stage("decode"):
+                pass
+        assert timing_helper.get_timer() is timer
+    assert list(timer.stages) == ["decode"]
+    assert timing_helper.get_timer() is None
+
+
+@pytest.mark.asyncio
+async def test_run_is_timed_by_stage(tmp_path, monkeypatch):
+    """Ensure a full run against the stand-ins is timed by stage."""
+    runs, requests = await helpers.run_pubwatch(
+        monkeypatch,
+        tmp_path,
+        stand_ins.KupoConfig(utxos=30, feeds=6, resolve_hashes=True),
+        repeat=2,
+        concurrency=5,
+        pending_ledger=False,
+    )
+    (cold, cold_requests), (warm, _) = runs
+    for stage in ("run", "slot", "policy", "matches", "comparison", "publish"):
+        assert stage in cold.stages
+    assert cold_requests["matches"] == 2
+    assert "datums" not in cold_requests
+    assert warm.stages["decode"] <= cold.stages["decode"]
+    assert len(requests) == 2
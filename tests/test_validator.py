@@ -0,0 +1,136 @@
+"""Validator client tests.
+
+The validator is stood-in for by a local websocket server that echoes
+requests back as an acknowledgement.
+"""
+
+# pylint: disable=E0401
+
+import asyncio
+import http
+import json
+
+import pytest
+import websockets
+
+from src.pubwatch.validator_helper import (
+    ValidatorClient,
+    backoff_delay,
+    get_ssl_context,
+)
+
+
+async def serve_validator(reject_first: int = 0, respond: bool = True):
+    """Start a fake validator. The first `reject_first` connections are
+    refused during the handshake. Without `respond`, a connection is
+    closed without a response once a message is received.
+    """
+    state = {"connections": 0, "messages": 0}
+
+    async def process_request(*_):
+        state["connections"] += 1
+        if state["connections"] <= reject_first:
+            return http.HTTPStatus.SERVICE_UNAVAILABLE, [], b""
+        return None
+
+    async def handler(websocket, *_):
+        async for msg in websocket:
+            state["messages"] += 1
+            if not respond:
+                await websocket.close(code=1011)
+                return
+            await websocket.send(json.dumps({"ack": json.loads(msg)}))
+
+    server = await websockets.serve(
+        handler, "127.0.0.1", 0, process_request=process_request
+    )
+    port = server.sockets[0].getsockname()[1]
+    return server, f"ws://127.0.0.1:{port}/validate_on_demand/", state
+
+
+@pytest.mark.asyncio
+async def test_connection_is_reused():
+    """Ensure several requests share a single connection."""
+    server, uri, state = await serve_validator()
+    async with ValidatorClient(uri, local=True) as client:
+        for idx in range(3):
+            res = await client.request(json.dumps({"feeds": [f"FEED-{idx}"]}))
+            assert res == {"ack": {"feeds": [f"FEED-{idx}"]}}
+    assert client.connections == 1
+    assert state["connections"] == 1
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_requests_are_coalesced():
+    """Ensure feeds requested close together are sent as one message
+    and requested again once it has been sent.
+    """
+    server, uri, state = await serve_validator()
+    async with ValidatorClient(uri, local=True, coalesce_window=0.05) as client:
+        first, second = await asyncio.gather(
+            client.request_feeds(["ADA-USD", "FACT-ADA"]),
+            client.request_feeds(["FACT-ADA", "SNEK-ADA"]),
+        )
+        third = await client.request_feeds(["ADA-USD"])
+    assert first == second == {"ack": {"feeds": ["ADA-USD", "FACT-ADA", "SNEK-ADA"]}}
+    assert third == {"ack": {"feeds": ["ADA-USD"]}}
+    assert state["connections"] == 1
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_refused_connection_is_retried():
+    """Ensure requests are retried when the connection is refused."""
+    server, uri, state = await serve_validator(reject_first=2)
+    async with ValidatorClient(uri, local=True, backoff_base=0.01) as client:
+        res = await client.request(json.dumps({"feeds": ["ADA-USD"]}))
+    assert res == {"ack": {"feeds": ["ADA-USD"]}}
+    assert state["connections"] == 3
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_retries_are_bounded():
+    """Ensure we give up once the maximum number of retries is
+    reached.
+    """
+    server, uri, state = await serve_validator(reject_first=10)
+    async with ValidatorClient(
+        uri, local=True, max_retries=2, backoff_base=0.01
+    ) as client:
+        res = await client.request(json.dumps({"feeds": ["ADA-USD"]}))
+    assert res is None
+    assert state["connections"] == 3
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_sent_request_is_not_retried():
+    """Ensure a request isn't sent again if the connection is closed
+    after it was sent.
+    """
+    server, uri, state = await serve_validator(respond=False)
+    async with ValidatorClient(uri, local=True, backoff_base=0.01) as client:
+        res = await client.request(json.dumps({"feeds": ["ADA-USD"]}))
+    assert res is None
+    assert state["messages"] == 1
+    assert state["connections"] == 1
+    server.close()
+    await server.wait_closed()
+
+
+def test_backoff_delay():
+    """Ensure backoff grows exponentially up to the cap."""
+    for attempt in range(10):
+        delay = backoff_delay(attempt, base=1, cap=8)
+        assert 0 <= delay <= min(8, 2**attempt)
+
+
+def test_ssl_context_is_cached():
+    """Ensure the CA bundle is only parsed once."""
+    assert get_ssl_context() is get_ssl_context()